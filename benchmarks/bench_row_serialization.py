@@ -0,0 +1,93 @@
+"""
+Compares the CPU time and peak memory of turning pg8000 result rows
+into an ingestion file body with the original pandas round trip
+(DataFrame -> to_json -> json.loads -> json.dumps) and with to_json.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_row_serialization.py [rows]
+"""
+from src.ingestion_lambda.ingestion_lambda import rows_to_records, to_json
+from datetime import datetime as dt
+from datetime import timedelta
+from decimal import Decimal
+import json
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+COLUMNS = [
+    "sales_order_id",
+    "created_at",
+    "last_updated",
+    "design_id",
+    "staff_id",
+    "counterparty_id",
+    "units_sold",
+    "unit_price",
+    "currency_id",
+    "agreed_delivery_date",
+    "agreed_payment_date",
+    "agreed_delivery_location_id",
+]
+
+
+def make_rows(count):
+    start = dt(2022, 11, 3, 14, 20, 52, 186000)
+    return [
+        (
+            i,
+            start + timedelta(seconds=i),
+            start + timedelta(seconds=i),
+            i % 50,
+            i % 20,
+            i % 20,
+            i * 7 % 100000,
+            Decimal(f"{i % 400 / 100:.2f}"),
+            i % 3 + 1,
+            "2022-11-10",
+            "2022-11-03",
+            i % 30,
+        )
+        for i in range(count)
+    ]
+
+
+def pandas_round_trip(rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    records = json.loads(df.to_json(orient="records", date_format="iso"))
+    return json.dumps({"sales_order": records})
+
+
+def direct_serializer(rows):
+    return to_json({"sales_order": rows_to_records(rows, COLUMNS)})
+
+
+def measure(func, rows):
+    # time and trace separately, tracemalloc slows allocation down
+    start = time.process_time()
+    func(rows)
+    cpu = time.process_time() - start
+    tracemalloc.start()
+    func(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rows = make_rows(count)
+    per_million = 1_000_000 / count
+
+    print(f"{count} rows, figures scaled per million rows")
+    for name, func in [
+        ("pandas round trip", pandas_round_trip),
+        ("direct serializer", direct_serializer),
+    ]:
+        cpu, peak = measure(func, rows)
+        print(
+            f"{name:<18} cpu {cpu * per_million:7.2f}s  "
+            f"peak memory {peak * per_million / 2**20:8.1f} MiB"
+        )
@@ -0,0 +1,126 @@
+"""
+Compares the time the python and columnar transformation engines take
+to format the same decoded ingestion data with each format_ function.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_transform_engines.py [rows]
+"""
+from src.transformation_lambda.transformation_lambda import (
+    format_dim_counterparty,
+    format_dim_currency,
+    format_dim_date,
+    format_dim_design,
+    format_dim_location,
+    format_dim_staff,
+    format_fact_sales_order,
+    get_columnar_formatter,
+)
+from datetime import datetime as dt
+from datetime import timedelta
+from decimal import Decimal
+import logging
+import sys
+import time
+
+
+def make_tables(count):
+    start = dt(2022, 11, 3, 14, 20, 52, 186000)
+    return {
+        "address": [
+            {
+                "address_id": i,
+                "address_line_1": f"{i} Street",
+                "address_line_2": None,
+                "district": None,
+                "city": "City",
+                "postal_code": "12345",
+                "country": "Country",
+                "phone": "0123",
+            }
+            for i in range(count)
+        ],
+        "staff": [
+            {
+                "staff_id": i,
+                "first_name": "First",
+                "last_name": "Last",
+                "department_id": i % 8,
+                "email_address": "first.last@terrifictotes.com",
+            }
+            for i in range(count)
+        ],
+        "department": [
+            {
+                "department_id": i,
+                "department_name": f"Department {i}",
+                "location": "Leeds",
+            }
+            for i in range(8)
+        ],
+        "design": [
+            {
+                "design_id": i,
+                "design_name": "Wooden",
+                "file_location": "/usr",
+                "file_name": f"wooden-{i}.json",
+            }
+            for i in range(count)
+        ],
+        "currency": [
+            {"currency_id": i, "currency_code": ["GBP", "USD", "EUR"][i % 3]}
+            for i in range(count)
+        ],
+        "counterparty": [
+            {
+                "counterparty_id": i,
+                "counterparty_legal_name": f"Counterparty {i}",
+                "legal_address_id": count - 1 - i,
+            }
+            for i in range(count)
+        ],
+        "sales_order": [
+            {
+                "sales_order_id": i,
+                "created_at": start + timedelta(minutes=i),
+                "last_updated": start + timedelta(minutes=i),
+                "design_id": i % 50,
+                "staff_id": i % 20,
+                "counterparty_id": i % 20,
+                "units_sold": i * 7 % 100000,
+                "unit_price": Decimal(f"{i % 400 / 100:.2f}"),
+                "currency_id": i % 3 + 1,
+                "agreed_delivery_date": (start + timedelta(days=i % 900)).date(),  # noqa E501
+                "agreed_payment_date": (start + timedelta(days=i % 700)).date(),  # noqa E501
+                "agreed_delivery_location_id": i % 30,
+            }
+            for i in range(count)
+        ],
+    }
+
+
+def measure(func, data):
+    start = time.perf_counter()
+    func(data)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    tables = make_tables(count)
+    # keep log output out of the timings
+    logging.disable(logging.WARNING)
+
+    print(f"{count} rows per table, seconds")
+    print(f"{'formatter':<24} {'python':>8} {'columnar':>8}")
+    for formatter in [
+        format_dim_location,
+        format_dim_staff,
+        format_dim_design,
+        format_dim_currency,
+        format_dim_counterparty,
+        format_dim_date,
+        format_fact_sales_order,
+    ]:
+        python = measure(formatter, tables)
+        columnar = measure(get_columnar_formatter(formatter), tables)
+        print(f"{formatter.__name__:<24} {python:8.3f} {columnar:8.3f}")
@@ -0,0 +1,77 @@
+"""
+Compares the time format_fact_sales_order takes to drop repeated rows
+with a set of hashed row keys (unique_rows) and with the original scan
+of every row kept so far.
+
+One in ten sales orders is repeated. The scan is quadratic, so it is
+only run up to SCAN_LIMIT rows.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_unique_rows.py [rows ...]
+"""
+from src.transformation_lambda.transformation_lambda import (
+    format_fact_sales_order,
+    get_sales_order_row,
+)
+import sys
+import time
+
+SCAN_LIMIT = 20_000
+
+
+def make_sales_orders(count):
+    return {
+        "sales_order": [
+            {
+                "sales_order_id": i - i % 10 if i % 10 == 9 else i,
+                "created_at": "2022-11-03T14:20:52.186",
+                "last_updated": "2022-11-03T14:20:52.186",
+                "design_id": i % 50,
+                "staff_id": i % 20,
+                "counterparty_id": i % 20,
+                "units_sold": i * 7 % 100000,
+                "unit_price": 2.43,
+                "currency_id": i % 3 + 1,
+                "agreed_delivery_date": "2022-11-10",
+                "agreed_payment_date": "2022-11-03",
+                "agreed_delivery_location_id": i % 30,
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def scan_for_duplicates(sales_order_json):
+    sales_order_parquet = []
+    for sale in sales_order_json["sales_order"]:
+        row = get_sales_order_row(sale)
+        if row not in sales_order_parquet:
+            sales_order_parquet.append(row)
+    return sales_order_parquet
+
+
+def measure(func, data):
+    start = time.perf_counter()
+    result = func(data)
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+
+    print(f"{'rows':>9}  {'engine':<11} {'seconds':>8}  {'us/row':>7}")
+    for count in counts:
+        data = make_sales_orders(count)
+        hashed, expected = measure(format_fact_sales_order, data)
+        print(
+            f"{count:>9}  {'unique_rows':<11} {hashed:8.3f}  "
+            f"{hashed / count * 1e6:7.2f}"
+        )
+        if count > SCAN_LIMIT:
+            continue
+        scanned, result = measure(scan_for_duplicates, data)
+        assert result == expected
+        print(
+            f"{count:>9}  {'scan':<11} {scanned:8.3f}  "
+            f"{scanned / count * 1e6:7.2f}"
+        )
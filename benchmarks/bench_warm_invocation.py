@@ -0,0 +1,112 @@
+"""
+Compares the setup latency of a cold and a warm ingestion invocation:
+creating the S3 and Secrets Manager clients, fetching the database
+secret, reading last_update.txt and the watermarks, and opening the
+database connection.
+
+AWS is mocked with moto, so the figures show client construction and
+request handling rather than network round trips. The connection is
+only included when BENCH_DB_HOST, BENCH_DB_PORT, BENCH_DB_USER,
+BENCH_DB_PASSWORD and BENCH_DB_NAME are set, e.g. for the test
+database from test/docker-compose-prod-db.yaml.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_warm_invocation.py [invocations]
+"""
+from src.ingestion_lambda import ingestion_lambda
+from src.shared import connections
+from moto import mock_s3, mock_secretsmanager
+import boto3
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+BUCKET = "bench-ingestion-bucket"
+PLACEHOLDER_SECRET = {
+    "host": "localhost",
+    "port": 5432,
+    "user": "user",
+    "password": "password",
+    "database": "database",
+}
+
+
+def get_database_secret():
+    keys = ["HOST", "PORT", "USER", "PASSWORD", "NAME"]
+    if not all(f"BENCH_DB_{key}" in os.environ for key in keys):
+        return None
+    return {
+        "host": os.environ["BENCH_DB_HOST"],
+        "port": int(os.environ["BENCH_DB_PORT"]),
+        "user": os.environ["BENCH_DB_USER"],
+        "password": os.environ["BENCH_DB_PASSWORD"],
+        "database": os.environ["BENCH_DB_NAME"],
+    }
+
+
+def invocation_setup(with_connection):
+    credentials = ingestion_lambda.get_credentials("production")
+    if with_connection:
+        ingestion_lambda.get_reusable_connection(credentials).close()
+    ingestion_lambda.get_last_upload(BUCKET)
+    ingestion_lambda.get_watermarks(BUCKET)
+
+
+def reset_runtime():
+    runtime = connections._runtime
+    runtime["clients"].clear()
+    runtime["secrets"].clear()
+    if runtime["connection"] is not None:
+        runtime["connection"][1].close()
+        runtime["connection"] = None
+
+
+def measure(invocations, cold, with_connection):
+    timings = []
+    reset_runtime()
+    for _ in range(invocations):
+        if cold:
+            reset_runtime()
+        start = time.perf_counter()
+        invocation_setup(with_connection)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    invocations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    logging.getLogger("ingestion_lambda").setLevel(logging.WARNING)
+    logging.getLogger("connections").setLevel(logging.WARNING)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+    secret = get_database_secret()
+
+    with mock_s3(), mock_secretsmanager():
+        boto3.client("secretsmanager", region_name="eu-west-2").create_secret(
+            Name="production",
+            SecretString=json.dumps(secret or PLACEHOLDER_SECRET),
+        )
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        s3.put_object(
+            Bucket=BUCKET, Key="last_update.txt", Body="2023:11:02:10:11:12"
+        )
+
+        print(
+            f"{invocations} invocations, connection "
+            f"{'included' if secret else 'not included'}"
+        )
+        for name, cold in [("cold", True), ("warm", False)]:
+            timings = measure(invocations, cold, secret is not None)
+            print(
+                f"{name:<5} median {statistics.median(timings) * 1000:7.2f}ms"
+                f"  p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:7.2f}ms"  # noqa E501
+            )
+        reset_runtime()
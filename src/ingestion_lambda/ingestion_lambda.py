@@ -1,15 +1,91 @@
-import boto3
+import argparse
+import hashlib
+import io
 import logging
 import json
-import pandas as pd
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as dt_date
 from datetime import datetime as dt
+from datetime import timedelta
+from decimal import Decimal
+from queue import Queue
+from time import monotonic
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
-from pg8000 import Connection, DatabaseError, InterfaceError
+from pg8000.native import literal
+from src.shared.connections import (
+    get_client,
+    get_connection,
+    get_credentials,
+    get_reusable_connection,
+)
+from src.shared.metrics import emit_metrics, record_metric, timed
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 logging.basicConfig()
 logger = logging.getLogger("ingestion_lambda")
 logger.setLevel(logging.INFO)
 
+STREAM_BATCH_SIZE = 10000
+MAX_CONNECTIONS = 4
+COPY_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_WORKERS = 8
+# bodies from this size are sent as parallel multipart uploads
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+KEYSET_PAGE_SIZE = 50000
+CHECKPOINTS_PREFIX = "state/checkpoints"
+MANIFESTS_PREFIX = "state/manifests"
+RUNS_PREFIX = "state/runs"
+LATEST_MANIFEST_KEY = "state/latest_manifest.json"
+BACKFILL_PREFIX = "state/backfill"
+BACKFILL_SLICE_DAYS = 30
+CDC_SLOT_NAME = "ingestion_slot"
+CDC_MAX_CHANGES = 100000
+WATERMARKS_KEY = "state/watermarks.json"
+# seconds kept back from the Lambda timeout to save files and state
+TIME_BUDGET_MARGIN = 60
+LOOKUP_TABLES = ["department", "all_addresses"]
+SNAPSHOTS_PREFIX = "state/snapshots"
+COMPRESSION_CODECS = ["none", "gzip", "zstd"]
+FILE_FORMATS = ["json", "ndjson", "parquet"]
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+# parquet column compression used for each INGESTION_COMPRESSION codec
+PARQUET_COMPRESSION = {"none": "snappy", "gzip": "gzip", "zstd": "zstd"}
+# lookup tables mapped to the member name their snapshots are saved under
+SNAPSHOT_LOOKUPS = {"department": "department", "all_addresses": "address"}
+
+# test_decoding output, e.g. "table public.staff: INSERT: staff_id[integer]:1"
+# DOTALL so text values holding newlines stay part of the change
+CHANGE_PATTERN = re.compile(
+    r"^table public\.(\w+): (INSERT|UPDATE|DELETE): (.*)$", re.DOTALL
+)  # noqa E501
+# lines without row data: transaction boundaries and other schemas
+SKIPPED_CHANGE_PATTERN = re.compile(r"^(BEGIN|COMMIT)\b|^table (?!public\.)")
+COLUMN_PATTERN = re.compile(
+    r"(\w+)\[([^\]]+(?:\[\])*)\]:('(?:[^']|'')*'|\S+)"
+)  # noqa E501
+
+# column names and types of the public tables, kept across warm invocations
+_catalog = {"fingerprint": None, "columns": {}, "types": {}, "keys": None}
+
+# (bucket, key) of lookup snapshots known to exist, snapshots never change
+_snapshots = set()
+
 
 def lambda_handler(event, context):
     """
@@ -33,119 +109,225 @@ def lambda_handler(event, context):
     """
     invocation_time = dt.now()
     bucket_name = event["data_bucket_name"]
+    deadline = get_deadline(context)
 
     try:
         credentials = get_credentials("production")
 
-        connection = get_connection(credentials)
+        connection = get_reusable_connection(credentials)
 
         last_upload = get_last_upload(bucket_name)
 
-        json_data = get_data(connection, last_upload)
+        watermarks, row_counts = get_watermark_state(bucket_name)
+
+        if "backfill" in event:
+            options = event["backfill"]
+            end = options.get("end")
+            max_connections = int(
+                os.environ.get("INGESTION_MAX_CONNECTIONS", MAX_CONNECTIONS)
+            )  # noqa E501
+            saved_files = backfill(
+                connection,
+                credentials,
+                bucket_name,
+                dt.fromisoformat(options["start"]),
+                dt.fromisoformat(end) if end else None,
+                int(options.get("slice_days", BACKFILL_SLICE_DAYS)),
+                max_connections,
+                deadline,
+            )
+            logger.info(f"Backfill saved {len(saved_files)} files.")
+            return
+
+        if os.environ.get("INGESTION_MODE") == "stream":
+            batch_size = int(
+                os.environ.get("INGESTION_BATCH_SIZE", STREAM_BATCH_SIZE)
+            )  # noqa E501
+            saved_files = stream_data(
+                connection,
+                bucket_name,
+                last_upload,
+                invocation_time,
+                batch_size,
+                watermarks,
+                deadline,
+                row_counts,
+            )
+            if not saved_files:
+                logger.info("No new updates to write to file")
+            return
+
+        if os.environ.get("INGESTION_MODE") == "copy":
+            saved_files = copy_data(
+                connection,
+                bucket_name,
+                last_upload,
+                invocation_time,
+                watermarks,
+                row_counts,
+                deadline,
+            )
+            if not saved_files:
+                logger.info("No new updates to write to file")
+            return
+
+        if os.environ.get("INGESTION_MODE") == "keyset":
+            page_size = int(
+                os.environ.get("INGESTION_PAGE_SIZE", KEYSET_PAGE_SIZE)
+            )  # noqa E501
+            saved_files = page_data(
+                connection,
+                bucket_name,
+                last_upload,
+                invocation_time,
+                page_size,
+                watermarks,
+                deadline,
+                row_counts,
+            )
+            if not saved_files:
+                logger.info("No new updates to write to file")
+            return
+
+        if os.environ.get("INGESTION_MODE") == "cdc":
+            saved_files = ingest_changes(
+                connection,
+                bucket_name,
+                invocation_time,
+                os.environ.get("INGESTION_CDC_SLOT", CDC_SLOT_NAME),
+                deadline=deadline,
+            )
+            if not saved_files:
+                logger.info("No new updates to write to file")
+            return
+
+        saved_counts = row_counts
+        changed_tables, row_counts = get_changed_tables(
+            connection, last_upload, watermarks, saved_counts
+        )
+        if not changed_tables:
+            logger.info("No new updates to write to file")
+            return
+
+        if os.environ.get("INGESTION_MODE") == "parallel":
+            max_connections = int(
+                os.environ.get("INGESTION_MAX_CONNECTIONS", MAX_CONNECTIONS)
+            )  # noqa E501
+            json_data = get_data_concurrently(
+                connection,
+                credentials,
+                last_upload,
+                max_connections,
+                watermarks,
+                changed_tables,
+                deadline,
+                row_counts,
+            )
+        else:
+            json_data = get_data(
+                connection,
+                last_upload,
+                watermarks,
+                changed_tables,
+                deadline,
+                row_counts,
+            )
+        # tables held back by the deadline keep their saved counts
+        row_counts = {**saved_counts, **row_counts}
 
         if json_data != {}:
-            write_file(bucket_name, json_data, invocation_time)
+            write_file(
+                bucket_name,
+                json_data,
+                invocation_time,
+                watermarks,
+                row_counts=row_counts,
+                since=last_upload,
+            )
         else:
+            # row counts changed without any row to extract
+            write_watermarks(
+                get_client("s3"), bucket_name, watermarks, row_counts
+            )  # noqa E501
             logger.info("No new updates to write to file")
     except Exception as e:
         logger.error(e)
+    finally:
+        emit_metrics("ingestion")
 
 
-def get_credentials(secret_name):
+def get_deadline(context, margin=TIME_BUDGET_MARGIN):
     """
-    Gets credentials from the AWS Secrets Manager.
+    Gets the time by which extraction has to stop for the invocation
+    to save its files and state before the Lambda times out.
 
     Parameters
     ----------
-    secret_name : str
-        The name of the database credentials
-        secret the lambda is trying to connect to.
-        Options:
-        - "production"
-        - "warehouse"
-
-    Raises
-    ------
-    ClientError
-        If the secret name is not found in the Secrets Manager.
-        If there is an unexpected error connecting to the Secrets Manager.
-    KeyError
-        If the credentials object has a missing key.
+    context : LambdaContext
+        The runtime information of the Lambda function.
+    margin : int, optional
+        Seconds kept back from the remaining time.
 
     Returns
     -------
-    dict
-        A dictionary containing the database connection credentials.
-        Keys: host, port, user, password, database
+    float or None
+        The deadline on the time.monotonic clock,
+        or None if the context has no remaining time.
     """
-
-    try:
-        client = boto3.client("secretsmanager", region_name="eu-west-2")
-        response = client.get_secret_value(SecretId=secret_name)
-        secret = json.loads(response["SecretString"])
-
-        connection_params = {
-            "host": secret["host"],
-            "port": secret["port"],
-            "user": secret["user"],
-            "password": secret["password"],
-            "database": secret["database"],
-        }
-        logger.info("connection parameters returned")
-        return connection_params
-
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceNotFoundException":
-            logger.error(f"Secret {secret_name} does not exist.")
-        else:
-            logger.error(f"Error accessing database secret {secret_name}: {e}")
-    except KeyError as e:
-        logger.error(f"Missing key {e} in database credentials.")
+    if not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    return monotonic() + context.get_remaining_time_in_millis() / 1000 - margin
 
 
-def get_connection(database_credentials):
+def is_past(deadline):
     """
-    Gets connections to the OLTP database.
+    Checks whether a deadline from get_deadline has passed.
 
     Parameters
     ----------
-    database_credentials : dict
-        Database connection credentials containing
-        user, host, database, port, password.
-
-    Raises
-    ------
-    DatabaseError
-        If there is an error connecting to the database.
-    InterfaceError
-        If there is an interface error.
+    deadline : float or None
+        The deadline, None for no deadline.
 
     Returns
     -------
-    Connection
-        A successful pg8000 connection object.
+    bool
+        True if the deadline has passed.
     """
-    try:
-        user = database_credentials["user"]
-        host = database_credentials["host"]
-        database = database_credentials["database"]
-        port = database_credentials["port"]
-        password = database_credentials["password"]
-        conn = Connection(user, host, database, port, password, timeout=5)
-        logger.info("Connection to database has been established.")
-        return conn
-    except DatabaseError as db:
-        logger.error(f"pg8000 - an error has occurred: {db.args[0]['M']}")
-        raise db
-    except InterfaceError as ie:
-        logger.error(f'pg8000 - an error has occurred: \n"{ie}"')
-        raise ie
-    except Exception as exc:
-        logger.error(
-            "An error has occurred when \
-            attempting to connect to the database."
-        )
-        raise exc
+    return deadline is not None and monotonic() >= deadline
+
+
+def hold_watermarks(watermarks, tables, last_upload, row_counts=None):
+    """
+    Keeps the tables left for the next run at their current watermark.
+
+    Tables without a watermark are extracted since last_upload, which
+    moves on once any file is saved. Giving them a watermark at
+    last_upload makes the next run resume them from where this one
+    started. Lookup tables are always read in full and are skipped.
+
+    The precheck counts of the tables are dropped as well, so their
+    previously saved counts are kept and a change seen only in the
+    row count is still found by the next precheck.
+
+    Parameters
+    ----------
+    watermarks : dict
+        Table names mapped to datetime watermarks, updated in place.
+    tables : list
+        Tables not extracted by this run.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    row_counts : dict, optional
+        Row counts from get_changed_tables, updated in place.
+    """
+    for table in tables:
+        if table not in LOOKUP_TABLES:
+            watermarks.setdefault(table, last_upload)
+            if row_counts is not None:
+                row_counts.pop(table, None)
+    logger.info(
+        f"Time budget reached, {len(tables)} tables left for the next run."
+    )  # noqa E501
 
 
 def get_last_upload(bucket_name):
@@ -170,7 +352,7 @@ def get_last_upload(bucket_name):
     datetime.datetime
         A datetime object representing the last updated timestamp.
     """
-    client = boto3.client("s3")
+    client = get_client("s3")
 
     try:
         response = client.get_object(Bucket=bucket_name, Key="last_update.txt")
@@ -190,7 +372,162 @@ def get_last_upload(bucket_name):
         logger.error(f"An unexpected error occurred {e}")
 
 
-def get_data(conn, last_upload):
+def get_watermark_state(bucket_name):
+    """
+    Retrieves the per-table watermarks and row counts
+    from the S3 bucket in a single read.
+
+    A watermark is the latest last_updated value
+    extracted from a table, in database time.
+
+    Parameters
+    ----------
+    bucket_name : str
+        The name of the S3 bucket.
+
+    Raises
+    ------
+    ClientError
+        If there is an issue accessing the S3 bucket.
+
+    Returns
+    -------
+    tuple
+        Table names mapped to datetime watermarks, and table names
+        mapped to their row count at the last precheck. Both are
+        empty if nothing has been saved yet.
+    """
+    client = get_client("s3")
+
+    try:
+        response = client.get_object(Bucket=bucket_name, Key=WATERMARKS_KEY)
+        content = json.loads(response["Body"].read())
+        watermarks = {
+            table: dt.fromisoformat(state["last_updated"])
+            for table, state in content.items()
+            if "last_updated" in state
+        }
+        row_counts = {
+            table: state["rows"]
+            for table, state in content.items()
+            if "rows" in state
+        }
+        logger.info("per-table watermarks returned")
+        return watermarks, row_counts
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            logger.info("no per-table watermarks found")
+            return {}, {}
+        logger.error(e.response["Error"]["Message"])
+        raise e
+
+
+def get_watermarks(bucket_name):
+    """
+    Retrieves the per-table watermarks from the S3 bucket.
+
+    Parameters
+    ----------
+    bucket_name : str
+        The name of the S3 bucket.
+
+    Returns
+    -------
+    dict
+        Table names mapped to datetime watermarks.
+        Empty if no watermarks have been saved yet.
+    """
+    return get_watermark_state(bucket_name)[0]
+
+
+def get_row_counts(bucket_name):
+    """
+    Retrieves the row counts saved alongside the per-table watermarks.
+
+    Parameters
+    ----------
+    bucket_name : str
+        The name of the S3 bucket.
+
+    Returns
+    -------
+    dict
+        Table names mapped to their row count at the last precheck.
+        Empty if no row counts have been saved yet.
+    """
+    return get_watermark_state(bucket_name)[1]
+
+
+def update_watermark(watermarks, table, records):
+    """
+    Advances a table's watermark to the latest
+    last_updated value among its extracted records.
+
+    Department and all_addresses are always read in full
+    and do not keep a watermark.
+
+    Parameters
+    ----------
+    watermarks : dict
+        Table names mapped to datetime watermarks, updated in place.
+    table : str
+        Table name.
+    records : list
+        Records extracted from the table.
+    """
+    if table in ["department", "all_addresses"]:
+        return
+    latest = max(
+        (
+            record["last_updated"]
+            for record in records
+            if record.get("last_updated") is not None
+        ),
+        default=None,
+    )
+    if latest is not None and (
+        table not in watermarks or latest > watermarks[table]
+    ):  # noqa E501
+        watermarks[table] = latest
+
+
+def write_watermarks(client, bucket_name, watermarks, row_counts=None):
+    """
+    Saves the per-table watermarks to the S3 bucket.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    watermarks : dict
+        Table names mapped to datetime watermarks.
+    row_counts : dict, optional
+        Table names mapped to row counts from get_changed_tables,
+        saved alongside the watermarks.
+    """
+    content = {
+        table: {"last_updated": watermark.isoformat()}
+        for table, watermark in watermarks.items()
+    }
+    for table, rows in (row_counts or {}).items():
+        content.setdefault(table, {})["rows"] = rows
+    response = client.put_object(
+        Body=json.dumps(content), Bucket=bucket_name, Key=WATERMARKS_KEY
+    )
+    if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
+        logger.info(f"Success. {WATERMARKS_KEY} overwritten")
+
+
+def get_data(
+    conn,
+    last_upload,
+    watermarks=None,
+    tables=None,
+    deadline=None,
+    row_counts=None,
+):
     """
     Gets data from the connected database since last_upload.
 
@@ -200,6 +537,17 @@ def get_data(conn, last_upload):
         Database connection instance (pg8000 connect object).
     last_upload : datetime.datetime
         The timestamp of the last fetched data file.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+    tables : list, optional
+        Tables to extract, as returned by get_changed_tables.
+        The lookup tables are always extracted. Defaults to all tables.
+    deadline : float, optional
+        Deadline from get_deadline. Tables not started by then are
+        left for the next run, see hold_watermarks.
+    row_counts : dict, optional
+        Row counts from get_changed_tables. Those of the tables
+        left for the next run are removed, see hold_watermarks.
 
     Returns
     -------
@@ -208,66 +556,111 @@ def get_data(conn, last_upload):
     """
     try:
         updated_content = {}
-        table_names = conn.run(
-            """
-                            SELECT table_name
-                            FROM information_schema.tables
-                            WHERE table_schema = 'public';
-                            """
-        )
-        list_table_names = list(table_names)
-        list_table_names.append(["all_addresses"])
-        list_table_names.remove(["_prisma_migrations"])
-        for table in list_table_names:
-            if table[0] == "department":
-                content = conn.run(
-                    f"""
-                                    SELECT * FROM {table[0]}
-                                    """
-                )
-            elif table[0] == "all_addresses":
-                content = conn.run(
-                    """
-                                    SELECT * FROM address
-                                    """
-                )
-            # get updated content from other tables
-            else:
-                content = conn.run(
-                    f"""
-                                    SELECT * FROM {table[0]}
-                                    WHERE (last_updated > :date)
-                                    """,
-                    date={last_upload.strftime("%Y-%m-%dT%H:%M:%S")},
-                )
+        held = []
+        for table in select_tables(get_table_names(conn), tables):
+            if table not in LOOKUP_TABLES and is_past(deadline):
+                held.append(table)
+                continue
+            sql, params = get_table_query(table, last_upload, watermarks)
+            with timed("QueryLatency", Table=table):
+                content = conn.run(sql, **params)
+            column_names = get_table_columns(conn, table)
+            records = rows_to_records(content, column_names)
+            record_metric("RowsExtracted", len(records), Table=table)
+            # empty lookups still get a snapshot for staff and counterparty
+            if len(records) != 0 or table in LOOKUP_TABLES:
+                updated_content[table] = records
+        conn.close()
+        if held and watermarks is not None:
+            hold_watermarks(watermarks, held, last_upload, row_counts)
+        if list(updated_content.keys()) == ["department", "all_addresses"]:
+            updated_content = {}
 
-            # get all column names from the table
-            if table[0] == "all_addresses":
-                columns = conn.run(
-                    """
-                                    SELECT column_name
-                                    FROM information_schema.columns
-                                    WHERE table_schema='public'
-                                    AND table_name= 'address'
-                                    """
-                )
-            else:
-                columns = conn.run(
-                    f"""
-                                    SELECT column_name
-                                    FROM information_schema.columns
-                                    WHERE table_schema='public'
-                                    AND table_name= '{table[0]}'
-                                    """
+        logger.info("Updated JSON content has been retrieved.")
+        return updated_content
+    except Exception as exc:
+        logger.error(exc)
+        raise exc
+
+
+def get_data_concurrently(
+    conn,
+    database_credentials,
+    last_upload,
+    max_connections=MAX_CONNECTIONS,
+    watermarks=None,
+    tables=None,
+    deadline=None,
+    row_counts=None,
+):
+    """
+    Gets data from the connected database since last_upload,
+    querying the tables in parallel.
+
+    Tables are extracted by a thread pool sharing a bounded pool
+    of connections, so total extraction time is close to that of
+    the slowest table while the database never serves more than
+    max_connections queries from this lambda at once.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object),
+        used as the first connection of the pool.
+    database_credentials : dict
+        Database connection credentials used to open
+        the remaining connections of the pool.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    max_connections : int, optional
+        Maximum number of concurrent connections and queries.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+    tables : list, optional
+        Tables to extract, as returned by get_changed_tables.
+        The lookup tables are always extracted. Defaults to all tables.
+    deadline : float, optional
+        Deadline from get_deadline. Tables not started by then are
+        left for the next run, see hold_watermarks.
+    row_counts : dict, optional
+        Row counts from get_changed_tables. Those of the tables
+        left for the next run are removed, see hold_watermarks.
+
+    Returns
+    -------
+    dict
+        JSON-formatted updated content.
+    """
+    pool = Queue()
+    pool.put(conn)
+    try:
+        table_names = select_tables(get_table_names(conn), tables)
+        pool_size = max(1, min(max_connections, len(table_names)))
+        for _ in range(pool_size - 1):
+            pool.put(get_connection(database_credentials))
+
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            results = list(
+                executor.map(
+                    lambda table: get_table_records(
+                        pool, table, last_upload, watermarks, deadline
+                    ),
+                    table_names,
                 )
-            column_names = [name[0] for name in columns]
-            # integrate column names and conn to the dataframe
-            df = pd.DataFrame(content, columns=column_names)
-            json_formatted = df.to_json(orient="records", date_format="iso")
-            back_to_list = json.loads(json_formatted)
-            if len(back_to_list) != 0:
-                updated_content[table[0]] = back_to_list
-        conn.close()
+            )
+        updated_content = {
+            table: records
+            for table, records in zip(table_names, results)
+            if records or (records is not None and table in LOOKUP_TABLES)
+        }
+        held = [
+            table
+            for table, records in zip(table_names, results)
+            if records is None
+        ]
+        if held and watermarks is not None:
+            hold_watermarks(watermarks, held, last_upload, row_counts)
+
         if list(updated_content.keys()) == ["department", "all_addresses"]:
             updated_content = {}
 
@@ -276,117 +669,2881 @@ def get_data(conn, last_upload):
     except Exception as exc:
         logger.error(exc)
         raise exc
+    finally:
+        while not pool.empty():
+            pool.get().close()
 
 
-def write_file(bucket_name, json_data, timestamp=dt(2020, 1, 1, 0, 0, 0)):
+def select_tables(table_names, tables=None):
     """
-    Handles creation of a new data file in the S3 bucket.
+    Restricts table names to the given tables and the lookup tables.
 
-    Saves the JSON file with a timestamp
-    to organize the structure of S3 buckets.
-    Overwrites a last_updated file with the
-    time the handler was invoked.
+    Parameters
+    ----------
+    table_names : list
+        Table names as returned by get_table_names.
+    tables : list, optional
+        Tables to keep. All tables are kept if not given.
+
+    Returns
+    -------
+    list
+        Table names in extraction order.
+    """
+    if tables is None:
+        return table_names
+    return [
+        table
+        for table in table_names
+        if table in tables or table in LOOKUP_TABLES
+    ]
+
+
+def get_changed_tables(conn, last_upload, watermarks, row_counts):
+    """
+    Finds the tables changed since they were last extracted.
+
+    The latest last_updated value and row count of every table are
+    read in a single UNION ALL query. A table has changed if its latest
+    last_updated value is past its watermark (or last_upload), or if
+    its row count differs from the one saved at the previous precheck.
+    Tables without a last_updated column are always treated as changed.
 
     Parameters
     ----------
-    bucket_name : str
-        S3 bucket name.
-    json_data : dict
-        JSON data from the get_data utility (string).
-    timestamp : datetime.datetime, optional
-        Datetime object timestamp from the lambda handler when it is invoked.
-        Default is January 1, 2020, 00:00:00.
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    watermarks : dict
+        Per-table watermarks taking precedence over last_upload.
+    row_counts : dict
+        Row counts saved at the previous precheck.
 
-    Raises
-    ------
-    ClientError
-        Issue occurred regarding putting an object into the S3 bucket.
+    Returns
+    -------
+    tuple
+        List of changed table names, and a dict of
+        the current row count of every checked table.
     """
-    client = boto3.client("s3")
-    date = dt.now()
-    year = date.year
-    month = date.month
-    day = date.day
-    time = date.strftime("%H%M%S")
+    tables = [
+        table
+        for table in get_table_names(conn)
+        if table not in LOOKUP_TABLES
+    ]
+    checked = [
+        table
+        for table in tables
+        if "last_updated" in get_table_columns(conn, table)
+    ]
+    stats = {}
+    if checked:
+        query = " UNION ALL ".join(
+            f"SELECT {literal(table)}, max(last_updated), count(*) "
+            f"FROM {table}"
+            for table in checked
+        )
+        with timed("PrecheckLatency"):
+            result = conn.run(query)
+        stats = {table: (latest, rows) for table, latest, rows in result}
+    # ends the read transaction, an idle run stops here
+    conn.commit()
 
-    last_successful_timestamp = timestamp.strftime("%Y:%m:%d:%H:%M:%S")
+    changed = []
+    for table in tables:
+        if table not in stats:
+            changed.append(table)
+            continue
+        latest, rows = stats[table]
+        since = watermarks.get(table, last_upload)
+        if rows != row_counts.get(table) or (
+            latest is not None and (since is None or latest > since)
+        ):
+            changed.append(table)
+    logger.info(f"{len(changed)} of {len(tables)} tables changed.")
+    return changed, {table: rows for table, (_, rows) in stats.items()}
+
+
+def get_table_records(
+    pool, table, last_upload, watermarks=None, deadline=None
+):  # noqa E501
+    """
+    Extracts a single table using a connection borrowed from the pool.
+
+    Parameters
+    ----------
+    pool : queue.Queue
+        Pool of pg8000 connections. The connection is
+        returned to the pool once the table is extracted.
+    table : str
+        Table name as returned by get_table_names.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+    deadline : float, optional
+        Deadline from get_deadline, lookup tables ignore it.
 
+    Returns
+    -------
+    list or None
+        Table records, or None if the deadline passed
+        before the table could be started.
+    """
+    conn = pool.get()
     try:
-        if json_data is None:
-            raise Exception("No JSON data provided")
+        if table not in LOOKUP_TABLES and is_past(deadline):
+            return None
+        sql, params = get_table_query(table, last_upload, watermarks)
+        with timed("QueryLatency", Table=table):
+            content = conn.run(sql, **params)
+        column_names = get_table_columns(conn, table)
+        records = rows_to_records(content, column_names)
+        record_metric("RowsExtracted", len(records), Table=table)
+        return records
+    finally:
+        pool.put(conn)
 
-        if not isinstance(json_data, dict):
-            raise Exception("Updated data type invalid. Dict expected.")
 
-        # aggregate all newly created json files
-        # and their keys on S3 to a list
-        latest_json_data_index = []
+def get_table_names(conn):
+    """
+    Gets the names of the tables to extract from the public schema.
 
-        for table in json_data:
-            if table != "all_addresses":
-                file_name = f"{table}/{year}/{month}/{day}/{table}-{time}.json"
-
-                if table == "staff":
-                    response = client.put_object(
-                        Body=json.dumps(
-                            {
-                                table: json_data[table],
-                                "department": json_data["department"],
-                            }  # noqa E501
-                        ),
-                        Bucket=bucket_name,
-                        Key=file_name,
-                    )  # noqa E501
-                    if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
-                        logger.info(f"Success. File {file_name} saved.")
-                        latest_json_data_index.append(file_name)
-
-                elif table == "counterparty":
-                    response = client.put_object(
-                        Body=json.dumps(
-                            {
-                                table: json_data[table],
-                                "address": json_data["all_addresses"],
-                            }  # noqa E501
-                        ),
-                        Bucket=bucket_name,
-                        Key=file_name,
-                    )  # noqa E501
-                    if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
-                        logger.info(f"Success. File {file_name} saved.")
-                        latest_json_data_index.append(file_name)
-
-                else:
-                    response = client.put_object(
-                        Body=json.dumps({table: json_data[table]}),
-                        Bucket=bucket_name,
-                        Key=file_name,
-                    )  # noqa E501
-                    if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
-                        logger.info(f"Success. File {file_name} saved.")
-                        latest_json_data_index.append(file_name)
-
-        datefileresponse = client.put_object(
-            Body=last_successful_timestamp,
-            Bucket=bucket_name,
-            Key="last_update.txt",
-        )
-        if datefileresponse["ResponseMetadata"]["HTTPStatusCode"] == 200:
-            logger.info("Success. last_update.txt overwritten")
-
-        # write a list of new json data to a file, save to ingestion bucket.
-        json_data_string = "\n".join(latest_json_data_index)
-        latest_json_response = client.put_object(
-            Body=json_data_string,
-            Bucket=bucket_name,
-            Key="latest_json_data.txt",
-        )
-        if latest_json_response["ResponseMetadata"]["HTTPStatusCode"] == 200:
-            logger.info("Latest JSON data file index created.")
+    The full address table is extracted a second time
+    as "all_addresses" to serve as a counterparty lookup.
 
-    except KeyError as e:
-        logger.error(f" {e.response['Error']['Message']}")
-    except ClientError as e:
-        logger.error(f" {e.response['Error']['Message']}")
-    except Exception as e:
-        logger.error(e)
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+
+    Returns
+    -------
+    list
+        Table names in extraction order.
+    """
+    catalog = get_catalog(conn)
+    list_table_names = [
+        table for table in catalog if table != "_prisma_migrations"
+    ]  # noqa E501
+    if "address" in catalog:
+        list_table_names.append("all_addresses")
+    return list_table_names
+
+
+def get_catalog(conn):
+    """
+    Gets the column names of every public table.
+
+    Column types, used to build Parquet schemas,
+    are cached alongside the names.
+
+    The catalog is cached at module level and reused by warm invocations
+    for as long as the schema fingerprint is unchanged, so a warm run
+    only pays for the fingerprint query and a cold or post-migration
+    run for one extra query, rather than one query per table.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+
+    Returns
+    -------
+    dict
+        Table names mapped to their column names in ordinal order.
+    """
+    fingerprint = get_schema_fingerprint(conn)
+    if fingerprint is not None and fingerprint == _catalog["fingerprint"]:
+        logger.info("Cached column catalog reused.")
+        return _catalog["columns"]
+
+    columns = conn.run(
+        """
+                        SELECT table_name, column_name,
+                            data_type, numeric_precision, numeric_scale
+                        FROM information_schema.columns
+                        WHERE table_schema = 'public'
+                        ORDER BY table_name, ordinal_position;
+                        """
+    )
+    catalog = {}
+    types = {}
+    for table_name, column_name, *column_type in columns:
+        catalog.setdefault(table_name, []).append(column_name)
+        types.setdefault(table_name, []).append(tuple(column_type))
+
+    _catalog["fingerprint"] = fingerprint
+    _catalog["columns"] = catalog
+    _catalog["types"] = types
+    _catalog["keys"] = None
+    logger.info("Column catalog retrieved.")
+    return catalog
+
+
+def get_schema_fingerprint(conn):
+    """
+    Gets a hash of the public schema's table and column definitions.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+
+    Returns
+    -------
+    str
+        md5 hash that changes whenever a public table
+        or column is added, removed, renamed or retyped.
+    """
+    result = conn.run(
+        """
+                        SELECT md5(string_agg(
+                            table_name || '.' || column_name
+                            || ':' || data_type
+                            || coalesce(numeric_precision::text, '')
+                            || ',' || coalesce(numeric_scale::text, ''),
+                            ',' ORDER BY table_name, ordinal_position
+                        ))
+                        FROM information_schema.columns
+                        WHERE table_schema = 'public';
+                        """
+    )
+    return result[0][0] if result else None
+
+
+def get_table_query(table, last_upload, watermarks=None):
+    """
+    Builds the extraction query for a table.
+
+    Department and address lookups are read in full, every other
+    table only since its own watermark, or since last_upload
+    if it does not have one yet.
+
+    Parameters
+    ----------
+    table : str
+        Table name as returned by get_table_names.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+
+    Returns
+    -------
+    tuple
+        The SQL string and a dict of its named parameters.
+    """
+    # lookups are ordered so unchanged tables hash to the same snapshot
+    if table == "department":
+        return (
+            """
+                            SELECT * FROM department
+                            ORDER BY department_id
+                            """,
+            {},
+        )
+    elif table == "all_addresses":
+        return (
+            """
+                            SELECT * FROM address
+                            ORDER BY address_id
+                            """,
+            {},
+        )
+    # get updated content from other tables
+    return (
+        f"""
+                        SELECT * FROM {table}
+                        WHERE (last_updated > :date)
+                        """,
+        {"date": (watermarks or {}).get(table, last_upload)},
+    )
+
+
+def get_table_columns(conn, table):
+    """
+    Gets the column names of a table in ordinal order.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object),
+        used if the column catalog has not been retrieved yet.
+    table : str
+        Table name as returned by get_table_names.
+
+    Returns
+    -------
+    list
+        Column names.
+    """
+    source_table = "address" if table == "all_addresses" else table
+    catalog = _catalog["columns"] or get_catalog(conn)
+    return catalog[source_table]
+
+
+def rows_to_records(content, column_names):
+    """
+    Converts pg8000 result rows into records keyed by column name.
+
+    Values are kept as returned by pg8000 and
+    only converted to JSON types by to_json.
+
+    Parameters
+    ----------
+    content : list
+        Rows returned by a pg8000 query.
+    column_names : list
+        Column names matching the row values.
+
+    Raises
+    ------
+    ValueError
+        If a row does not have one value per column.
+
+    Returns
+    -------
+    list
+        A list of dicts keyed by column name.
+    """
+    records = []
+    for row in content or ():
+        if len(row) != len(column_names):
+            raise ValueError(
+                f"{len(column_names)} columns passed, "
+                f"passed data had {len(row)} columns"
+            )
+        records.append(dict(zip(column_names, row)))
+    return records
+
+
+def to_json(content):
+    """
+    Serialises file content holding pg8000 values to a JSON string.
+
+    Output matches the ISO date format used by the ingestion files:
+    timestamps with millisecond precision and numerics as numbers.
+
+    Parameters
+    ----------
+    content : dict
+        File content keyed by table name.
+
+    Returns
+    -------
+    str
+        The JSON document.
+    """
+    return json.dumps(content, default=serialize_value)
+
+
+def serialize_value(value):
+    """
+    Converts a pg8000 value that json cannot encode into one it can.
+
+    Parameters
+    ----------
+    value
+        A datetime, date or Decimal value.
+
+    Raises
+    ------
+    TypeError
+        If the value type is not supported.
+
+    Returns
+    -------
+    str or float
+        The JSON-compatible value.
+    """
+    if isinstance(value, dt):
+        return value.isoformat(timespec="milliseconds")
+    if isinstance(value, dt_date):
+        return f"{value.isoformat()}T00:00:00.000"
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
+
+
+def stream_data(
+    conn,
+    bucket_name,
+    last_upload,
+    timestamp,
+    batch_size=STREAM_BATCH_SIZE,
+    watermarks=None,
+    deadline=None,
+    row_counts=None,
+):
+    """
+    Streams data updated since last_upload into the S3 bucket.
+
+    Every table is read through a server-side cursor in batches of
+    batch_size rows and each batch is saved as its own numbered part
+    file as soon as it arrives, so memory use is bounded by the batch
+    size rather than by the size of the update. Rows are read in
+    last_updated order, so a table stopped part way can keep the
+    watermark of its last saved row.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    bucket_name : str
+        S3 bucket name.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    timestamp : datetime.datetime
+        Datetime object timestamp from the lambda handler when it is invoked.
+    batch_size : int, optional
+        Number of rows fetched from the cursor per batch.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+        When given, the watermarks of the saved tables are advanced
+        and written back to the S3 bucket.
+    deadline : float, optional
+        Deadline from get_deadline, checked between batches. The
+        table being streamed when it passes is saved up to the rows
+        sharing the last_updated value of its last saved row, and
+        its watermark advanced to that value. The rest of it is read
+        on the next run together with the tables not started.
+    row_counts : dict, optional
+        Row counts from the last precheck, saved back unchanged
+        with the watermarks.
+
+    Returns
+    -------
+    list
+        Keys of the files saved to the S3 bucket.
+    """
+    client = get_client("s3")
+    time = dt.now()
+    saved_files = []
+    manifest_files = []
+    new_watermarks = dict(watermarks or {})
+
+    try:
+        file_format = get_file_format()
+        table_names = get_table_names(conn)
+        lookups = get_lookups(conn)
+        snapshots = write_snapshots(client, bucket_name, lookups)
+
+        tables = [table for table in table_names if table not in lookups]
+        for index, table in enumerate(tables):
+            since = (watermarks or {}).get(table, last_upload)
+            if is_past(deadline):
+                if watermarks is not None:
+                    held = tables[index:]
+                    hold_watermarks(new_watermarks, held, last_upload)
+                break
+            column_names = get_table_columns(conn, table)
+            sql, params = get_table_query(table, last_upload, watermarks)
+            cursor_name = f"{table}_cursor"
+            conn.run(
+                f"DECLARE {cursor_name} NO SCROLL CURSOR FOR "
+                f"{sql} ORDER BY last_updated",
+                **params,
+            )
+            stopped = False
+            try:
+                part = 0
+                records = []
+                while True:
+                    if part > 0 and is_past(deadline):
+                        stopped = True
+                        records = fetch_tied_rows(
+                            conn,
+                            cursor_name,
+                            batch_size,
+                            column_names,
+                            records[-1].get("last_updated"),
+                        )
+                        if not records:
+                            break
+                    else:
+                        with timed("QueryLatency", Table=table):
+                            content = conn.run(
+                                f"FETCH FORWARD {batch_size} "
+                                f"FROM {cursor_name}"
+                            )
+                        if len(content) == 0:
+                            break
+                        records = rows_to_records(content, column_names)
+                    record_metric("RowsExtracted", len(records), Table=table)
+                    part += 1
+                    file_name = get_file_name(table, time, part, file_format)
+                    stats = {}
+                    # later batches would move the watermark past this one
+                    if not put_table_file(
+                        client,
+                        bucket_name,
+                        file_name,
+                        table,
+                        records,
+                        snapshots,
+                        file_format,
+                        stats,
+                    ):
+                        raise Exception(f"Part {file_name} not saved.")
+                    saved_files.append(file_name)
+                    manifest_files.append(
+                        get_manifest_entry(
+                            file_name,
+                            table,
+                            records,
+                            stats,
+                            since,
+                            file_format,
+                        )
+                    )
+                    if watermarks is not None:
+                        update_watermark(new_watermarks, table, records)
+                    if stopped:
+                        break
+            finally:
+                conn.run(f"CLOSE {cursor_name}")
+                conn.commit()
+
+            if stopped:
+                # the saved rows end at a whole last_updated value, so the
+                # watermark of the stopped table moves up to its last row
+                if watermarks is not None:
+                    held = tables[index + 1:]
+                    hold_watermarks(new_watermarks, held, last_upload)
+                break
+
+        conn.close()
+        if saved_files:
+            write_index_files(
+                client,
+                bucket_name,
+                saved_files,
+                timestamp,
+                new_watermarks if watermarks is not None else None,
+                row_counts,
+                manifest_files,
+            )
+        logger.info("Updated content has been streamed to S3.")
+        return saved_files
+    except Exception as exc:
+        logger.error(exc)
+        raise exc
+
+
+def fetch_tied_rows(conn, cursor_name, batch_size, column_names, latest):
+    """
+    Fetches the rows at the start of a cursor ordered by last_updated
+    that share the last_updated value of the rows already fetched.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    cursor_name : str
+        Name of the declared cursor.
+    batch_size : int
+        Number of rows fetched from the cursor per batch.
+    column_names : list
+        Column names of the cursor rows.
+    latest : datetime.datetime or None
+        last_updated value of the last row fetched.
+
+    Returns
+    -------
+    list
+        Records of the tied rows, empty if there are none.
+    """
+    tied = []
+    while latest is not None:
+        content = conn.run(f"FETCH FORWARD {batch_size} FROM {cursor_name}")
+        records = rows_to_records(content, column_names)
+        same = [
+            record
+            for record in records
+            if record.get("last_updated") == latest
+        ]
+        tied += same
+        if len(same) < batch_size:
+            break
+    return tied
+
+
+def get_lookups(conn):
+    """
+    Reads the department and all_addresses lookup tables in full.
+
+    Lookup tables are small and referenced by staff and
+    counterparty files as snapshots, so they are always read whole.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+
+    Returns
+    -------
+    dict
+        Lookup table names mapped to their records.
+    """
+    lookups = {}
+    for table in ["department", "all_addresses"]:
+        sql, params = get_table_query(table, None)
+        content = conn.run(sql, **params)
+        lookups[table] = rows_to_records(
+            content, get_table_columns(conn, table)
+        )  # noqa E501
+    return lookups
+
+
+def copy_data(
+    conn,
+    bucket_name,
+    last_upload,
+    timestamp,
+    watermarks=None,
+    row_counts=None,
+    deadline=None,
+):
+    """
+    Copies data updated since last_upload straight into the S3 bucket.
+
+    Each table is exported with COPY ... TO STDOUT as one row_to_json
+    document per row, and the rows are written into an S3 multipart
+    upload as they arrive without being decoded into Python objects.
+    Memory use is bounded by the multipart part size.
+
+    Files hold the same {table: [...]} document as write_file, but
+    rows are encoded by Postgres: timestamps omit trailing zeros in
+    their fractional seconds and numerics keep their scale.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    bucket_name : str
+        S3 bucket name.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    timestamp : datetime.datetime
+        Datetime object timestamp from the lambda handler when it is invoked.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+        When given, the watermarks of the saved tables are advanced
+        and written back to the S3 bucket.
+    row_counts : dict, optional
+        Row counts from the last precheck, saved back unchanged
+        with the watermarks.
+    deadline : float, optional
+        Deadline from get_deadline, checked between tables.
+        The tables not copied when it passes are left for the
+        next run at their current watermark.
+
+    Returns
+    -------
+    list
+        Keys of the files saved to the S3 bucket.
+    """
+    client = get_client("s3")
+    time = dt.now()
+    saved_files = []
+    manifest_files = []
+    new_watermarks = dict(watermarks or {})
+
+    try:
+        compression = get_compression()
+        table_names = get_table_names(conn)
+        lookups = get_lookups(conn)
+        conn.commit()
+        snapshots = write_snapshots(client, bucket_name, lookups)
+
+        tables = [table for table in table_names if table not in lookups]
+        for index, table in enumerate(tables):
+            if is_past(deadline):
+                if watermarks is not None:
+                    held = tables[index:]
+                    hold_watermarks(new_watermarks, held, last_upload)
+                break
+            since = (watermarks or {}).get(table, last_upload)
+
+            # count, watermark and copy must see the same snapshot
+            conn.run("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            count, latest = conn.run(
+                f"""
+                                SELECT count(*), max(last_updated)
+                                FROM {table}
+                                WHERE (last_updated > :date)
+                                """,
+                date=since,
+            )[0]
+            if count == 0:
+                conn.commit()
+                continue
+
+            file_name = get_file_name(table, time)
+            upload = S3MultipartUpload(
+                client,
+                bucket_name,
+                file_name,
+                compression=compression,
+            )
+            stream = JsonRowStream(upload, table)
+            try:
+                conn.run(
+                    f"""
+                    COPY (
+                        SELECT row_to_json(t) FROM (
+                            SELECT * FROM {table}
+                            WHERE (last_updated > {literal(since)})
+                        ) t
+                    ) TO STDOUT
+                    WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')
+                    """,
+                    stream=stream,
+                )
+                conn.commit()
+                # serialise the snapshot member without its enclosing braces
+                lookup = get_file_content(table, [], snapshots)
+                lookup.pop(table)
+                stream.close(to_json(lookup)[1:-1])
+            except Exception:
+                # an abort failure must not hide the COPY error
+                try:
+                    upload.abort()
+                except Exception as abort_error:
+                    logger.error(
+                        f"Upload of {file_name} not aborted: {abort_error}"
+                    )  # noqa E501
+                raise
+            logger.info(f"Success. File {file_name} saved.")
+            saved_files.append(file_name)
+            record_metric("RowsExtracted", stream.rows, Table=table)
+            record_metric(
+                "BytesWritten", upload.bytes_stored, "Bytes", Table=table
+            )  # noqa E501
+            stats = {
+                "bytes": upload.bytes_stored,
+                "sha256": upload.digest.hexdigest(),
+            }
+            entry = get_manifest_entry(file_name, table, [], stats, since)
+            entry["rows"] = stream.rows
+            entry["until"] = latest.isoformat() if latest else None
+            manifest_files.append(entry)
+            if watermarks is not None and latest is not None:
+                new_watermarks[table] = max(
+                    latest, new_watermarks.get(table, latest)
+                )  # noqa E501
+
+        conn.close()
+        if saved_files:
+            write_index_files(
+                client,
+                bucket_name,
+                saved_files,
+                timestamp,
+                new_watermarks if watermarks is not None else None,
+                row_counts,
+                manifest_files,
+            )
+        logger.info("Updated content has been copied to S3.")
+        return saved_files
+    except Exception as exc:
+        logger.error(exc)
+        raise exc
+
+
+def page_data(
+    conn,
+    bucket_name,
+    last_upload,
+    timestamp,
+    page_size=KEYSET_PAGE_SIZE,
+    watermarks=None,
+    deadline=None,
+    row_counts=None,
+):
+    """
+    Extracts data updated since last_upload in keyset-paginated pages.
+
+    Every table is read in pages of at most page_size rows ordered by
+    (last_updated, primary key), each saved as a numbered part file.
+    A checkpoint is saved after every page, so a run that fails part
+    way through a table resumes after its last saved page. A manifest
+    of the parts is saved once the table is complete.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    bucket_name : str
+        S3 bucket name.
+    last_upload : datetime.datetime
+        The timestamp of the last fetched data file.
+    timestamp : datetime.datetime
+        Datetime object timestamp from the lambda handler when it is invoked.
+    page_size : int, optional
+        Maximum number of rows per page.
+    watermarks : dict, optional
+        Per-table watermarks taking precedence over last_upload.
+        When given, the watermark of every completed table is
+        advanced and written back to the S3 bucket.
+    deadline : float, optional
+        Deadline from get_deadline. Paging stops at the first page
+        boundary past it, and the table being paged resumes from its
+        checkpoint on the next run, followed by the tables not started.
+    row_counts : dict, optional
+        Row counts from the last precheck, saved back unchanged
+        with the watermarks.
+
+    Returns
+    -------
+    list
+        Keys of the part files of the tables completed in this run.
+    """
+    client = get_client("s3")
+    saved_files = []
+    manifest_files = []
+    new_watermarks = dict(watermarks or {})
+
+    try:
+        file_format = get_file_format()
+        table_names = get_table_names(conn)
+        lookups = get_lookups(conn)
+        conn.commit()
+        snapshots = write_snapshots(client, bucket_name, lookups)
+
+        tables = [table for table in table_names if table not in lookups]
+        for index, table in enumerate(tables):
+            if is_past(deadline):
+                # a table stopped part way resumes from its checkpoint
+                if watermarks is not None:
+                    held = tables[index:]
+                    hold_watermarks(new_watermarks, held, last_upload)
+                    write_watermarks(
+                        client, bucket_name, new_watermarks, row_counts
+                    )  # noqa E501
+                break
+            since = (watermarks or {}).get(table, last_upload)
+            entries, until = page_table(
+                conn,
+                client,
+                bucket_name,
+                table,
+                since,
+                snapshots,
+                page_size,
+                file_format,
+                deadline,
+            )
+            saved_files += [entry["key"] for entry in entries]
+            manifest_files += entries
+            # saved per table so completed tables are not read again
+            if watermarks is not None and until is not None:
+                new_watermarks[table] = max(
+                    until, new_watermarks.get(table, until)
+                )  # noqa E501
+                write_watermarks(
+                    client, bucket_name, new_watermarks, row_counts
+                )  # noqa E501
+
+        conn.close()
+        if saved_files:
+            write_index_files(
+                client,
+                bucket_name,
+                saved_files,
+                timestamp,
+                manifest_files=manifest_files,
+            )
+        logger.info("Updated content has been paged to S3.")
+        return saved_files
+    except Exception as exc:
+        logger.error(exc)
+        raise exc
+
+
+def page_table(
+    conn,
+    client,
+    bucket_name,
+    table,
+    since,
+    snapshots,
+    page_size,
+    file_format,
+    deadline=None,
+):  # noqa E501
+    """
+    Saves the rows of a table updated since a watermark page by page.
+
+    Rows are read up to the latest last_updated value found when the
+    table is started, so rows updated while it is paged are left to
+    the next run instead of shifting the pages.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    table : str
+        Table name.
+    since : datetime.datetime
+        Rows updated after this time are extracted.
+    snapshots : dict
+        Snapshot keys returned by write_snapshots.
+    page_size : int
+        Maximum number of rows per page.
+    file_format : str
+        "json", "ndjson" or "parquet".
+    deadline : float, optional
+        Deadline from get_deadline. No page is started past it.
+
+    Returns
+    -------
+    tuple
+        Manifest entries of the saved part files, see
+        get_manifest_entry, and the last_updated value the table was
+        read up to, or ([], None) if nothing was updated or the
+        deadline passed before the table was complete.
+    """
+    checkpoint = get_checkpoint(client, bucket_name, table)
+    if checkpoint is None:
+        until = conn.run(
+            f"""
+                            SELECT max(last_updated) FROM {table}
+                            WHERE (last_updated > :since)
+                            """,
+            since=since,
+        )[0][0]
+        conn.commit()
+        if until is None:
+            return [], None
+        checkpoint = {
+            "started": dt.now(),
+            "since": since,
+            "until": until,
+            "after": None,
+            "parts": [],
+            "files": [],
+            "rows": 0,
+        }
+    else:
+        logger.info(
+            f"Resuming {table} after page {len(checkpoint['parts'])}."
+        )  # noqa E501
+        if "files" not in checkpoint:
+            # saved before manifest entries were kept, sizes are unknown
+            checkpoint["files"] = [
+                dict(
+                    get_manifest_entry(part, table, [], {}, since),
+                    rows=None,
+                )
+                for part in checkpoint["parts"]
+            ]
+
+    key_columns = get_primary_key(conn, table)
+    if not key_columns:
+        # without a unique key a page boundary could split tied rows
+        logger.info(f"{table} has no primary key, reading it in one page.")
+    order = ", ".join(["last_updated", *key_columns])
+    limit = "LIMIT :limit" if key_columns else ""
+    after = ", ".join(f":after_{i}" for i in range(len(key_columns) + 1))
+    column_names = get_table_columns(conn, table)
+    while True:
+        if is_past(deadline):
+            # the saved checkpoint resumes the table on the next run
+            logger.info(
+                f"Time budget reached after page {len(checkpoint['parts'])}"
+                f" of {table}."
+            )
+            return [], None
+        with timed("QueryLatency", Table=table):
+            if checkpoint["after"] is None:
+                content = conn.run(
+                    f"""
+                                    SELECT * FROM {table}
+                                    WHERE (last_updated > :since)
+                                    AND (last_updated <= :until)
+                                    ORDER BY {order}
+                                    {limit}
+                                    """,
+                    since=checkpoint["since"],
+                    until=checkpoint["until"],
+                    limit=page_size,
+                )
+            else:
+                content = conn.run(
+                    f"""
+                                    SELECT * FROM {table}
+                                    WHERE (({order}) > ({after}))
+                                    AND (last_updated <= :until)
+                                    ORDER BY {order}
+                                    {limit}
+                                    """,
+                    until=checkpoint["until"],
+                    limit=page_size,
+                    **{
+                        f"after_{i}": value
+                        for i, value in enumerate(checkpoint["after"])
+                    },
+                )
+        conn.commit()
+        if len(content) == 0:
+            break
+
+        records = rows_to_records(content, column_names)
+        record_metric("RowsExtracted", len(records), Table=table)
+        part = len(checkpoint["parts"]) + 1
+        file_name = get_file_name(
+            table, checkpoint["started"], part, file_format
+        )  # noqa E501
+        stats = {}
+        if not put_table_file(
+            client,
+            bucket_name,
+            file_name,
+            table,
+            records,
+            snapshots,
+            file_format,
+            stats,
+        ):
+            raise Exception(f"Page {file_name} not saved.")
+        checkpoint["after"] = [
+            records[-1][column] for column in ["last_updated", *key_columns]
+        ]
+        checkpoint["parts"].append(file_name)
+        checkpoint["files"].append(
+            get_manifest_entry(
+                file_name,
+                table,
+                records,
+                stats,
+                checkpoint["since"],
+                file_format,
+            )
+        )
+        checkpoint["rows"] += len(records)
+        write_checkpoint(client, bucket_name, table, checkpoint)
+        if not key_columns or len(content) < page_size:
+            break
+
+    write_manifest(client, bucket_name, table, checkpoint)
+    # overwritten rather than deleted, a failed delete would leave
+    # the table resuming from a stale checkpoint on every run
+    client.put_object(
+        Body=json.dumps({"done": True}),
+        Bucket=bucket_name,
+        Key=f"{CHECKPOINTS_PREFIX}/{table}.json",
+    )
+    return checkpoint["files"], checkpoint["until"]
+
+
+def get_primary_key(conn, table):
+    """
+    Gets the primary key columns keyset pages are ordered by.
+
+    Primary keys of all public tables are read in one query and cached
+    with the column catalog. Composite keys are returned in key order.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    table : str
+        Table name.
+
+    Returns
+    -------
+    list
+        The key column names, empty if the table has no primary key.
+    """
+    if _catalog["keys"] is None:
+        rows = conn.run(
+            """
+                            SELECT tc.table_name, kcu.column_name
+                            FROM information_schema.table_constraints tc
+                            JOIN information_schema.key_column_usage kcu
+                            ON tc.constraint_name = kcu.constraint_name
+                            AND tc.table_schema = kcu.table_schema
+                            WHERE tc.constraint_type = 'PRIMARY KEY'
+                            AND tc.table_schema = 'public'
+                            ORDER BY tc.table_name, kcu.ordinal_position;
+                            """
+        )
+        keys = {}
+        for table_name, column_name in rows:
+            keys.setdefault(table_name, []).append(column_name)
+        _catalog["keys"] = keys
+    return _catalog["keys"].get(table, [])
+
+
+def get_checkpoint(client, bucket_name, table):
+    """
+    Reads the keyset pagination checkpoint of a table.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    table : str
+        Table name.
+
+    Returns
+    -------
+    dict or None
+        The checkpoint, or None if the table is not part way through,
+        i.e. it has no checkpoint or a "done" marker.
+    """
+    try:
+        response = client.get_object(
+            Bucket=bucket_name, Key=f"{CHECKPOINTS_PREFIX}/{table}.json"
+        )  # noqa E501
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise e
+    checkpoint = json.loads(response["Body"].read())
+    if checkpoint.get("done"):
+        return None
+    for field in ["started", "since", "until"]:
+        checkpoint[field] = dt.fromisoformat(checkpoint[field])
+    if checkpoint["after"] is not None:
+        checkpoint["after"][0] = dt.fromisoformat(checkpoint["after"][0])
+    return checkpoint
+
+
+def write_checkpoint(client, bucket_name, table, checkpoint):
+    """
+    Saves the keyset pagination checkpoint of a table.
+
+    Timestamps keep their microseconds, so
+    resumed pages start exactly after the last row.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    table : str
+        Table name.
+    checkpoint : dict
+        The checkpoint returned by get_checkpoint or built by page_table.
+    """
+    content = {
+        **checkpoint,
+        "started": checkpoint["started"].isoformat(),
+        "since": checkpoint["since"].isoformat(),
+        "until": checkpoint["until"].isoformat(),
+        "after": [
+            checkpoint["after"][0].isoformat(),
+            *checkpoint["after"][1:],
+        ],
+    }
+    # key values such as dates or numerics are saved as their text,
+    # which Postgres casts back when it compares them to the key
+    client.put_object(
+        Body=json.dumps(content, default=str),
+        Bucket=bucket_name,
+        Key=f"{CHECKPOINTS_PREFIX}/{table}.json",
+    )
+
+
+def write_manifest(client, bucket_name, table, checkpoint):
+    """
+    Saves the manifest of a completely paged table.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    table : str
+        Table name.
+    checkpoint : dict
+        The final checkpoint of the table.
+    """
+    started = checkpoint["started"]
+    file_name = (
+        f"{MANIFESTS_PREFIX}/{table}/{started.year}/{started.month}/"
+        f"{started.day}/{table}-{started.strftime('%H%M%S')}.json"
+    )
+    manifest = {
+        "table": table,
+        "since": checkpoint["since"].isoformat(),
+        "until": checkpoint["until"].isoformat(),
+        "rows": checkpoint["rows"],
+        "parts": checkpoint["parts"],
+    }
+    client.put_object(
+        Body=json.dumps(manifest), Bucket=bucket_name, Key=file_name
+    )  # noqa E501
+    logger.info(f"Manifest {file_name} saved.")
+
+
+def backfill(
+    conn,
+    database_credentials,
+    bucket_name,
+    start,
+    end=None,
+    slice_days=BACKFILL_SLICE_DAYS,
+    max_connections=MAX_CONNECTIONS,
+    deadline=None,
+):
+    """
+    Extracts the history of every table in parallel time slices.
+
+    Each table's rows updated after start and up to end are split into
+    slices of slice_days days, extracted concurrently over at most
+    max_connections connections and saved in the usual date-partitioned
+    layout, named after the start of their slice. A marker is saved
+    under state/backfill/ for every completed slice, so a rerun only
+    extracts the slices still missing. Once all slices are complete
+    the watermarks of all tables are advanced to end.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object),
+        closed once the backfill is done.
+    database_credentials : dict
+        Credentials used to open the additional connections.
+    bucket_name : str
+        S3 bucket name.
+    start : datetime.datetime
+        Rows updated after this time are extracted.
+    end : datetime.datetime, optional
+        Rows updated up to this time are extracted. Defaults to the end
+        of the previous backfill from the same start, or else to the
+        current database time.
+    slice_days : int, optional
+        Length of a time slice in days.
+    max_connections : int, optional
+        Maximum number of database connections open at once.
+    deadline : float, optional
+        Deadline from get_deadline. No slice is started past it. The
+        tables with slices left keep their current watermark, or end
+        if they have none, and a rerun extracts the missing slices.
+
+    Returns
+    -------
+    list
+        Keys of the files saved to the S3 bucket.
+    """
+    client = get_client("s3")
+    invocation_time = dt.now()
+    pool = Queue()
+    pool.put(conn)
+    try:
+        end = get_backfill_end(conn, client, bucket_name, start, end)
+        file_format = get_file_format()
+        table_names = get_table_names(conn)
+        lookups = get_lookups(conn)
+        conn.commit()
+        snapshots = write_snapshots(client, bucket_name, lookups)
+
+        tables = [table for table in table_names if table not in lookups]
+        completed = get_completed_slices(client, bucket_name)
+        all_slices = [
+            (table, slice_start, slice_end)
+            for table in tables
+            for slice_start, slice_end in get_time_slices(
+                start, end, slice_days
+            )  # noqa E501
+        ]
+        slices = [
+            task
+            for task in all_slices
+            if get_slice_key(*task) not in completed
+        ]
+        logger.info(
+            f"{len(slices)} backfill slices to extract, "
+            f"{len(all_slices) - len(slices)} already complete."
+        )
+
+        pool_size = max(1, min(max_connections, len(slices)))
+        for _ in range(pool_size - 1):
+            pool.put(get_connection(database_credentials))
+
+        def extract_slice(task):
+            if is_past(deadline):
+                return False, None
+            return True, backfill_slice(
+                pool, client, bucket_name, *task, snapshots, file_format
+            )  # noqa E501
+
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            results = list(executor.map(extract_slice, slices))
+        manifest_files = [entry for _, entry in results if entry]
+        saved_files = [entry["key"] for entry in manifest_files]
+        held = sorted(
+            {task[0] for task, (done, _) in zip(slices, results) if not done}
+        )  # noqa E501
+
+        watermarks, row_counts = get_watermark_state(bucket_name)
+        for table in tables:
+            if table not in held:
+                watermarks[table] = max(end, watermarks.get(table, end))
+        if held:
+            hold_watermarks(watermarks, held, end)
+        write_index_files(
+            client,
+            bucket_name,
+            saved_files,
+            invocation_time,
+            watermarks,
+            row_counts,
+            manifest_files,
+        )
+        if not held:
+            logger.info(f"Backfill up to {end} is complete.")
+        return saved_files
+    except Exception as exc:
+        logger.error(exc)
+        raise exc
+    finally:
+        while not pool.empty():
+            pool.get().close()
+
+
+def backfill_slice(
+    pool,
+    client,
+    bucket_name,
+    table,
+    slice_start,
+    slice_end,
+    snapshots,
+    file_format,
+):  # noqa E501
+    """
+    Extracts one time slice of a table using a connection from the pool.
+
+    Parameters
+    ----------
+    pool : queue.Queue
+        Pool of pg8000 connections. The connection is
+        returned to the pool once the slice is extracted.
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    table : str
+        Table name.
+    slice_start : datetime.datetime
+        Rows updated after this time are extracted.
+    slice_end : datetime.datetime
+        Rows updated up to this time are extracted.
+    snapshots : dict
+        Snapshot keys returned by write_snapshots.
+    file_format : str
+        "json", "ndjson" or "parquet".
+
+    Returns
+    -------
+    dict or None
+        Manifest entry of the saved file, see get_manifest_entry,
+        or None if the slice has no rows.
+    """
+    conn = pool.get()
+    try:
+        with timed("QueryLatency", Table=table):
+            content = conn.run(
+                f"""
+                            SELECT * FROM {table}
+                            WHERE (last_updated > :slice_start)
+                            AND (last_updated <= :slice_end)
+                            """,
+                slice_start=slice_start,
+                slice_end=slice_end,
+            )
+        conn.commit()
+        records = rows_to_records(content, get_table_columns(conn, table))
+        record_metric("RowsExtracted", len(records), Table=table)
+    finally:
+        pool.put(conn)
+
+    file_name = None
+    entry = None
+    if records:
+        file_name = get_file_name(table, slice_start, None, file_format)
+        stats = {}
+        if not put_table_file(
+            client,
+            bucket_name,
+            file_name,
+            table,
+            records,
+            snapshots,
+            file_format,
+            stats,
+        ):
+            raise Exception(f"Backfill file {file_name} not saved.")
+        entry = get_manifest_entry(
+            file_name, table, records, stats, slice_start, file_format
+        )  # noqa E501
+    client.put_object(
+        Body=json.dumps({"rows": len(records), "file": file_name}),
+        Bucket=bucket_name,
+        Key=get_slice_key(table, slice_start, slice_end),
+    )
+    return entry
+
+
+def get_backfill_end(conn, client, bucket_name, start, end=None):
+    """
+    Fixes the end of a backfill so reruns produce the same slices.
+
+    The start and end of a backfill are saved under state/backfill/,
+    and a rerun from the same start without an end reuses the saved end.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    start : datetime.datetime
+        Start of the backfill.
+    end : datetime.datetime, optional
+        Requested end of the backfill.
+
+    Returns
+    -------
+    datetime.datetime
+        The end of the backfill, in database time.
+    """
+    plan_key = f"{BACKFILL_PREFIX}/plan.json"
+    if end is None:
+        try:
+            response = client.get_object(Bucket=bucket_name, Key=plan_key)
+            plan = json.loads(response["Body"].read())
+            if dt.fromisoformat(plan["start"]) == start:
+                return dt.fromisoformat(plan["end"])
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "NoSuchKey":
+                raise e
+        end = conn.run("SELECT localtimestamp")[0][0]
+        conn.commit()
+    client.put_object(
+        Body=json.dumps({"start": start.isoformat(), "end": end.isoformat()}),
+        Bucket=bucket_name,
+        Key=plan_key,
+    )
+    return end
+
+
+def get_time_slices(start, end, slice_days):
+    """
+    Splits the time range from start to end into slices.
+
+    Parameters
+    ----------
+    start : datetime.datetime
+        Start of the range.
+    end : datetime.datetime
+        End of the range.
+    slice_days : int
+        Length of a slice in days, the last slice may be shorter.
+
+    Returns
+    -------
+    list
+        (slice_start, slice_end) tuples.
+    """
+    slices = []
+    slice_start = start
+    while slice_start < end:
+        slice_end = min(slice_start + timedelta(days=slice_days), end)
+        slices.append((slice_start, slice_end))
+        slice_start = slice_end
+    return slices
+
+
+def get_slice_key(table, slice_start, slice_end):
+    """
+    Builds the S3 key of a backfill slice completion marker.
+
+    Parameters
+    ----------
+    table : str
+        Table name.
+    slice_start : datetime.datetime
+        Start of the slice.
+    slice_end : datetime.datetime
+        End of the slice.
+
+    Returns
+    -------
+    str
+        The S3 object key.
+    """
+    time_format = "%Y%m%dT%H%M%S%f"
+    return (
+        f"{BACKFILL_PREFIX}/{table}/"
+        f"{slice_start.strftime(time_format)}-"
+        f"{slice_end.strftime(time_format)}.json"
+    )
+
+
+def get_completed_slices(client, bucket_name):
+    """
+    Lists the completion markers of backfill slices.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+
+    Returns
+    -------
+    set
+        Marker keys as built by get_slice_key.
+    """
+    completed = set()
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(
+        Bucket=bucket_name, Prefix=f"{BACKFILL_PREFIX}/"
+    ):  # noqa E501
+        for content in page.get("Contents", []):
+            completed.add(content["Key"])
+    return completed
+
+
+def ingest_changes(
+    conn,
+    bucket_name,
+    timestamp,
+    slot_name=CDC_SLOT_NAME,
+    max_changes=CDC_MAX_CHANGES,
+    deadline=None,
+):
+    """
+    Saves the changes decoded from a logical replication slot.
+
+    Instead of polling every table, the changes recorded by Postgres
+    since the last acknowledged position are read from the slot,
+    grouped per table and saved with write_file. Hard deletes are
+    saved as {table}_deleted files holding the deleted keys. The slot
+    is only advanced once every file has been saved, so a failed run
+    is replayed in full by the next one.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    bucket_name : str
+        S3 bucket name.
+    timestamp : datetime.datetime
+        Datetime object timestamp from the lambda handler when it is invoked.
+    slot_name : str, optional
+        Name of the test_decoding replication slot, created if missing.
+    max_changes : int, optional
+        Number of changes after which no further
+        transactions are read in this invocation.
+    deadline : float, optional
+        Deadline from get_deadline. No changes are read from the slot
+        past it. A run reads at most max_changes changes, which bounds
+        the time it needs once started.
+
+    Returns
+    -------
+    list
+        Keys of the files saved to the S3 bucket.
+    """
+    try:
+        create_replication_slot(conn, slot_name)
+        if is_past(deadline):
+            logger.info("Time budget reached, changes left in the slot.")
+            conn.close()
+            return []
+        changes = conn.run(
+            """
+                            SELECT lsn::text, data
+                            FROM pg_logical_slot_peek_changes(
+                                :slot, NULL, :limit
+                            )
+                            """,
+            slot=slot_name,
+            limit=max_changes,
+        )
+        if len(changes) == 0:
+            conn.close()
+            return []
+
+        json_data = get_changed_records(changes)
+        if "staff" in json_data or "counterparty" in json_data:
+            get_catalog(conn)
+            json_data.update(get_lookups(conn))
+
+        saved_files = []
+        if json_data:
+            saved_files = write_file(bucket_name, json_data, timestamp) or []
+            expected = [
+                table for table in json_data if table != "all_addresses"
+            ]  # noqa E501
+            if len(saved_files) != len(expected):
+                raise Exception("Changes not saved, replication slot kept.")
+
+        upto_lsn = changes[-1][0]
+        conn.run(
+            "SELECT pg_replication_slot_advance(:slot, CAST(:lsn AS pg_lsn))",
+            slot=slot_name,
+            lsn=upto_lsn,
+        )
+        conn.commit()
+        conn.close()
+        logger.info(f"Replication slot {slot_name} advanced to {upto_lsn}.")
+        return saved_files
+    except Exception as exc:
+        logger.error(exc)
+        raise exc
+
+
+def create_replication_slot(conn, slot_name):
+    """
+    Creates a test_decoding logical replication slot if it does not exist.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    slot_name : str
+        Name of the replication slot.
+    """
+    exists = conn.run(
+        "SELECT 1 FROM pg_replication_slots WHERE slot_name = :slot",
+        slot=slot_name,
+    )
+    if len(exists) == 0:
+        conn.run(
+            """
+                            SELECT pg_create_logical_replication_slot(
+                                :slot, 'test_decoding'
+                            )
+                            """,
+            slot=slot_name,
+        )
+        conn.commit()
+        logger.info(f"Replication slot {slot_name} created.")
+
+
+def get_changed_records(changes):
+    """
+    Groups test_decoding changes into records per table.
+
+    Inserted and updated rows are saved under the table name in
+    commit order, deleted keys under "{table}_deleted".
+
+    Parameters
+    ----------
+    changes : list
+        (lsn, data) rows returned by pg_logical_slot_peek_changes.
+
+    Returns
+    -------
+    dict
+        Table names mapped to their changed records.
+    """
+    changed = {}
+    for _, data in changes:
+        change = parse_change(data)
+        if change is None:
+            continue
+        table, action, record = change
+        if action == "DELETE":
+            table = f"{table}_deleted"
+        changed.setdefault(table, []).append(record)
+    return changed
+
+
+def parse_change(data):
+    """
+    Parses a test_decoding change line.
+
+    Parameters
+    ----------
+    data : str
+        Change text, e.g.
+        "table public.staff: INSERT: staff_id[integer]:1 ..."
+
+    Raises
+    ------
+    ValueError
+        If the line is a public table change that cannot be parsed,
+        so the replication slot is not advanced past it.
+
+    Returns
+    -------
+    tuple or None
+        Table name, action and record, or None for transaction
+        boundaries, other schemas and deletes without key data.
+    """
+    match = CHANGE_PATTERN.match(data)
+    if match is None:
+        if SKIPPED_CHANGE_PATTERN.match(data):
+            return None
+        raise ValueError(f"Unparsed change: {data}")
+    table, action, columns = match.groups()
+    if action == "DELETE" and columns == "(no-tuple-data)":
+        return None
+    # updates that change the key list the old key first
+    if "new-tuple:" in columns:
+        columns = columns.split("new-tuple:", 1)[1]
+    if not columns.strip() or COLUMN_PATTERN.sub("", columns).strip():
+        raise ValueError(f"Unparsed change: {data}")
+    record = {
+        name: cast_value(type_name, value)
+        for name, type_name, value in COLUMN_PATTERN.findall(columns)
+        if value != "unchanged-toast-datum"
+    }
+    if not record:
+        return None
+    return table, action, record
+
+
+def cast_value(type_name, value):
+    """
+    Converts a test_decoding column value to the type pg8000 would return.
+
+    Parameters
+    ----------
+    type_name : str
+        Postgres type name, e.g. "integer" or "numeric".
+    value : str
+        Column value as printed by test_decoding.
+
+    Returns
+    -------
+    The typed value.
+    """
+    if value == "null":
+        return None
+    if value.startswith("'"):
+        value = value[1:-1].replace("''", "'")
+    if type_name in ["integer", "smallint", "bigint"]:
+        return int(value)
+    if type_name.startswith("numeric"):
+        return Decimal(value)
+    if type_name == "boolean":
+        return value == "true"
+    if type_name.startswith("timestamp"):
+        return dt.fromisoformat(value)
+    if type_name == "date":
+        return dt_date.fromisoformat(value)
+    return value
+
+
+def get_file_name(table, date, part=None, file_format="json"):
+    """
+    Builds the date-partitioned S3 key for a table file.
+
+    Parameters
+    ----------
+    table : str
+        Table name.
+    date : datetime.datetime
+        Datetime used to partition and name the file.
+    part : int, optional
+        Part number for tables split across several files.
+    file_format : str, optional
+        "json", "ndjson" or "parquet". NDJSON files end in .ndjson.json,
+        so they still match the .json notification filter.
+
+    Returns
+    -------
+    str
+        The S3 object key.
+    """
+    time = date.strftime("%H%M%S")
+    prefix = f"{table}/{date.year}/{date.month}/{date.day}/{table}-{time}"
+    if part is not None:
+        prefix = f"{prefix}-part-{part:04d}"
+    if file_format == "ndjson":
+        return f"{prefix}.ndjson.json"
+    elif file_format == "parquet":
+        return f"{prefix}.parquet"
+    return f"{prefix}.json"
+
+
+def get_file_content(table, records, snapshots):
+    """
+    Wraps table records together with any lookup snapshot they depend on
+    and the type schema of the table.
+
+    Staff records reference the department snapshot and
+    counterparty records the snapshot of the full address table.
+    The "schema" member maps the table name to its column types,
+    see get_table_schema, and is left out if the types are unknown.
+
+    Parameters
+    ----------
+    table : str
+        Table name.
+    records : list
+        Table records.
+    snapshots : dict
+        Snapshot keys returned by write_snapshots.
+
+    Returns
+    -------
+    dict
+        File content keyed by table name.
+    """
+    content = {table: records}
+    if table == "staff":
+        content["snapshots"] = {"department": snapshots["department"]}
+    elif table == "counterparty":
+        content["snapshots"] = {"address": snapshots["address"]}
+    schema = get_table_schema(table)
+    if schema is not None:
+        content["schema"] = {table: schema}
+    return content
+
+
+def put_table_file(
+    client,
+    bucket_name,
+    file_name,
+    table,
+    records,
+    snapshots,
+    file_format,
+    stats=None,
+):
+    """
+    Saves table records as a JSON document, as NDJSON or as Parquet.
+
+    NDJSON files hold one record per line and keep the keys of
+    their lookup snapshots in the "snapshots" object metadata,
+    Parquet files in the "snapshots" schema metadata.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    file_name : str
+        The key of the object to be saved.
+    table : str
+        Table name.
+    records : list
+        Table records.
+    snapshots : dict
+        Snapshot keys returned by write_snapshots.
+    file_format : str
+        "json", "ndjson" or "parquet".
+    stats : dict, optional
+        Filled in with the size and hash of the saved object,
+        see put_file.
+
+    Returns
+    -------
+    bool
+        True if the file was saved.
+    """
+    content = get_file_content(table, records, snapshots)
+    if file_format == "parquet":
+        return put_file(
+            client,
+            bucket_name,
+            file_name,
+            to_parquet(table, records, content.get("snapshots")),
+            PARQUET_CONTENT_TYPE,
+            stats=stats,
+        )
+    elif file_format == "ndjson":
+        metadata = {}
+        if "snapshots" in content:
+            metadata["snapshots"] = json.dumps(content["snapshots"])
+        if "schema" in content:
+            metadata["schema"] = json.dumps(content["schema"][table])
+        return put_file(
+            client,
+            bucket_name,
+            file_name,
+            to_ndjson(records),
+            NDJSON_CONTENT_TYPE,
+            metadata,
+            stats,
+        )
+    return put_file(
+        client, bucket_name, file_name, to_json(content), stats=stats
+    )  # noqa E501
+
+
+def to_ndjson(records):
+    """
+    Serialises records holding pg8000 values to newline-delimited JSON.
+
+    Parameters
+    ----------
+    records : list
+        Table records.
+
+    Returns
+    -------
+    str
+        One JSON object per line.
+    """
+    return "".join(
+        json.dumps(record, default=serialize_value) + "\n"
+        for record in records
+    )  # noqa E501
+
+
+def to_parquet(table, records, snapshots=None):
+    """
+    Serialises records holding pg8000 values to Parquet.
+
+    The Arrow schema is built from the column types in the catalog.
+    Tables missing from it, such as the {table}_deleted change
+    tables, get a schema inferred from the values.
+
+    Parameters
+    ----------
+    table : str
+        Table name.
+    records : list
+        Table records.
+    snapshots : dict, optional
+        Lookup snapshot keys saved in the schema metadata.
+
+    Returns
+    -------
+    bytes
+        The Parquet file.
+    """
+    schema = get_arrow_schema(table)
+    if schema is None:
+        arrow_table = pa.Table.from_pylist(records)
+    else:
+        # unconstrained numerics have no fixed scale, keep them as floats
+        floats = [f.name for f in schema if pa.types.is_floating(f.type)]
+        if floats:
+            records = [
+                {**record, **{name: float_or_none(record[name]) for name in floats}}  # noqa E501
+                for record in records
+            ]
+        arrow_table = pa.Table.from_pylist(records, schema)
+    if snapshots:
+        arrow_table = arrow_table.replace_schema_metadata(
+            {"snapshots": json.dumps(snapshots)}
+        )  # noqa E501
+    buffer = pa.BufferOutputStream()
+    pq.write_table(
+        arrow_table,
+        buffer,
+        compression=PARQUET_COMPRESSION[get_compression()],
+    )
+    return buffer.getvalue().to_pybytes()
+
+
+def float_or_none(value):
+    """
+    Converts a numeric value to float, keeping nulls.
+
+    Parameters
+    ----------
+    value : Decimal, float or None
+        The value to convert.
+
+    Returns
+    -------
+    float or None
+    """
+    return None if value is None else float(value)
+
+
+def get_arrow_schema(table):
+    """
+    Builds the Arrow schema of a table from the cached column catalog.
+
+    Parameters
+    ----------
+    table : str
+        Table name.
+
+    Returns
+    -------
+    pyarrow.Schema or None
+        The schema, or None if a column type has no Arrow mapping.
+    """
+    source_table = "address" if table == "all_addresses" else table
+    names = _catalog["columns"].get(source_table)
+    types = _catalog["types"].get(source_table)
+    if not names or not types:
+        return None
+    fields = []
+    for name, column_type in zip(names, types):
+        arrow_type = get_arrow_type(*column_type) if column_type else None
+        if arrow_type is None:
+            return None
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def get_table_schema(table):
+    """
+    Builds the type schema of a table from the cached column catalog.
+
+    The schema lets the transformation Lambda decode JSON values
+    into native types: ISO strings of "timestamp" and "date" columns
+    into datetimes and dates, and numbers of "numeric(p,s)" columns
+    into Decimals of their declared scale.
+
+    Parameters
+    ----------
+    table : str
+        Table name.
+
+    Returns
+    -------
+    dict or None
+        Column names mapped to their types, or
+        None if a column type is not known.
+    """
+    source_table = "address" if table == "all_addresses" else table
+    names = _catalog["columns"].get(source_table)
+    types = _catalog["types"].get(source_table)
+    if not names or not types:
+        return None
+    schema = {}
+    for name, column_type in zip(names, types):
+        type_name = get_column_type(*column_type) if column_type else None
+        if type_name is None:
+            return None
+        schema[name] = type_name
+    return schema
+
+
+def get_column_type(data_type, precision=None, scale=None):
+    """
+    Maps a Postgres column type to its type in the file schema.
+
+    Parameters
+    ----------
+    data_type : str
+        information_schema data_type, e.g. "integer".
+    precision : int, optional
+        numeric_precision of numeric columns.
+    scale : int, optional
+        numeric_scale of numeric columns.
+
+    Returns
+    -------
+    str or None
+        "int", "float", "numeric(p,s)", "bool", "date", "timestamp"
+        or "text", or None for types not mapped.
+    """
+    if data_type in ["smallint", "integer", "bigint"]:
+        return "int"
+    elif data_type == "numeric":
+        if precision is None:
+            return "float"
+        return f"numeric({precision},{scale or 0})"
+    elif data_type in ["real", "double precision"]:
+        return "float"
+    elif data_type == "boolean":
+        return "bool"
+    elif data_type == "date":
+        return "date"
+    elif data_type.startswith("timestamp"):
+        return "timestamp"
+    elif data_type in ["character varying", "character", "text"]:
+        return "text"
+    return None
+
+
+def get_arrow_type(data_type, precision=None, scale=None):
+    """
+    Maps a Postgres column type to the Arrow type of its pg8000 values.
+
+    Parameters
+    ----------
+    data_type : str
+        information_schema data_type, e.g. "integer".
+    precision : int, optional
+        numeric_precision of numeric columns.
+    scale : int, optional
+        numeric_scale of numeric columns.
+
+    Returns
+    -------
+    pyarrow.DataType or None
+        The Arrow type, or None for types not mapped.
+    """
+    if data_type == "smallint":
+        return pa.int16()
+    elif data_type == "integer":
+        return pa.int32()
+    elif data_type == "bigint":
+        return pa.int64()
+    elif data_type == "numeric":
+        if precision is None:
+            return pa.float64()
+        return pa.decimal128(precision, scale or 0)
+    elif data_type == "real":
+        return pa.float32()
+    elif data_type == "double precision":
+        return pa.float64()
+    elif data_type == "boolean":
+        return pa.bool_()
+    elif data_type == "date":
+        return pa.date32()
+    elif data_type == "timestamp without time zone":
+        return pa.timestamp("us")
+    elif data_type == "timestamp with time zone":
+        return pa.timestamp("us", tz="UTC")
+    elif data_type in ["character varying", "character", "text"]:
+        return pa.string()
+    return None
+
+
+def get_file_format():
+    """
+    Gets the data file format from the
+    INGESTION_FORMAT environment variable.
+
+    Raises
+    ------
+    ValueError
+        If the format is unknown, or is parquet and
+        the pyarrow package is not installed.
+
+    Returns
+    -------
+    str
+        "json" (default), "ndjson" or "parquet".
+    """
+    file_format = os.environ.get("INGESTION_FORMAT", "json")
+    if file_format not in FILE_FORMATS:
+        raise ValueError(f"Unsupported file format {file_format}.")
+    if file_format == "parquet" and pa is None:
+        raise ValueError("parquet output requires the pyarrow package.")
+    return file_format
+
+
+def write_snapshots(client, bucket_name, json_data):
+    """
+    Saves the department and all_addresses lookups as snapshots.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    json_data : dict
+        Extracted content, lookups missing from it are skipped.
+
+    Returns
+    -------
+    dict
+        Member names ("department", "address") mapped to snapshot keys.
+    """
+    snapshots = {}
+    for table, name in SNAPSHOT_LOOKUPS.items():
+        if table in json_data:
+            snapshots[name] = write_snapshot(
+                client, bucket_name, name, json_data[table]
+            )  # noqa E501
+    return snapshots
+
+
+def write_snapshot(client, bucket_name, name, records):
+    """
+    Saves lookup records under a key derived from their content.
+
+    The key holds the SHA-256 of the serialised records, so an
+    unchanged lookup maps to the snapshot already in the bucket
+    and is not uploaded again.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    name : str
+        Member name the records are saved under.
+    records : list
+        Lookup table records.
+
+    Returns
+    -------
+    str
+        The snapshot key, e.g. "state/snapshots/department/<sha256>.json".
+    """
+    body = to_json({name: records})
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    key = f"{SNAPSHOTS_PREFIX}/{name}/{digest}.json"
+    if (bucket_name, key) in _snapshots:
+        return key
+
+    try:
+        client.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ["404", "NoSuchKey"]:
+            raise
+        if not put_file(client, bucket_name, key, body):
+            raise Exception(f"Snapshot {key} not saved.")
+    _snapshots.add((bucket_name, key))
+    return key
+
+
+def put_file(
+    client,
+    bucket_name,
+    file_name,
+    body,
+    content_type=None,
+    metadata=None,
+    stats=None,
+):
+    """
+    Puts a single file into the S3 bucket.
+
+    Text bodies are compressed with the codec returned by get_compression
+    and the codec is saved as the object's Content-Encoding. Binary
+    bodies, such as Parquet files, are saved as they are. Bodies of
+    MULTIPART_THRESHOLD bytes or more are uploaded in parallel parts.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    file_name : str
+        The key of the object to be saved.
+    body : str or bytes
+        File content.
+    content_type : str, optional
+        Content-Type saved with the object.
+    metadata : dict, optional
+        User metadata saved with the object.
+    stats : dict, optional
+        Filled in with the "bytes" and "sha256" of the object
+        as stored, i.e. after compression.
+
+    Returns
+    -------
+    bool
+        True if the file was saved.
+    """
+    codec = get_compression()
+    options = {}
+    if codec != "none" and isinstance(body, str):
+        compressor = get_compressor(codec)
+        body = compressor.compress(body.encode("utf-8")) + compressor.flush()
+        options["ContentEncoding"] = codec
+    if content_type is not None:
+        options["ContentType"] = content_type
+    if metadata:
+        options["Metadata"] = metadata
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if stats is not None:
+        stats["bytes"] = len(body)
+        stats["sha256"] = hashlib.sha256(body).hexdigest()
+    table = file_name.split("/")[0]
+    record_metric("BytesWritten", len(body), "Bytes", Table=table)
+
+    if len(body) >= MULTIPART_THRESHOLD:
+        # raises on failure, there is no response to check
+        with timed("S3Latency", Table=table):
+            client.upload_fileobj(
+                io.BytesIO(body),
+                bucket_name,
+                file_name,
+                ExtraArgs=options,
+                Config=TransferConfig(
+                    multipart_threshold=MULTIPART_THRESHOLD,
+                    multipart_chunksize=MULTIPART_THRESHOLD,
+                    max_concurrency=MULTIPART_CONCURRENCY,
+                ),
+            )
+        logger.info(f"Success. File {file_name} saved in parts.")
+        return True
+
+    with timed("S3Latency", Table=table):
+        response = client.put_object(
+            Body=body, Bucket=bucket_name, Key=file_name, **options
+        )  # noqa E501
+    if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
+        logger.info(f"Success. File {file_name} saved.")
+        return True
+    return False
+
+
+def get_compression():
+    """
+    Gets the codec data files are compressed with
+    from the INGESTION_COMPRESSION environment variable.
+
+    Compressed files keep their .json suffix and
+    are marked with a Content-Encoding instead.
+
+    Raises
+    ------
+    ValueError
+        If the codec is unknown, or is zstd and
+        the zstandard package is not installed.
+
+    Returns
+    -------
+    str
+        "none" (default), "gzip" or "zstd".
+    """
+    codec = os.environ.get("INGESTION_COMPRESSION", "none")
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(f"Unsupported compression codec {codec}.")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package.")
+    return codec
+
+
+def get_compressor(codec):
+    """
+    Creates an incremental compressor for a codec.
+
+    Parameters
+    ----------
+    codec : str
+        "gzip" or "zstd".
+
+    Returns
+    -------
+    object
+        Compressor with compress(data) and flush() methods.
+    """
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compressobj()
+    # wbits=31 writes a gzip header and trailer
+    return zlib.compressobj(wbits=31)
+
+
+def write_index_files(
+    client,
+    bucket_name,
+    file_names,
+    timestamp,
+    watermarks=None,
+    row_counts=None,
+    manifest_files=None,
+):
+    """
+    Overwrites the last_update.txt and latest_json_data.txt files,
+    the run manifest, and the per-table watermarks when they are given.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    file_names : list
+        Keys of the data files saved during this invocation.
+    timestamp : datetime.datetime
+        Datetime object timestamp from the lambda handler when it is invoked.
+    watermarks : dict, optional
+        Per-table watermarks to save.
+    row_counts : dict, optional
+        Row counts to save alongside the watermarks.
+    manifest_files : list, optional
+        Manifest entries of the files, see get_manifest_entry.
+    """
+    last_successful_timestamp = timestamp.strftime("%Y:%m:%d:%H:%M:%S")
+    datefileresponse = client.put_object(
+        Body=last_successful_timestamp,
+        Bucket=bucket_name,
+        Key="last_update.txt",
+    )
+    if datefileresponse["ResponseMetadata"]["HTTPStatusCode"] == 200:
+        logger.info("Success. last_update.txt overwritten")
+
+    # write a list of new json data to a file, save to ingestion bucket.
+    json_data_string = "\n".join(file_names)
+    latest_json_response = client.put_object(
+        Body=json_data_string,
+        Bucket=bucket_name,
+        Key="latest_json_data.txt",
+    )
+    if latest_json_response["ResponseMetadata"]["HTTPStatusCode"] == 200:
+        logger.info("Latest JSON data file index created.")
+
+    write_run_manifest(client, bucket_name, timestamp, manifest_files or [])
+
+    if watermarks is not None:
+        write_watermarks(client, bucket_name, watermarks, row_counts)
+
+
+def get_manifest_entry(
+    file_name, table, records, stats, since, file_format=None
+):
+    """
+    Describes a saved table file for the run manifest.
+
+    Parameters
+    ----------
+    file_name : str
+        The key of the saved object.
+    table : str
+        Table name.
+    records : list
+        Records saved in the file.
+    stats : dict
+        Size and hash of the saved object, as filled in by put_file.
+    since : datetime.datetime or None
+        Lower bound of last_updated the records were extracted from,
+        i.e. the table's watermark or last_upload, if any.
+    file_format : str, optional
+        "json", "ndjson" or "parquet", taken from the key if not given.
+
+    Returns
+    -------
+    dict
+        The manifest entry of the file.
+    """
+    if not isinstance(records, list):
+        records = []
+    until = max(
+        (
+            record["last_updated"]
+            for record in records
+            if isinstance(record, dict)
+            and record.get("last_updated") is not None
+        ),
+        default=None,
+    )
+    if file_format is None:
+        file_format = "json"
+        if file_name.endswith(".parquet"):
+            file_format = "parquet"
+        elif file_name.endswith(".ndjson.json"):
+            file_format = "ndjson"
+    return {
+        "key": file_name,
+        "table": table,
+        "format": file_format,
+        "compression": get_compression(),
+        "rows": len(records),
+        "bytes": stats.get("bytes"),
+        "sha256": stats.get("sha256"),
+        "since": since.isoformat() if since is not None else None,
+        "until": until.isoformat() if until is not None else None,
+    }
+
+
+def write_run_manifest(client, bucket_name, timestamp, files):
+    """
+    Saves the manifest of the files saved during an invocation.
+
+    The manifest is saved under state/runs/ and as
+    state/latest_manifest.json, next to latest_json_data.txt.
+    Downstream stages can read the row count, size and hash of every
+    file, and the schema fingerprint it was extracted with, without
+    downloading any data.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    timestamp : datetime.datetime
+        Datetime object timestamp from the lambda handler when it is invoked.
+    files : list
+        Manifest entries built by get_manifest_entry.
+
+    Returns
+    -------
+    str
+        The key of the saved manifest.
+    """
+    manifest = json.dumps(
+        {
+            "run": timestamp.isoformat(),
+            "schema_fingerprint": _catalog["fingerprint"],
+            "rows": sum(entry["rows"] for entry in files),
+            "bytes": sum(entry["bytes"] or 0 for entry in files),
+            "files": files,
+        }
+    )
+    file_name = (
+        f"{RUNS_PREFIX}/{timestamp.year}/{timestamp.month}/{timestamp.day}/"
+        f"run-{timestamp.strftime('%H%M%S')}.json"
+    )
+    for key in [file_name, LATEST_MANIFEST_KEY]:
+        client.put_object(Body=manifest, Bucket=bucket_name, Key=key)
+    logger.info(f"Run manifest {file_name} saved.")
+    return file_name
+
+
+def write_file(
+    bucket_name,
+    json_data,
+    timestamp=dt(2020, 1, 1, 0, 0, 0),
+    watermarks=None,
+    max_workers=UPLOAD_WORKERS,
+    row_counts=None,
+    since=None,
+):
+    """
+    Handles creation of a new data file in the S3 bucket.
+
+    Saves the JSON file with a timestamp
+    to organize the structure of S3 buckets.
+    Table files are uploaded concurrently. Once all of them
+    have been uploaded, overwrites a last_updated file with the
+    time the handler was invoked and, when watermarks
+    are given, advances the watermark of every saved table.
+    If any table file is not saved, nothing else is written.
+
+    Parameters
+    ----------
+    bucket_name : str
+        S3 bucket name.
+    json_data : dict
+        JSON data from the get_data utility (string).
+    timestamp : datetime.datetime, optional
+        Datetime object timestamp from the lambda handler when it is invoked.
+        Default is January 1, 2020, 00:00:00.
+    watermarks : dict, optional
+        Per-table watermarks the data was extracted from.
+    max_workers : int, optional
+        Maximum number of table files uploaded at once.
+    row_counts : dict, optional
+        Row counts from get_changed_tables to save with the watermarks.
+    since : datetime.datetime, optional
+        Lower bound the tables without a watermark were
+        extracted from, recorded in the run manifest.
+
+    Raises
+    ------
+    ClientError
+        Issue occurred regarding putting an object into the S3 bucket.
+
+    Returns
+    -------
+    list
+        Keys of the files saved to the S3 bucket,
+        or None if the files could not be written.
+    """
+    client = get_client("s3")
+    date = dt.now()
+    new_watermarks = dict(watermarks or {})
+
+    try:
+        if json_data is None:
+            raise Exception("No JSON data provided")
+
+        if not isinstance(json_data, dict):
+            raise Exception("Updated data type invalid. Dict expected.")
+
+        # aggregate all newly created json files
+        # and their keys on S3 to a list
+        latest_json_data_index = []
+        file_format = get_file_format()
+        snapshots = write_snapshots(client, bucket_name, json_data)
+        tables = [table for table in json_data if table != "all_addresses"]
+
+        def save_table(table):
+            file_name = get_file_name(table, date, None, file_format)
+            stats = {}
+            saved = put_table_file(
+                client,
+                bucket_name,
+                file_name,
+                table,
+                json_data[table],
+                snapshots,
+                file_format,
+                stats,
+            )
+            return file_name, saved, stats
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # results come back in table order, failures are raised here
+            results = list(executor.map(save_table, tables))
+
+        # last_update.txt must not advance past files that were not saved
+        failed = [file_name for file_name, saved, _ in results if not saved]
+        if failed:
+            raise Exception(f"Files not saved: {', '.join(failed)}")
+
+        manifest_files = []
+        for table, (file_name, _, stats) in zip(tables, results):
+            latest_json_data_index.append(file_name)
+            manifest_files.append(
+                get_manifest_entry(
+                    file_name,
+                    table,
+                    json_data[table],
+                    stats,
+                    (watermarks or {}).get(table, since),
+                    file_format,
+                )
+            )
+            if watermarks is not None:
+                update_watermark(new_watermarks, table, json_data[table])
+
+        write_index_files(
+            client,
+            bucket_name,
+            latest_json_data_index,
+            timestamp,
+            new_watermarks if watermarks is not None else None,
+            row_counts,
+            manifest_files,
+        )
+        return latest_json_data_index
+
+    except KeyError as e:
+        logger.error(f" {e.response['Error']['Message']}")
+    except ClientError as e:
+        logger.error(f" {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.error(e)
+
+
+class S3MultipartUpload:
+    """
+    Writable file-like object uploading everything
+    written to it as a single S3 multipart upload.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket_name : str
+        S3 bucket name.
+    file_name : str
+        The key of the object to be saved.
+    part_size : int, optional
+        Bytes buffered before a part is uploaded,
+        at least 5 MiB as required by S3.
+    compression : str, optional
+        Codec the written bytes are compressed with before they are
+        buffered, saved as the object's Content-Encoding.
+
+    Attributes
+    ----------
+    bytes_written : int
+        Bytes written to the object, before compression.
+    bytes_stored : int
+        Bytes uploaded, i.e. after compression.
+    digest
+        SHA-256 hash object of the uploaded bytes.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket_name,
+        file_name,
+        part_size=COPY_PART_SIZE,
+        compression="none",
+    ):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.bytes_written = 0
+        self.bytes_stored = 0
+        self.digest = hashlib.sha256()
+        self.compressor = None
+        encoding = {}
+        if compression != "none":
+            self.compressor = get_compressor(compression)
+            encoding["ContentEncoding"] = compression
+        response = client.create_multipart_upload(
+            Bucket=bucket_name, Key=file_name, **encoding
+        )  # noqa E501
+        self.upload_id = response["UploadId"]
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self.compressor is not None:
+            self.buffer += self.compressor.compress(data)
+        else:
+            self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def complete(self):
+        if self.compressor is not None:
+            self.buffer += self.compressor.flush()
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.file_name,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.file_name,
+            UploadId=self.upload_id,
+        )
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        self.bytes_stored += len(self.buffer)
+        self.digest.update(self.buffer)
+        response = self.client.upload_part(
+            Body=bytes(self.buffer),
+            Bucket=self.bucket_name,
+            Key=self.file_name,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+        )
+        self.parts.append(
+            {"ETag": response["ETag"], "PartNumber": part_number}
+        )  # noqa E501
+        self.buffer = bytearray()
+
+
+class JsonRowStream:
+    """
+    Writable stream turning newline-separated JSON rows
+    from COPY ... TO STDOUT into a {table: [...]} document.
+
+    Parameters
+    ----------
+    writer
+        Binary file-like object receiving the document.
+    table : str
+        Table name used as the document key.
+    """
+
+    def __init__(self, writer, table):
+        self.writer = writer
+        self.opening = ("{" + json.dumps(table) + ": [").encode()
+        self.rows = 0
+        self.pending = b""
+
+    def write(self, data):
+        lines = (self.pending + bytes(data)).split(b"\n")
+        self.pending = lines.pop()
+        for line in lines:
+            if line:
+                self._write_row(line)
+        return len(data)
+
+    def close(self, extra_members=""):
+        """
+        Ends the document and completes the writer.
+
+        Parameters
+        ----------
+        extra_members : str, optional
+            Serialised members appended after the table
+            rows, such as a lookup table.
+        """
+        if self.pending:
+            self._write_row(self.pending)
+            self.pending = b""
+        if self.rows == 0:
+            self.writer.write(self.opening)
+        self.writer.write(b"]")
+        if extra_members:
+            self.writer.write(f", {extra_members}".encode())
+        self.writer.write(b"}")
+        self.writer.complete()
+
+    def _write_row(self, line):
+        if self.rows == 0:
+            self.writer.write(self.opening)
+        else:
+            self.writer.write(b", ")
+        self.writer.write(line)
+        self.rows += 1
+
+
+def main(argv=None):
+    """
+    Runs a backfill from the command line, e.g. against a local database.
+
+    Database credentials are read from the PDB_HOST, PDB_PORT, PDB_NAME,
+    PDB_USER and PDB_PASSWORD environment variables, or from an AWS
+    Secrets Manager secret when --secret is given.
+
+    Parameters
+    ----------
+    argv : list, optional
+        Command line arguments, sys.argv if not given.
+    """
+    parser = argparse.ArgumentParser(
+        description="Backfill the ingestion bucket in parallel time slices."
+    )
+    parser.add_argument("--bucket", required=True, help="S3 bucket name")
+    parser.add_argument(
+        "--start",
+        type=dt.fromisoformat,
+        default=dt(2020, 1, 1),
+        help="extract rows updated after this time (default 2020-01-01)",
+    )
+    parser.add_argument(
+        "--end",
+        type=dt.fromisoformat,
+        help="extract rows updated up to this time (default now)",
+    )
+    parser.add_argument(
+        "--slice-days", type=int, default=BACKFILL_SLICE_DAYS
+    )  # noqa E501
+    parser.add_argument(
+        "--max-connections", type=int, default=MAX_CONNECTIONS
+    )  # noqa E501
+    parser.add_argument(
+        "--secret", help="Secrets Manager secret with the credentials"
+    )  # noqa E501
+    args = parser.parse_args(argv)
+
+    if args.secret:
+        credentials = get_credentials(args.secret)
+    else:
+        credentials = {
+            "host": os.environ["PDB_HOST"],
+            "port": int(os.environ["PDB_PORT"]),
+            "user": os.environ["PDB_USER"],
+            "password": os.environ["PDB_PASSWORD"],
+            "database": os.environ["PDB_NAME"],
+        }
+    conn = get_connection(credentials)
+    saved_files = backfill(
+        conn,
+        credentials,
+        args.bucket,
+        args.start,
+        args.end,
+        args.slice_days,
+        args.max_connections,
+    )
+    logger.info(f"Backfill saved {len(saved_files)} files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 import time
 import pandas as pd
-from pg8000 import Connection, DatabaseError, InterfaceError
-import json
-import boto3
+from pg8000 import DatabaseError, InterfaceError
 import logging
 from botocore.exceptions import ClientError
+from decimal import Decimal
 from io import BytesIO
+from time import perf_counter
+from src.shared.connections import (
+    get_client,
+    get_credentials,
+    get_reusable_connection,
+)
+from src.shared.metrics import emit_metrics, record_metric, timed
 
 logging.basicConfig()
 logger = logging.getLogger("loading_lambda")
@@ -43,14 +49,17 @@ def lambda_handler(event, context):
         table_name = key.split("/")[0]
 
         credentials = get_credentials("warehouse")
-        conn = get_connection(credentials)
+        conn = get_reusable_connection(credentials)
 
-        data = get_parquet(bucket_name, key)
+        with timed("S3Latency", Table=table_name):
+            data = get_parquet(bucket_name, key)
 
         column_names = get_column_names(conn, table_name)
 
         if table_name == "fact_sales_order":
             time.sleep(20)
+        start = perf_counter()
+        if table_name == "fact_sales_order":
             for record in data:
                 list_columns = list(column_names)
                 list_columns.remove("sales_record_id")
@@ -98,6 +107,7 @@ def lambda_handler(event, context):
                     )
                 )
                 conn.commit()
+        record_load(table_name, len(data), perf_counter() - start)
         conn.close()
 
         logger.info(f"data successfully inserted into {table_name}")
@@ -106,104 +116,32 @@ def lambda_handler(event, context):
         logger.error(f"pg8000 - an error has occurred: {db.args[0]['M']}")
     except Exception as exc:
         logger.error(exc)
+    finally:
+        emit_metrics("loading")
 
 
-def get_credentials(secret_name):
-    """
-    Gets credentials from the AWS secrets manager.
-
-    Parameters
-    ----------
-    secret_name : str
-        The name of the database credentials secret
-        the lambda is trying to connect to.
-        Options: "production", "warehouse".
-
-    Raises
-    ------
-    ClientError
-        If the secret name is not found in the secrets manager.
-        If there is an unexpected error connecting to the secrets manager.
-    KeyError
-        If the credentials object has a missing key.
-
-    Returns
-    -------
-    dict
-        A json-like object that contains the database connection credentials
-        that can be accessed using the following keys:
-        host, port, user, password, database
-    """
-    try:
-        client = boto3.client("secretsmanager", region_name="eu-west-2")
-        response = client.get_secret_value(SecretId=secret_name)
-        secret = json.loads(response["SecretString"])
-
-        connection_params = {
-            "host": secret["host"],
-            "port": secret["port"],
-            "user": secret["user"],
-            "password": secret["password"],
-            "database": secret["database"],
-        }
-        logger.info("connection parameters returned")
-        return connection_params
-
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceNotFoundException":
-            logger.error(f"Secret {secret_name} does not exist.")
-        else:
-            logger.error(f"Error accessing database secret {secret_name}: {e}")
-    except KeyError as e:
-        logger.error(f"Missing key {e} in database credentials.")
-
-
-def get_connection(database_credentials):
+def record_load(table_name, rows, seconds):
     """
-    Gets connections to the OLTP database.
+    Records the duration, row count and throughput of a table load.
 
     Parameters
     ----------
-    database_credentials (from the get_credentials util),
-    which is a dictionary consisting of:
-        user
-        host
-        database
-        port
-        password
-
-    Raises
-    ------
-    DatabaseError: Will return an error message showing what is missing.
-        i.e. if the password is wrong, the error message will state password
-        authentication has failed.
-    InterfaceError:
-
-    Returns
-    -------
-    A successful pg8000 connection object will be returned.
+    table_name : str
+        The warehouse table the rows were inserted into.
+    rows : int
+        Number of rows inserted.
+    seconds : float
+        Time spent inserting the rows.
     """
-    try:
-        user = database_credentials["user"]
-        host = database_credentials["host"]
-        database = database_credentials["database"]
-        port = database_credentials["port"]
-        password = database_credentials["password"]
-        conn = Connection(user, host, database, port, password, timeout=5)
-        logger.info("Connection to database has been established.")
-        return conn
-    except DatabaseError as db:
-        logger.error(f"pg8000 - an error has occurred: {db.args[0]['M']}")
-        raise db
-    except InterfaceError as ie:
-        logger.error(f'pg8000 - an error has occurred: \n"{ie}"')
-        raise ie
-    except Exception as exc:
-        logger.error(
-            "An error has occurred when \
-            attempting to connect to the database."
+    record_metric("LoadTime", seconds * 1000, "Milliseconds", Table=table_name)
+    record_metric("RowsLoaded", rows, Table=table_name)
+    if seconds > 0:
+        record_metric(
+            "RowsLoadedPerSecond",
+            rows / seconds,
+            "Count/Second",
+            Table=table_name,
         )
-        raise exc
 
 
 def get_parquet(bucket_name, file_name):
@@ -211,6 +149,10 @@ def get_parquet(bucket_name, file_name):
     Extracts the parquet file and returns the values
     of the rows in a list of tuples.
 
+    Decimal values are returned as strings, which the
+    VALUES literal of the insert casts back to numeric
+    without losing precision.
+
     Parameters
     ----------
     bucket_name : str
@@ -223,7 +165,7 @@ def get_parquet(bucket_name, file_name):
     list
         A list of tuples representing the values of each row.
     """
-    client = boto3.client("s3")
+    client = get_client("s3")
     try:
         response = client.get_object(Bucket=bucket_name, Key=file_name)
         restored_df = pd.read_parquet(BytesIO(response["Body"].read()))
@@ -232,7 +174,13 @@ def get_parquet(bucket_name, file_name):
         )  # noqa E501
         values = formatted_df.values.tolist()
 
-        list_of_tuples = [tuple(list) for list in values]
+        list_of_tuples = [
+            tuple(
+                str(value) if isinstance(value, Decimal) else value
+                for value in list
+            )
+            for list in values
+        ]
 
         return list_of_tuples
     except ClientError as e:
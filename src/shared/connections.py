@@ -0,0 +1,243 @@
+"""
+AWS clients, database credentials and database connections
+shared by the Lambda functions and kept across warm invocations.
+
+Terraform packages this module into each Lambda's zip under the
+same path, so it is imported as src.shared.connections both there
+and in the tests.
+"""
+
+import boto3
+import json
+import logging
+from botocore.exceptions import ClientError
+from pg8000 import Connection, DatabaseError, InterfaceError
+from threading import Lock
+from time import monotonic
+
+logging.basicConfig()
+logger = logging.getLogger("connections")
+logger.setLevel(logging.INFO)
+
+SECRETS_TTL = 300
+
+# boto3 clients, decoded secrets and the database connection
+# kept across warm invocations
+_runtime = {"clients": {}, "secrets": {}, "connection": None}
+_runtime_lock = Lock()
+
+
+def get_credentials(secret_name):
+    """
+    Gets credentials from the AWS Secrets Manager.
+
+    Decoded credentials are cached for SECRETS_TTL
+    seconds and reused by warm invocations.
+
+    Parameters
+    ----------
+    secret_name : str
+        The name of the database credentials
+        secret the lambda is trying to connect to.
+        Options:
+        - "production"
+        - "warehouse"
+
+    Raises
+    ------
+    ClientError
+        If the secret name is not found in the Secrets Manager.
+        If there is an unexpected error connecting to the Secrets Manager.
+    KeyError
+        If the credentials object has a missing key.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the database connection credentials.
+        Keys: host, port, user, password, database
+    """
+    cached = _runtime["secrets"].get(secret_name)
+    if cached is not None and cached[0] > monotonic():
+        logger.info("cached connection parameters returned")
+        return cached[1]
+
+    try:
+        client = get_client("secretsmanager", "eu-west-2")
+        response = client.get_secret_value(SecretId=secret_name)
+        secret = json.loads(response["SecretString"])
+
+        connection_params = {
+            "host": secret["host"],
+            "port": secret["port"],
+            "user": secret["user"],
+            "password": secret["password"],
+            "database": secret["database"],
+        }
+        _runtime["secrets"][secret_name] = (
+            monotonic() + SECRETS_TTL,
+            connection_params,
+        )
+        logger.info("connection parameters returned")
+        return connection_params
+
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceNotFoundException":
+            logger.error(f"Secret {secret_name} does not exist.")
+        else:
+            logger.error(f"Error accessing database secret {secret_name}: {e}")
+    except KeyError as e:
+        logger.error(f"Missing key {e} in database credentials.")
+
+
+def get_connection(database_credentials):
+    """
+    Gets connections to the OLTP database.
+
+    Parameters
+    ----------
+    database_credentials : dict
+        Database connection credentials containing
+        user, host, database, port, password.
+
+    Raises
+    ------
+    DatabaseError
+        If there is an error connecting to the database.
+    InterfaceError
+        If there is an interface error.
+
+    Returns
+    -------
+    Connection
+        A successful pg8000 connection object.
+    """
+    try:
+        user = database_credentials["user"]
+        host = database_credentials["host"]
+        database = database_credentials["database"]
+        port = database_credentials["port"]
+        password = database_credentials["password"]
+        conn = Connection(user, host, database, port, password, timeout=5)
+        logger.info("Connection to database has been established.")
+        return conn
+    except DatabaseError as db:
+        logger.error(f"pg8000 - an error has occurred: {db.args[0]['M']}")
+        raise db
+    except InterfaceError as ie:
+        logger.error(f'pg8000 - an error has occurred: \n"{ie}"')
+        raise ie
+    except Exception as exc:
+        logger.error(
+            "An error has occurred when \
+            attempting to connect to the database."
+        )
+        raise exc
+
+
+def get_reusable_connection(database_credentials):
+    """
+    Gets a database connection kept open across warm invocations.
+
+    The cached connection is health checked before it is reused and
+    replaced when the check fails or the credentials have changed.
+
+    Parameters
+    ----------
+    database_credentials : dict
+        Database connection credentials containing
+        user, host, database, port, password.
+
+    Returns
+    -------
+    ReusableConnection
+        The connection, left open by its close method.
+    """
+    cached = _runtime["connection"]
+    if cached is not None:
+        credentials, conn = cached
+        if credentials == database_credentials and is_healthy(conn):
+            logger.info("Warm database connection reused.")
+            return ReusableConnection(conn)
+        _runtime["connection"] = None
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    conn = get_connection(database_credentials)
+    _runtime["connection"] = (dict(database_credentials), conn)
+    return ReusableConnection(conn)
+
+
+def is_healthy(conn):
+    """
+    Checks that a database connection can still run queries.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+
+    Returns
+    -------
+    bool
+        True if SELECT 1 succeeded.
+    """
+    try:
+        # clear a transaction left open by a failed invocation
+        conn.rollback()
+        conn.run("SELECT 1")
+        conn.rollback()
+        return True
+    except Exception as exc:
+        logger.info(f"Warm database connection dropped: {exc}")
+        return False
+
+
+def get_client(service_name, region_name=None):
+    """
+    Gets a boto3 client, created once and reused by warm invocations.
+
+    Parameters
+    ----------
+    service_name : str
+        AWS service name, e.g. "s3".
+    region_name : str, optional
+        Region of the client, the default region if not given.
+
+    Returns
+    -------
+    The boto3 client.
+    """
+    key = (service_name, region_name)
+    with _runtime_lock:
+        if key not in _runtime["clients"]:
+            _runtime["clients"][key] = boto3.client(
+                service_name, region_name=region_name
+            )  # noqa E501
+        return _runtime["clients"][key]
+
+
+class ReusableConnection:
+    """
+    Database connection returned by get_reusable_connection.
+
+    Delegates to the pg8000 connection, except that close rolls back
+    any open transaction and leaves the connection open for the next
+    warm invocation.
+
+    Parameters
+    ----------
+    conn : Connection
+        Database connection instance (pg8000 connect object).
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def close(self):
+        self.conn.rollback()
@@ -0,0 +1,118 @@
+"""
+CloudWatch metrics of a Lambda invocation, printed in Embedded
+Metric Format by emit_metrics at the end of the invocation.
+
+Packaged alongside src/shared/connections.py, see terraform/data.tf.
+"""
+
+import json
+import resource
+from contextlib import contextmanager
+from datetime import datetime as dt
+from threading import Lock
+from time import perf_counter
+
+METRICS_NAMESPACE = "nc-de-project"
+
+# metrics of the current invocation by dimensions, see emit_metrics
+_metrics = {}
+_metrics_lock = Lock()
+
+
+def record_metric(name, value, unit="Count", **dimensions):
+    """
+    Adds a value to a metric of the current invocation.
+
+    Values recorded under the same name and dimensions are summed
+    until the metrics are printed by emit_metrics.
+
+    Parameters
+    ----------
+    name : str
+        Metric name, e.g. "BytesWritten".
+    value : float
+        Value to add.
+    unit : str, optional
+        CloudWatch unit of the metric.
+    **dimensions
+        Dimension names mapped to their values, e.g. Table="staff".
+    """
+    key = tuple(sorted(dimensions.items()))
+    with _metrics_lock:
+        metrics = _metrics.setdefault(key, {})
+        total, _ = metrics.get(name, (0, unit))
+        metrics[name] = (total + value, unit)
+
+
+@contextmanager
+def timed(name, **dimensions):
+    """
+    Records the time spent in a with block as a Milliseconds metric.
+
+    Parameters
+    ----------
+    name : str
+        Metric name, e.g. "S3Latency".
+    **dimensions
+        Dimension names mapped to their values.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (perf_counter() - start) * 1000
+        record_metric(name, elapsed, "Milliseconds", **dimensions)
+
+
+def emit_metrics(function_name):
+    """
+    Prints the metrics of the invocation in CloudWatch Embedded Metric
+    Format and clears them for the next invocation.
+
+    One document is printed per set of dimensions, each also
+    dimensioned by the function name. The peak resident set size
+    of the process is added as PeakRSS.
+
+    Parameters
+    ----------
+    function_name : str
+        Value of the Function dimension, e.g. "ingestion",
+        "transformation" or "loading".
+
+    Returns
+    -------
+    list
+        The printed documents.
+    """
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    record_metric("PeakRSS", peak_rss, "Kilobytes")
+    with _metrics_lock:
+        groups = list(_metrics.items())
+        _metrics.clear()
+
+    timestamp = int(dt.now().timestamp() * 1000)
+    documents = []
+    for key, metrics in groups:
+        dimensions = {"Function": function_name, **dict(key)}
+        document = {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in metrics.items()
+                        ],
+                    }
+                ],
+            },
+            **dimensions,
+            **{name: value for name, (value, _) in metrics.items()},
+        }
+        # printed rather than logged, EMF lines must be bare JSON
+        print(json.dumps(document), flush=True)
+        documents.append(document)
+    return documents
@@ -1,16 +1,48 @@
-import boto3
+import gzip
 import io
 import logging
 import json
 import pandas as pd
+import pyarrow.parquet as pq
+from datetime import date as dt_date
 from datetime import datetime as dt
+from datetime import timedelta
+from decimal import Decimal
 from botocore.exceptions import ClientError
 import os
+from threading import Lock
+from src.shared.connections import get_client
+from src.shared.metrics import emit_metrics, record_metric, timed
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logging.basicConfig()
 logger = logging.getLogger("transformation_lambda")
 logger.setLevel(logging.INFO)
 
+NDJSON_SUFFIX = ".ndjson.json"
+PARQUET_SUFFIX = ".parquet"
+NDJSON_CHUNK_SIZE = 1024 * 1024
+TRANSFORM_ENGINES = ["python", "columnar"]
+# default dates of the precomputed dim_date calendar, see get_calendar
+CALENDAR_START = dt_date(2000, 1, 1)
+CALENDAR_END = dt_date(2050, 12, 31)
+CURRENCY_NAMES = {
+    "GBP": "Pound Sterling",
+    "USD": "United States dollar",
+    "EUR": "Euros",
+}
+
+# latest lookup snapshot read per member name, as (key, records)
+_snapshot_cache = {}
+
+# dim_date rows by date_id, kept for the life of the process
+_calendar = {}
+_calendar_lock = Lock()
+
 
 def lambda_handler(event, context):
     """
@@ -32,34 +64,60 @@ def lambda_handler(event, context):
     Exception
         If there is an error during the processing of the event.
     """
+    try:
+        transform_event(event)
+    finally:
+        emit_metrics("transformation")
+
+
+def transform_event(event):
+    """
+    Transforms the ingested file named in an S3 event and writes the
+    resulting tables to the transformed data bucket.
+
+    Parameters
+    ----------
+    event : dict
+        The S3 event naming the ingested file.
+
+    Returns
+    -------
+    None
+    """
     bucket_name = os.environ["TRANS_BUCKET"]
 
     table_name = get_table_name(event)
-    data = read_s3_json(event)
+    if table_name == "state":
+        logger.info(
+            "Ingestion state file received. No transformation required."
+        )  # noqa E501
+        return
+    with timed("ReadTime", Table=table_name):
+        data = read_s3_json(event)
 
     try:
         transformed_data = None
         OLAP_table_name = None
 
         if table_name == "address":
-            transformed_data = format_dim_location(data)
+            transformed_data = run_formatter(format_dim_location, data)
             OLAP_table_name = "dim_location"
         elif table_name == "staff":
-            transformed_data = format_dim_staff(data)
+            transformed_data = run_formatter(format_dim_staff, data)
             OLAP_table_name = "dim_staff"
         elif table_name == "design":
-            transformed_data = format_dim_design(data)
+            transformed_data = run_formatter(format_dim_design, data)
             OLAP_table_name = "dim_design"
         elif table_name == "currency":
-            transformed_data = format_dim_currency(data)
+            transformed_data = run_formatter(format_dim_currency, data)
             OLAP_table_name = "dim_currency"
         elif table_name == "counterparty":
-            transformed_data = format_dim_counterparty(data)
+            transformed_data = run_formatter(format_dim_counterparty, data)
             OLAP_table_name = "dim_counterparty"
         elif table_name == "sales_order":
             transformed_data = {
-                "date": format_dim_date(data),
-                "sales_order": format_fact_sales_order(data),
+                "date": run_formatter(format_dim_date, data),
+                "sales_order": run_formatter(format_fact_sales_order, data),
             }
 
         if transformed_data:
@@ -83,6 +141,84 @@ def lambda_handler(event, context):
         logger.error(f"Error whilst formatting JSON.{e}")
 
 
+def run_formatter(formatter, data):
+    """
+    Runs a formatter, recording its duration as TransformTime and
+    the number of rows it produced as RowsTransformed.
+
+    Metrics are dimensioned by the name of the format_ function
+    whichever engine runs it, so both engines report the same series.
+
+    Parameters
+    ----------
+    formatter : function
+        One of the format_ functions.
+    data : dict
+        The ingested data passed to the formatter.
+
+    Returns
+    -------
+    list or pandas.DataFrame
+        The formatted data.
+    """
+    name = getattr(formatter, "__name__", "formatter")
+    if get_transform_engine() == "columnar":
+        formatter = get_columnar_formatter(formatter)
+    with timed("TransformTime", Formatter=name):
+        formatted = formatter(data)
+    if hasattr(formatted, "__len__"):
+        record_metric("RowsTransformed", len(formatted), Formatter=name)
+    return formatted
+
+
+def get_transform_engine():
+    """
+    Gets the transformation engine from the
+    TRANSFORM_ENGINE environment variable.
+
+    Raises
+    ------
+    ValueError
+        If the engine is unknown.
+
+    Returns
+    -------
+    str
+        "python" (default) or "columnar".
+    """
+    engine = os.environ.get("TRANSFORM_ENGINE", "python")
+    if engine not in TRANSFORM_ENGINES:
+        raise ValueError(f"Unsupported transform engine {engine}.")
+    return engine
+
+
+def get_columnar_formatter(formatter):
+    """
+    Gets the columnar counterpart of a format_ function.
+
+    Parameters
+    ----------
+    formatter : function
+        One of the format_ functions.
+
+    Returns
+    -------
+    function
+        The columnar_ function producing the same output, or the
+        formatter itself when it has no counterpart.
+    """
+    columnar_formatters = {
+        format_dim_location: columnar_dim_location,
+        format_dim_staff: columnar_dim_staff,
+        format_dim_design: columnar_dim_design,
+        format_dim_currency: columnar_dim_currency,
+        format_dim_counterparty: columnar_dim_counterparty,
+        format_dim_date: columnar_dim_date,
+        format_fact_sales_order: columnar_fact_sales_order,
+    }
+    return columnar_formatters.get(formatter, formatter)
+
+
 def get_table_name(event):
     """
     Extracts the table name to which the incoming JSON data belongs.
@@ -160,12 +296,26 @@ def read_s3_json(event):
         logger.info(f"Bucket is {s3_bucket_name}")
         logger.info(f"Object key is {s3_object_name}")
 
-        if s3_object_name[-4:] != "json":
+        is_parquet = s3_object_name.endswith(PARQUET_SUFFIX)
+        if s3_object_name[-4:] != "json" and not is_parquet:
             raise InvalidFileTypeError
 
-        s3 = boto3.client("s3")
-        content = get_content_from_file(s3, s3_bucket_name, s3_object_name)
-        dict_format_content = json.loads(content)
+        s3 = get_client("s3")
+        if is_parquet:
+            dict_format_content = read_s3_parquet(
+                s3, s3_bucket_name, s3_object_name
+            )  # noqa E501
+        elif s3_object_name.endswith(NDJSON_SUFFIX):
+            dict_format_content = read_s3_ndjson(
+                s3, s3_bucket_name, s3_object_name
+            )  # noqa E501
+        else:
+            content = get_content_from_file(
+                s3, s3_bucket_name, s3_object_name
+            )  # noqa E501
+            dict_format_content = json.loads(content)
+        resolve_snapshots(s3, s3_bucket_name, dict_format_content)
+        decode_columns(dict_format_content)
         logger.info("JSON content retrieved.")
         return dict_format_content
     except KeyError as k:
@@ -186,6 +336,186 @@ def read_s3_json(event):
         raise RuntimeError
 
 
+def read_s3_parquet(client, bucket, object_key):
+    """
+    Reads a Parquet ingestion file into records.
+
+    Typed columns are read straight into native values: timestamps
+    into datetimes, dates into dates and decimals into Decimals,
+    the same values decode_columns gives JSON ingestion files.
+
+    Lookup snapshot references saved in the schema
+    metadata are returned for resolve_snapshots.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket : str
+        The name of the S3 bucket.
+    object_key : str
+        The key of the object to be read.
+
+    Returns
+    -------
+    dict
+        The table name mapped to its records,
+        and "snapshots" if the file references lookups.
+    """
+    data = client.get_object(Bucket=bucket, Key=object_key)
+    arrow_table = pq.read_table(io.BytesIO(data["Body"].read()))
+    records = arrow_table.to_pylist()
+
+    content = {object_key.split("/")[0]: records}
+    metadata = arrow_table.schema.metadata or {}
+    if b"snapshots" in metadata:
+        content["snapshots"] = json.loads(metadata[b"snapshots"])
+    return content
+
+
+def resolve_snapshots(client, bucket, content):
+    """
+    Replaces the lookup snapshot references of a staff or
+    counterparty file with the records they point to.
+
+    Snapshot keys are content-addressed, so a snapshot read
+    once is reused for as long as files reference its key.
+    Files with their lookups embedded are left unchanged.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket : str
+        The name of the ingestion S3 bucket.
+    content : dict
+        File content, updated in place.
+
+    Returns
+    -------
+    dict
+        The file content with its lookups embedded.
+    """
+    for name, key in content.pop("snapshots", {}).items():
+        cached = _snapshot_cache.get(name)
+        if cached is None or cached[0] != key:
+            snapshot = json.loads(get_content_from_file(client, bucket, key))
+            cached = (key, snapshot[name])
+            _snapshot_cache[name] = cached
+            logger.info(f"Snapshot {key} retrieved.")
+        content[name] = cached[1]
+    return content
+
+
+def decode_columns(content):
+    """
+    Decodes the typed columns of a JSON ingestion file into native values.
+
+    Ingestion files carry a "schema" member mapping each table to its
+    column types. ISO strings of "timestamp" and "date" columns are
+    decoded into datetimes and dates, and numbers of "numeric(p,s)"
+    columns into Decimals of their declared scale, so unit_price stays
+    an exact decimal up to the warehouse. Rows of NDJSON files are
+    decoded as they are iterated. Files without a schema are left as
+    they are.
+
+    Parameters
+    ----------
+    content : dict
+        File content, updated in place.
+
+    Returns
+    -------
+    dict
+        The file content with its typed columns decoded.
+    """
+    for table, schema in content.pop("schema", {}).items():
+        records = content.get(table)
+        decoders = {}
+        for column, type_name in schema.items():
+            decoder = get_decoder(type_name)
+            if decoder is not None:
+                decoders[column] = decoder
+        if records is None or not decoders:
+            continue
+        if isinstance(records, NdjsonRows):
+            records.decoders = decoders
+        else:
+            for record in records:
+                decode_record(record, decoders)
+    return content
+
+
+def decode_record(record, decoders):
+    """
+    Decodes the values of a record in place.
+
+    Parameters
+    ----------
+    record : dict
+        A table record.
+    decoders : dict
+        Column names mapped to the functions decoding their values.
+
+    Returns
+    -------
+    dict
+        The decoded record.
+    """
+    for column, decoder in decoders.items():
+        value = record.get(column)
+        # values read from typed files are already native
+        if value is not None and isinstance(value, (str, int, float)):
+            record[column] = decoder(value)
+    return record
+
+
+def get_decoder(type_name):
+    """
+    Gets the function decoding the JSON values of a column type.
+
+    Parameters
+    ----------
+    type_name : str
+        Column type from the file schema, e.g. "numeric(10,2)".
+
+    Returns
+    -------
+    function or None
+        The decoder, or None if values of the type are used as they are.
+    """
+    if type_name == "timestamp":
+        return dt.fromisoformat
+    elif type_name == "date":
+        return lambda value: dt.fromisoformat(value).date()
+    elif type_name.startswith("numeric("):
+        scale = int(type_name[:-1].split(",")[1])
+        exponent = Decimal(1).scaleb(-scale)
+        # repr gives back the digits ingestion wrote,
+        # exact for up to 15 significant digits
+        return lambda value: Decimal(repr(value)).quantize(exponent)
+    return None
+
+
+def split_timestamp(value):
+    """
+    Splits a timestamp into its date and time of day strings.
+
+    Parameters
+    ----------
+    value : datetime.datetime or str
+        The timestamp, or its ISO string in files without a schema.
+
+    Returns
+    -------
+    tuple
+        "YYYY-MM-DD" and "HH:MM:SS" strings.
+    """
+    if isinstance(value, str):
+        return value[:10], value[11:19]
+    return value.date().isoformat(), value.strftime("%H:%M:%S")
+
+
 def get_object_path(records):
     """
     Extracts bucket and object references from the Records field of an event.
@@ -210,6 +540,9 @@ def get_content_from_file(client, bucket, object_key):
     """
     Reads text from the specified file in an S3 bucket.
 
+    Files saved with a gzip or zstd Content-Encoding
+    are decompressed while the body is read.
+
     Parameters
     ----------
     client
@@ -225,10 +558,70 @@ def get_content_from_file(client, bucket, object_key):
         The text content of the file.
     """
     data = client.get_object(Bucket=bucket, Key=object_key)
-    contents = data["Body"].read()
+    contents = get_body_stream(data).read()
     return contents.decode("utf-8")
 
 
+def get_body_stream(response):
+    """
+    Gets the body of a get_object response as a readable
+    stream, decompressing it according to its Content-Encoding.
+
+    Parameters
+    ----------
+    response : dict
+        The get_object response.
+
+    Returns
+    -------
+    Binary file-like object with a read method.
+    """
+    body = response["Body"]
+    encoding = response.get("ContentEncoding")
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=body)
+    elif encoding == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(body)
+    return body
+
+
+def read_s3_ndjson(client, bucket, object_key):
+    """
+    Reads an NDJSON ingestion file as rows that
+    are decoded one at a time while they are iterated.
+
+    Lookup snapshot references and the type schema saved in the
+    object metadata are returned for resolve_snapshots and
+    decode_columns.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket : str
+        The name of the S3 bucket.
+    object_key : str
+        The key of the object to be read.
+
+    Returns
+    -------
+    dict
+        The table name mapped to an NdjsonRows iterable,
+        and "snapshots" if the file references lookups.
+    """
+    response = client.get_object(Bucket=bucket, Key=object_key)
+    table_name = object_key.split("/")[0]
+    content = {
+        table_name: NdjsonRows(client, bucket, object_key, response)
+    }  # noqa E501
+    metadata = response.get("Metadata", {})
+    if "snapshots" in metadata:
+        content["snapshots"] = json.loads(metadata["snapshots"])
+    if "schema" in metadata:
+        content["schema"] = {table_name: json.loads(metadata["schema"])}
+    return content
+
+
 def write_file_to_s3(bucket_name, table_name, parquet_buffer):
     """
     Writes a Parquet file to the transformed data bucket in Amazon S3.
@@ -255,7 +648,7 @@ def write_file_to_s3(bucket_name, table_name, parquet_buffer):
     Exception
         For any other unexpected exceptions.
     """
-    client = boto3.client("s3")
+    client = get_client("s3")
     date = dt.now()
     year = date.year
     month = date.month
@@ -267,9 +660,12 @@ def write_file_to_s3(bucket_name, table_name, parquet_buffer):
     )
 
     try:
-        response = client.put_object(
-            Body=parquet_buffer.getvalue(), Bucket=bucket_name, Key=file_name
-        )
+        body = parquet_buffer.getvalue()
+        record_metric("BytesWritten", len(body), "Bytes", Table=table_name)
+        with timed("S3Latency", Table=table_name):
+            response = client.put_object(
+                Body=body, Bucket=bucket_name, Key=file_name
+            )
         if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
             logger.info(f"Success. File {file_name} saved.")
 
@@ -281,6 +677,35 @@ def write_file_to_s3(bucket_name, table_name, parquet_buffer):
         logger.error(e)
 
 
+def unique_rows(rows):
+    """
+    Drops repeated rows, keeping the first occurrence of each
+    in its original position.
+
+    Rows are looked up in a set of their values as tuples, so
+    each row is checked in constant time rather than against every
+    row kept so far.
+
+    Parameters
+    ----------
+    rows : iterable
+        Lists of hashable values.
+
+    Returns
+    -------
+    list
+        The distinct rows in first-seen order.
+    """
+    seen = set()
+    unique = []
+    for row in rows:
+        key = tuple(row)
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    return unique
+
+
 def format_dim_location(address_json):
     """
     Formats the address data ready to be inserted
@@ -301,12 +726,10 @@ def format_dim_location(address_json):
     -------
         A list of lists.
     """
-    dim_location = []
     try:
         addresses = address_json["address"]
-        for address in addresses:
-            insert = True
-            row = [
+        dim_location = unique_rows(
+            [
                 address["address_id"],
                 address["address_line_1"],
                 address["address_line_2"],
@@ -316,11 +739,8 @@ def format_dim_location(address_json):
                 address["country"],
                 address["phone"],
             ]
-            for list in dim_location:
-                if list == row:
-                    insert = False
-            if insert is True:
-                dim_location.append(row)
+            for address in addresses
+        )
         return dim_location
     except KeyError as ke:
         logger.error(f"KeyError: missing key {ke}.")
@@ -332,6 +752,10 @@ def format_dim_staff(staff_data):
     """
     formats the data to populate the dim_staff table
 
+    Staff are joined to their department through a dict of the
+    departments by department_id. Staff without a valid department
+    are rejected, logged and counted in the RowsRejected metric.
+
     Parameters
     ----------
     json object containing the data from the staff table and department table.
@@ -354,34 +778,36 @@ def format_dim_staff(staff_data):
         if "staff" not in staff_data.keys():
             raise KeyError("Incorrect staff data provided")
 
-        staff = [x.copy() for x in staff_data["staff"]]
-        department = [x.copy() for x in staff_data["department"]]
-
-        for s in staff:
-            for d in department:
-                if s["department_id"] == d["department_id"]:
-                    s["department"] = d["department_name"]
-                    s["location"] = d["location"]
+        # the last department of a repeated department_id wins
+        departments = {
+            d["department_id"]: d for d in staff_data["department"]
+        }  # noqa E501
 
-        for s in staff:
-            if "department" not in s.keys():
+        f_staff = []
+        rejected = []
+        for s in staff_data["staff"]:
+            d = departments.get(s["department_id"])
+            if d is None:
                 logger.warning(
                     f"staff_id {s['staff_id']}: no valid department_id "
                 )  # noqa E501
-                staff.remove(s)
-
-        f_staff = [
-            [
-                s["staff_id"],
-                s["first_name"],
-                s["last_name"],
-                s["department"],
-                s["location"],
-                s["email_address"],
-            ]
-            for s in staff
-        ]
+                rejected.append(s)
+                continue
+            f_staff.append(
+                [
+                    s["staff_id"],
+                    s["first_name"],
+                    s["last_name"],
+                    d["department_name"],
+                    d["location"],
+                    s["email_address"],
+                ]
+            )
 
+        if rejected:
+            record_metric(
+                "RowsRejected", len(rejected), Formatter="format_dim_staff"
+            )  # noqa E501
         logger.info("dim_staff data formatted sucessfully")
         return f_staff
     except KeyError as e:
@@ -474,12 +900,6 @@ def format_dim_currency(currency_table):
         currency_code
         currency_name
     """
-    currency_name = {
-        "GBP": "Pound Sterling",
-        "USD": "United States dollar",
-        "EUR": "Euros",
-    }
-
     try:
         content = currency_table["currency"]
 
@@ -489,7 +909,7 @@ def format_dim_currency(currency_table):
                 {
                     "currency_id": row["currency_id"],
                     "currency_code": row["currency_code"],
-                    "currency_name": currency_name[row["currency_code"]],
+                    "currency_name": CURRENCY_NAMES[row["currency_code"]],
                 }
             )
 
@@ -516,6 +936,10 @@ def format_dim_counterparty(table):
     """
     Formats the data to populate the dim_staff table
 
+    Counterparties are joined to their legal address through an index
+    of the addresses by address_id. Counterparties whose legal address
+    is missing are left out and reported in a warning.
+
     Parameters
     ----------
         json with data from the counterparty table and address table.
@@ -537,45 +961,37 @@ def format_dim_counterparty(table):
         # read counterparty table content from the ingestion lambda output
         updpated_cp = table["counterparty"]
         address_lookup = table["address"]
-        cp_dict = []
+        # index the addresses once, the first of a repeated id wins
+        address_index = {}
+        for address in address_lookup:
+            address_index.setdefault(address["address_id"], address)
+
+        list_of_lists = []
+        missing = []
         for cp in updpated_cp:
-            # searching address from address_look_up_table
-            address = [
-                r
-                for r in address_lookup
-                if r["address_id"] == cp["legal_address_id"]  # noqa E501
-            ][0]
+            address = address_index.get(cp["legal_address_id"])
+            if address is None:
+                missing.append(cp["counterparty_id"])
+                continue
             # formating the dim table
-            cp_dict.append(
-                {
-                    "cp_id": cp["counterparty_id"],
-                    "cp_legal_name": cp["counterparty_legal_name"],
-                    "cp_legal_address_line_1": address["address_line_1"],
-                    "cp_legal_address_line_2": address["address_line_2"],
-                    "cp_legal_district": address["district"],
-                    "cp_legal_city": address["city"],
-                    "cp_legal_postal_code": address["postal_code"],
-                    "cp_legal_country": address["country"],
-                    "cp_legal_phone_number": address["phone"],
-                }
+            list_of_lists.append(
+                [
+                    cp["counterparty_id"],
+                    cp["counterparty_legal_name"],
+                    address["address_line_1"],
+                    address["address_line_1"],
+                    address["district"],
+                    address["city"],
+                    address["postal_code"],
+                    address["country"],
+                    address["phone"],
+                ]
             )
 
-            list_of_lists = []
-            for row in cp_dict:
-                list_of_lists.append(
-                    [
-                        row["cp_id"],
-                        row["cp_legal_name"],
-                        row["cp_legal_address_line_1"],
-                        row["cp_legal_address_line_1"],
-                        row["cp_legal_district"],
-                        row["cp_legal_city"],
-                        row["cp_legal_postal_code"],
-                        row["cp_legal_country"],
-                        row["cp_legal_phone_number"],
-                    ]
-                )
-
+        if missing:
+            logger.warning(
+                f"No legal address found for counterparties {missing}."
+            )  # noqa E501
         return list_of_lists
 
     except KeyError as k:
@@ -586,6 +1002,132 @@ def format_dim_counterparty(table):
         raise RuntimeError
 
 
+def get_day(value):
+    """
+    Gets the day of a date or timestamp value, without parsing.
+
+    Parameters
+    ----------
+    value : datetime.datetime, datetime.date or str
+        The value.
+
+    Returns
+    -------
+    datetime.date or str
+        The date, or the "YYYY-MM-DD" slice of an ISO string.
+        Either converts to its date_id with str.
+    """
+    if isinstance(value, str):
+        return value[:10]
+    elif isinstance(value, dt):
+        return value.date()
+    return value
+
+
+def get_calendar_range():
+    """
+    Gets the dates of the precomputed dim_date calendar from the
+    TRANSFORM_CALENDAR_START and TRANSFORM_CALENDAR_END environment
+    variables, as "YYYY-MM-DD" dates.
+
+    Raises
+    ------
+    ValueError
+        If a date is invalid or the range is empty.
+
+    Returns
+    -------
+    tuple
+        The first and last datetime.date of the calendar,
+        CALENDAR_START and CALENDAR_END by default.
+    """
+    start = os.environ.get("TRANSFORM_CALENDAR_START")
+    end = os.environ.get("TRANSFORM_CALENDAR_END")
+    start = dt_date.fromisoformat(start) if start else CALENDAR_START
+    end = dt_date.fromisoformat(end) if end else CALENDAR_END
+    if start > end:
+        raise ValueError(f"Calendar start {start} is after its end {end}.")
+    return start, end
+
+
+def get_calendar():
+    """
+    Gets the dim_date rows of every date in the range from
+    get_calendar_range, computed on first use and then kept for
+    the life of the process.
+
+    Returns
+    -------
+    dict
+        dim_date rows by date_id.
+    """
+    with _calendar_lock:
+        if not _calendar:
+            date, end = get_calendar_range()
+            while date <= end:
+                row = make_date_row(date)
+                _calendar[row[0]] = row
+                date += timedelta(days=1)
+    return _calendar
+
+
+def get_date_row(date_id):
+    """
+    Looks a dim_date row up in the calendar.
+
+    Dates outside the calendar range are computed on first use
+    and added to the calendar.
+
+    Parameters
+    ----------
+    date_id : str
+        The "YYYY-MM-DD" date.
+
+    Raises
+    ------
+    ValueError
+        If date_id is not a valid date.
+
+    Returns
+    -------
+    list
+        The dim_date row.
+    """
+    calendar = get_calendar()
+    row = calendar.get(date_id)
+    if row is None:
+        row = make_date_row(dt_date.fromisoformat(date_id))
+        calendar[date_id] = row
+    return row
+
+
+def make_date_row(date):
+    """
+    Computes the dim_date row of a date.
+
+    Parameters
+    ----------
+    date : datetime.date
+        The date.
+
+    Returns
+    -------
+    list
+        date_id, year, month, day, day_of_week, day_name,
+        month_name and quarter.
+    """
+    return [
+        date.strftime("%Y-%m-%d"),
+        date.year,
+        date.month,
+        date.day,
+        date.weekday() + 1,
+        date.strftime("%A"),
+        date.strftime("%B"),
+        1 + (date.month - 1) // 3,
+    ]
+
+
 def format_dim_date(sales_order_table):
     """
      Parameters
@@ -616,51 +1158,316 @@ def format_dim_date(sales_order_table):
         # read updated content from input table
         content = sales_order_table["sales_order"]
 
-        # extract all date objects from table
-        all_dates = []
+        # collect the distinct days in first-seen order
+        days = {}
         for row in content:
-            all_dates += [
-                dt.strptime(row["agreed_delivery_date"], "%Y-%m-%d"),
-                dt.strptime(row["agreed_payment_date"], "%Y-%m-%d"),
-                dt.strptime(row["created_at"][:10], "%Y-%m-%d"),
-                dt.strptime(row["last_updated"][:10], "%Y-%m-%d"),
-            ]
+            days[get_day(row["agreed_delivery_date"])] = None
+            days[get_day(row["agreed_payment_date"])] = None
+            days[get_day(row["created_at"])] = None
+            days[get_day(row["last_updated"])] = None
+        date_ids = dict.fromkeys(str(day) for day in days)
+
+        # copies, so the cached calendar rows are never handed out
+        list_list = [list(get_date_row(date_id)) for date_id in date_ids]
+        return list_list
 
-        # remove the duplicate date
-        remove_duplicate = list(set(all_dates))
+    except KeyError as k:
+        logger.error(f"Error retrieving data, {k}")
 
-        # formatting
-        result = []
-        for date in remove_duplicate:
-            result.append(
-                {
-                    "date_id": date.strftime("%Y-%m-%d"),
-                    "year": date.year,
-                    "month": date.month,
-                    "day": date.day,
-                    "day_of_week": date.weekday() + 1,
-                    "day_name": date.strftime("%A"),
-                    "month_name": date.strftime("%B"),
-                    "quarter": 1 + (date.month - 1) // 3,
-                }
-            )
+    except Exception as e:
+        logger.error(e)
+        raise RuntimeError
 
-        # transfer to list of list
-        list_list = []
-        for row in result:
-            list_list.append(
-                [
-                    row["date_id"],
-                    row["year"],
-                    row["month"],
-                    row["day"],
-                    row["day_of_week"],
-                    row["day_name"],
-                    row["month_name"],
-                    row["quarter"],
-                ]
-            )
-        return list_list
+
+def format_fact_sales_order(sales_order_json):
+    """
+    Formats the sales_order data ready to be inserted
+    into the fact_sales_order table.
+
+    Parameters
+    ----------
+        sales_order_json: JSON, required.
+            The JSON file to be transformed into parquet.
+
+    Raises
+    ------
+        KeyError:
+        If the sales_order key is missing.
+        If any of the columns are missing.
+
+    Returns
+    -------
+        A list of lists.
+    """
+    try:
+        json = sales_order_json["sales_order"]
+        sales_order_parquet = unique_rows(
+            get_sales_order_row(sale) for sale in json
+        )
+        return sales_order_parquet
+    except KeyError as ke:
+        logger.error(f"KeyError: missing key {ke}.")
+    except Exception as e:
+        logger.error(f"Unexpected Error: {e}")
+
+
+def get_sales_order_row(sale):
+    """
+    Formats a sales_order record as a fact_sales_order row.
+
+    Parameters
+    ----------
+    sale : dict
+        A sales_order record.
+
+    Returns
+    -------
+    list
+        The values of the row.
+    """
+    created_date, created_time = split_timestamp(sale["created_at"])
+    last_updated_date, last_updated_time = split_timestamp(
+        sale["last_updated"]
+    )  # noqa E501
+    return [
+        sale["sales_order_id"],
+        created_date,
+        created_time,
+        last_updated_date,
+        last_updated_time,
+        sale["staff_id"],
+        sale["counterparty_id"],
+        sale["units_sold"],
+        sale["unit_price"],
+        sale["currency_id"],
+        sale["design_id"],
+        sale["agreed_payment_date"],
+        sale["agreed_delivery_date"],
+        sale["agreed_delivery_location_id"],
+    ]
+
+
+def get_frame(records, columns):
+    """
+    Builds a DataFrame of the given columns of ingested records.
+
+    Values are kept as the Python objects they were decoded to, so
+    numerics stay exact and rows come out of the frame unchanged.
+
+    Columns are checked in the order given. Callers list them in
+    the order the matching format_ function reads them, so both
+    engines report the same missing key.
+
+    Parameters
+    ----------
+    records : iterable
+        The records of an ingested table, as dicts.
+    columns : list
+        The columns to keep.
+
+    Raises
+    ------
+    KeyError
+        If a column is missing from the records.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A frame of object columns.
+    """
+    records = list(records)
+    if not records:
+        return pd.DataFrame(columns=columns, dtype=object)
+    frame = pd.DataFrame(records, dtype=object)
+    for column in columns:
+        if column not in frame.columns:
+            raise KeyError(column)
+    return frame[columns]
+
+
+def to_timestamps(values):
+    """
+    Parses a column of timestamps, dates or their ISO strings.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        The column.
+
+    Returns
+    -------
+    pandas.Series
+        The values as datetime64.
+    """
+    return pd.to_datetime(values, format="ISO8601")
+
+
+def split_timestamps(values):
+    """
+    Columnar counterpart of split_timestamp.
+
+    The timestamps are formatted through numpy's ISO strings,
+    which is much faster than the datetime accessor's strftime.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        A column of timestamps or their ISO strings.
+
+    Returns
+    -------
+    tuple
+        Series of "YYYY-MM-DD" and "HH:MM:SS" strings.
+    """
+    timestamps = to_timestamps(values).to_numpy().astype("datetime64[s]")
+    iso = pd.Series(timestamps.astype(str), index=values.index, dtype=object)
+    return iso.str[:10], iso.str[11:19]
+
+
+def columnar_dim_location(address_json):
+    """
+    Columnar counterpart of format_dim_location.
+
+    Parameters
+    ----------
+        address_json: JSON, required.
+            The JSON file to be transformed into parquet.
+
+    Raises
+    ------
+        KeyError:
+        If the address key is missing.
+        If any of the columns are missing.
+
+    Returns
+    -------
+        A list of lists.
+    """
+    try:
+        addresses = get_frame(
+            address_json["address"],
+            [
+                "address_id",
+                "address_line_1",
+                "address_line_2",
+                "district",
+                "city",
+                "postal_code",
+                "country",
+                "phone",
+            ],
+        )
+        return addresses.drop_duplicates().values.tolist()
+    except KeyError as ke:
+        logger.error(f"KeyError: missing key {ke}.")
+    except Exception as e:
+        logger.error(f"Unexpected Error: {e}")
+
+
+def columnar_dim_staff(staff_data):
+    """
+    Columnar counterpart of format_dim_staff, joining staff to
+    their department with a left merge.
+
+    Parameters
+    ----------
+    json object containing the data from the staff table and department table.
+
+    Raises
+    ------
+        AttributeError if data not in dictionary format
+        KeyError if incorrect staff data provided
+        Warning if a staff record cannot be formatted correctly
+
+    Returns
+    ------
+    list of lists
+        each list contains the staff_id, first_name,\
+        last_name, department, location, email address
+    """
+    try:
+        if "staff" not in staff_data.keys():
+            raise KeyError("Incorrect staff data provided")
+
+        staff = get_frame(
+            staff_data["staff"],
+            [
+                "department_id",
+                "staff_id",
+                "first_name",
+                "last_name",
+                "email_address",
+            ],
+        )
+        departments = get_frame(
+            staff_data["department"],
+            ["department_id", "department_name", "location"],
+        ).drop_duplicates("department_id", keep="last")
+        joined = staff.merge(
+            departments, on="department_id", how="left", indicator=True
+        )  # noqa E501
+
+        matched = joined["_merge"] == "both"
+        rejected = joined.loc[~matched, "staff_id"].tolist()
+        for staff_id in rejected:
+            logger.warning(f"staff_id {staff_id}: no valid department_id ")
+        if rejected:
+            record_metric(
+                "RowsRejected", len(rejected), Formatter="format_dim_staff"
+            )  # noqa E501
+
+        f_staff = joined.loc[
+            matched,
+            [
+                "staff_id",
+                "first_name",
+                "last_name",
+                "department_name",
+                "location",
+                "email_address",
+            ],
+        ].values.tolist()
+
+        logger.info("dim_staff data formatted sucessfully")
+        return f_staff
+    except KeyError as e:
+        logger.error(f"{e}")
+    except AttributeError as e:
+        logger.error(f"{e}")
+    except Exception as e:
+        logger.error(f"An unexpected Error Occured: {e}")
+
+
+def columnar_dim_design(design_table):
+    """
+    Columnar counterpart of format_dim_design.
+
+    Parameters
+    ----------
+    design_table
+        type:dict
+            key: table name
+            value: updated content (list of dictionary)
+
+    Returns:
+    --------
+        type: list of list
+            for each row:
+                design_id: id (int)
+                design_name:name of design (str)
+                file_location:path of file (str)
+                file_name:name of file (str)
+    Raises
+    ------
+        RuntimeError
+        KeyError
+    """
+    try:
+        designs = get_frame(
+            design_table["design"],
+            ["design_id", "design_name", "file_location", "file_name"],
+        )
+        return designs.values.tolist()
 
     except KeyError as k:
         logger.error(f"Error retrieving data, {k}")
@@ -670,10 +1477,195 @@ def format_dim_date(sales_order_table):
         raise RuntimeError
 
 
-def format_fact_sales_order(sales_order_json):
+def columnar_dim_currency(currency_table):
     """
-    Formats the sales_order data ready to be inserted
-    into the fact_sales_order table.
+    Columnar counterpart of format_dim_currency.
+
+    Parameters
+    ----------
+    currency_table json
+
+    Raises
+    ------
+    KeyError: Will return an error message, if the
+        passed table has an incorrect key.
+    RuntimeError: Returns an error when passed a wrong
+        argument
+
+    Returns
+    -------
+    A successful list of lists, containing a correctly formatted
+    dim_currency table with the column names:
+        currency_id
+        currency_code
+        currency_name
+    """
+    try:
+        currencies = get_frame(
+            currency_table["currency"], ["currency_id", "currency_code"]
+        )  # noqa E501
+        codes = currencies["currency_code"]
+        unknown = ~codes.isin(list(CURRENCY_NAMES))
+        if unknown.any():
+            raise KeyError(codes[unknown].iloc[0])
+        currencies = currencies.assign(currency_name=codes.map(CURRENCY_NAMES))
+        return currencies.values.tolist()
+
+    except KeyError as k:
+        logger.error(f"Error retrieving data, {k}")
+
+    except Exception as e:
+        logger.error(e)
+        raise RuntimeError
+
+
+def columnar_dim_counterparty(table):
+    """
+    Columnar counterpart of format_dim_counterparty, joining
+    counterparties to their legal address with a left merge.
+
+    Parameters
+    ----------
+        json with data from the counterparty table and address table.
+
+    Raises
+    ------
+        KeyError
+        if incorrect counterpary data or address data provided
+        RuntimeError
+        if an unhandled exception occurs in the try block.
+
+    Returns
+    ------
+    list of lists
+        each list contains everything from the updated counterparty dict
+    """
+
+    try:
+        addresses = get_frame(
+            table["address"],
+            [
+                "address_id",
+                "address_line_1",
+                "district",
+                "city",
+                "postal_code",
+                "country",
+                "phone",
+            ],
+        ).drop_duplicates("address_id")
+        counterparties = get_frame(
+            table["counterparty"],
+            ["legal_address_id", "counterparty_id", "counterparty_legal_name"],
+        )
+        joined = counterparties.merge(
+            addresses,
+            left_on="legal_address_id",
+            right_on="address_id",
+            how="left",
+            indicator=True,
+        )
+
+        matched = joined["_merge"] == "both"
+        missing = joined.loc[~matched, "counterparty_id"].tolist()
+        if missing:
+            logger.warning(
+                f"No legal address found for counterparties {missing}."
+            )  # noqa E501
+        return joined.loc[
+            matched,
+            [
+                "counterparty_id",
+                "counterparty_legal_name",
+                "address_line_1",
+                "address_line_1",
+                "district",
+                "city",
+                "postal_code",
+                "country",
+                "phone",
+            ],
+        ].values.tolist()
+
+    except KeyError as k:
+        logger.error(f"Error retrieving data, {k}")
+
+    except Exception as e:
+        logger.error(e)
+        raise RuntimeError
+
+
+def columnar_dim_date(sales_order_table):
+    """
+    Columnar counterpart of format_dim_date, with the date
+    attributes taken from the datetime accessors.
+
+    Dates are returned in the order they are first seen.
+
+    Parameters
+    ----------
+        sales_order_table
+        type:dict
+            key: table name
+            value: updated content (list of dictionary)
+
+    Returns
+    -------
+        type: list of list
+            for each row:
+                date_id:datetime (date ('%Y-%m-%d'))
+                year:year of the date (int)
+                month:month of the date (int)
+                day:day of the date (int)
+                day_of_week:weekday of date,1 for monday,7 for sunday(int)
+                day_name:weekday name of the date (str)
+                month_name: month name of the date (str)
+                quarter: quarter of the date (int)
+    Raises
+    ------
+        RuntimeError
+        KeyError
+    """
+    try:
+        columns = [
+            "agreed_delivery_date",
+            "agreed_payment_date",
+            "created_at",
+            "last_updated",
+        ]
+        sales_orders = get_frame(sales_order_table["sales_order"], columns)
+        # a stable sort on the row index interleaves the columns row by
+        # row, so the dates keep the first-seen order of format_dim_date
+        dates = pd.concat(
+            [to_timestamps(sales_orders[column]) for column in columns]
+        ).sort_index(kind="stable")
+        dates = dates.dt.normalize().drop_duplicates().reset_index(drop=True)
+
+        dim_date = pd.DataFrame(
+            {
+                "date_id": dates.dt.strftime("%Y-%m-%d"),
+                "year": dates.dt.year,
+                "month": dates.dt.month,
+                "day": dates.dt.day,
+                "day_of_week": dates.dt.dayofweek + 1,
+                "day_name": dates.dt.day_name(),
+                "month_name": dates.dt.month_name(),
+                "quarter": dates.dt.quarter,
+            }
+        )
+        return dim_date.values.tolist()
+
+    except KeyError as k:
+        logger.error(f"Error retrieving data, {k}")
+
+    except Exception as e:
+        logger.error(e)
+        raise RuntimeError
+
+
+def columnar_fact_sales_order(sales_order_json):
+    """
+    Columnar counterpart of format_fact_sales_order.
 
     Parameters
     ----------
@@ -690,43 +1682,110 @@ def format_fact_sales_order(sales_order_json):
     -------
         A list of lists.
     """
-    sales_order_parquet = []
     try:
-        json = sales_order_json["sales_order"]
-        for sale in json:
-            insert = True
-            created_date = sale["created_at"][:10]
-            created_time = sale["created_at"][11:19]
-            last_updated_date = sale["last_updated"][:10]
-            last_updated_time = sale["last_updated"][11:19]
-            row = [
-                sale["sales_order_id"],
-                created_date,
-                created_time,
-                last_updated_date,
-                last_updated_time,
-                sale["staff_id"],
-                sale["counterparty_id"],
-                sale["units_sold"],
-                sale["unit_price"],
-                sale["currency_id"],
-                sale["design_id"],
-                sale["agreed_payment_date"],
-                sale["agreed_delivery_date"],
-                sale["agreed_delivery_location_id"],
-            ]
-            for list in sales_order_parquet:
-                if list == row:
-                    insert = False
-            if insert is True:
-                sales_order_parquet.append(row)
-        return sales_order_parquet
+        sales_orders = get_frame(
+            sales_order_json["sales_order"],
+            [
+                "created_at",
+                "last_updated",
+                "sales_order_id",
+                "staff_id",
+                "counterparty_id",
+                "units_sold",
+                "unit_price",
+                "currency_id",
+                "design_id",
+                "agreed_payment_date",
+                "agreed_delivery_date",
+                "agreed_delivery_location_id",
+            ],
+        )
+        created_date, created_time = split_timestamps(
+            sales_orders["created_at"]
+        )  # noqa E501
+        last_updated_date, last_updated_time = split_timestamps(
+            sales_orders["last_updated"]
+        )  # noqa E501
+        fact_sales_order = pd.DataFrame(
+            {
+                "sales_order_id": sales_orders["sales_order_id"],
+                "created_date": created_date,
+                "created_time": created_time,
+                "last_updated_date": last_updated_date,
+                "last_updated_time": last_updated_time,
+                **{
+                    column: sales_orders[column]
+                    for column in [
+                        "staff_id",
+                        "counterparty_id",
+                        "units_sold",
+                        "unit_price",
+                        "currency_id",
+                        "design_id",
+                        "agreed_payment_date",
+                        "agreed_delivery_date",
+                        "agreed_delivery_location_id",
+                    ]
+                },
+            }
+        )
+        return fact_sales_order.drop_duplicates().values.tolist()
     except KeyError as ke:
         logger.error(f"KeyError: missing key {ke}.")
     except Exception as e:
         logger.error(f"Unexpected Error: {e}")
 
 
+class NdjsonRows:
+    """
+    Iterable over the rows of an NDJSON file in S3.
+
+    Rows are read from the body stream in chunks, so only one
+    chunk is held in memory at a time. Every iteration after
+    the first reads the object again.
+
+    Parameters
+    ----------
+    client
+        An S3 client object.
+    bucket : str
+        The name of the S3 bucket.
+    object_key : str
+        The key of the object to be read.
+    response : dict, optional
+        An unread get_object response used by the first iteration.
+    """
+
+    def __init__(self, client, bucket, object_key, response=None):
+        self.client = client
+        self.bucket = bucket
+        self.object_key = object_key
+        self.response = response
+        # set by decode_columns from the file schema
+        self.decoders = {}
+
+    def __iter__(self):
+        response = self.response
+        self.response = None
+        if response is None:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.object_key
+            )  # noqa E501
+        stream = get_body_stream(response)
+        pending = b""
+        while True:
+            chunk = stream.read(NDJSON_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield decode_record(json.loads(line), self.decoders)
+        if pending:
+            yield decode_record(json.loads(pending), self.decoders)
+
+
 class InvalidFileTypeError(Exception):
     """Traps error where file type is not json."""
 
@@ -4,20 +4,62 @@ data "aws_region" "current" {}
 
 data "archive_file" "ingestion_lambda_code_zip" {
   type        = "zip"
-  source_file = "${path.module}/../src/ingestion_lambda/ingestion_lambda.py"
   output_path = "${path.module}/../src/ingestion_lambda/ingestion_lambda.zip"
+
+  source {
+    content  = file("${path.module}/../src/ingestion_lambda/ingestion_lambda.py")
+    filename = "ingestion_lambda.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/shared/connections.py")
+    filename = "src/shared/connections.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/shared/metrics.py")
+    filename = "src/shared/metrics.py"
+  }
 }
 
 data "archive_file" "transformation_lambda_code_zip" {
   type        = "zip"
-  source_file = "${path.module}/../src/transformation_lambda/transformation_lambda.py"
   output_path = "${path.module}/../src/transformation_lambda/transformation_lambda.zip"
+
+  source {
+    content  = file("${path.module}/../src/transformation_lambda/transformation_lambda.py")
+    filename = "transformation_lambda.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/shared/connections.py")
+    filename = "src/shared/connections.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/shared/metrics.py")
+    filename = "src/shared/metrics.py"
+  }
 }
 
 data "archive_file" "loading_lambda_code_zip" {
   type        = "zip"
-  source_file = "${path.module}/../src/loading_lambda/loading_lambda.py"
   output_path = "${path.module}/../src/loading_lambda/loading_lambda.zip"
+
+  source {
+    content  = file("${path.module}/../src/loading_lambda/loading_lambda.py")
+    filename = "loading_lambda.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/shared/connections.py")
+    filename = "src/shared/connections.py"
+  }
+
+  source {
+    content  = file("${path.module}/../src/shared/metrics.py")
+    filename = "src/shared/metrics.py"
+  }
 }
 
 resource "aws_s3_object" "ingestion_lambda_code_upload" {
@@ -69,6 +69,8 @@ data "aws_iam_policy_document" "ingestion_lambda_s3_ingestion_bucket_document" {
       "s3-object-lambda:GetObject",
       "s3-object-lambda:PutObject",
       "s3:PutObject",
+      "s3:DeleteObject",
+      "s3:AbortMultipartUpload",
       "s3:ListBucket"
     ]
     resources = [
@@ -8,5 +8,14 @@ resource "aws_lambda_function" "ingestion_lambda" {
   s3_key           = "ingestion_lambda/ingestion_lambda.zip"
   layers           = ["arn:aws:lambda:eu-west-2:336392948345:layer:AWSSDKPandas-Python311:2"]
   source_code_hash = resource.aws_s3_object.ingestion_lambda_code_upload.source_hash
+  environment {
+    variables = {
+      INGESTION_MODE            = var.ingestion_mode
+      INGESTION_BATCH_SIZE      = var.ingestion_batch_size
+      INGESTION_MAX_CONNECTIONS = var.ingestion_max_connections
+      INGESTION_PAGE_SIZE       = var.ingestion_page_size
+      INGESTION_COMPRESSION     = var.ingestion_compression
+      INGESTION_FORMAT          = var.ingestion_format
+    }
+  }
 }
-
@@ -10,7 +10,10 @@ resource "aws_lambda_function" "transformation_lambda" {
   source_code_hash = resource.aws_s3_object.transformation_lambda_code_upload.source_hash
   environment {
     variables = {
-      TRANS_BUCKET = "${aws_s3_bucket.transformed_data_bucket.bucket}"
+      TRANS_BUCKET             = "${aws_s3_bucket.transformed_data_bucket.bucket}"
+      TRANSFORM_ENGINE         = var.transform_engine
+      TRANSFORM_CALENDAR_START = var.transform_calendar_start
+      TRANSFORM_CALENDAR_END   = var.transform_calendar_end
     }
   }
 }
\ No newline at end of file
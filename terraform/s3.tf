@@ -6,6 +6,21 @@ resource "aws_s3_bucket" "ingestion_data_bucket" {
   bucket_prefix = "nc-de-project-ingested-data-bucket-"
 }
 
+resource "aws_s3_bucket_lifecycle_configuration" "ingestion_bucket_lifecycle" {
+  bucket = aws_s3_bucket.ingestion_data_bucket.id
+
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
 resource "aws_s3_bucket" "transformed_data_bucket" {
   bucket_prefix = "nc-de-project-transformed-data-"
 }
@@ -18,6 +33,12 @@ resource "aws_s3_bucket_notification" "ingestion_bucket_notification" {
     events              = ["s3:ObjectCreated:*"]
     filter_suffix       = ".json"
   }
+
+  lambda_function {
+    lambda_function_arn = aws_lambda_function.transformation_lambda.arn
+    events              = ["s3:ObjectCreated:*"]
+    filter_suffix       = ".parquet"
+  }
   depends_on = [aws_lambda_permission.tranformation_lambda_invoke_permission]
 }
 
@@ -11,4 +11,49 @@ variable "transformation_lambda" {
 variable "warehouse_loading_lambda" {
   type    = string
   default = "warehouse_loading_lambda"
-}
\ No newline at end of file
+}
+
+variable "ingestion_mode" {
+  type    = string
+  default = "batch"
+}
+
+variable "ingestion_batch_size" {
+  type    = number
+  default = 10000
+}
+
+variable "ingestion_max_connections" {
+  type    = number
+  default = 4
+}
+
+variable "ingestion_page_size" {
+  type    = number
+  default = 50000
+}
+
+variable "ingestion_compression" {
+  type    = string
+  default = "gzip"
+}
+
+variable "ingestion_format" {
+  type    = string
+  default = "json"
+}
+
+variable "transform_engine" {
+  type    = string
+  default = "python"
+}
+
+variable "transform_calendar_start" {
+  type    = string
+  default = "2000-01-01"
+}
+
+variable "transform_calendar_end" {
+  type    = string
+  default = "2050-12-31"
+}
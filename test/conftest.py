@@ -0,0 +1,56 @@
+from src.ingestion_lambda import ingestion_lambda
+from src.transformation_lambda import transformation_lambda
+from src.shared import connections, metrics
+from src.transformation_lambda.transformation_lambda import (
+    TRANSFORM_ENGINES,
+)
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_warm_runtime():
+    """
+    Starts every test from a cold Lambda execution environment,
+    so cached clients are created under the test's moto mock
+    and no test sees a column catalog or metrics left by another.
+    """
+    connections._runtime["clients"].clear()
+    connections._runtime["secrets"].clear()
+    connections._runtime["connection"] = None
+    metrics._metrics.clear()
+    ingestion_lambda._catalog.update(
+        {"fingerprint": None, "columns": {}, "types": {}, "keys": None}
+    )
+    yield
+
+
+def pytest_generate_tests(metafunc):
+    """
+    Runs the tests of the format_ functions against both
+    transformation engines.
+    """
+    module_name = metafunc.module.__name__.split(".")[-1]
+    if module_name.startswith("test_format_"):
+        metafunc.parametrize(
+            "transform_engine", TRANSFORM_ENGINES, indirect=True
+        )  # noqa E501
+
+
+@pytest.fixture(autouse=True)
+def transform_engine(request, monkeypatch):
+    """
+    Swaps the format_ functions imported by a test module for
+    their columnar counterparts when testing the columnar engine.
+    """
+    engine = getattr(request, "param", "python")
+    if engine == "columnar":
+        for name in dir(request.module):
+            formatter = getattr(request.module, name)
+            if not callable(formatter):
+                continue
+            columnar = transformation_lambda.get_columnar_formatter(
+                formatter
+            )  # noqa E501
+            if columnar is not formatter:
+                monkeypatch.setattr(request.module, name, columnar)
+    return engine
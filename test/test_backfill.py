@@ -0,0 +1,239 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    backfill,
+    get_time_slices,
+    get_watermarks,
+    main,
+    _snapshots,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import json
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+ROWS = {
+    "design": [[1, dt(2023, 1, 5)], [2, dt(2023, 2, 10)]],
+    "currency": [[1, dt(2023, 1, 20)]],
+}
+
+
+def make_mock_conn(queried=None):
+    """
+    Mock connection serving the ROWS of each table whose
+    last_updated falls within the queried time slice.
+    """
+
+    def mock_run(sql, slice_start=None, slice_end=None, date=None):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                [table, column]
+                for table in [*ROWS, "address", "department"]
+                for column in ["id", "last_updated"]
+            ]
+        elif "localtimestamp" in sql:
+            return [[dt(2023, 3, 1)]]
+        elif "last_updated <= :slice_end" in sql:
+            table = sql.split("FROM ")[1].split()[0]
+            if queried is not None:
+                queried.append((table, slice_start, slice_end))
+            return [
+                row
+                for row in ROWS.get(table, [])
+                if slice_start < row[1] <= slice_end
+            ]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def test_time_slices_cover_the_range_without_gaps():
+    assert get_time_slices(dt(2023, 1, 1), dt(2023, 2, 15), 30) == [
+        (dt(2023, 1, 1), dt(2023, 1, 31)),
+        (dt(2023, 1, 31), dt(2023, 2, 15)),
+    ]
+    assert get_time_slices(dt(2023, 1, 1), dt(2023, 1, 1), 30) == []
+
+
+@mock_s3
+class TestBackfill:
+    """tests for the time-sliced historical backfill"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def run_backfill(self, end=dt(2023, 3, 1), queried=None):
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.get_connection",
+            side_effect=lambda credentials: make_mock_conn(queried),
+        ):
+            return backfill(
+                make_mock_conn(queried),
+                {},
+                "TestBucket",
+                dt(2023, 1, 1),
+                end,
+                slice_days=30,
+                max_connections=3,
+            )
+
+    def test_saves_slices_in_the_date_partitioned_layout(self):
+        s3 = self.create_bucket()
+
+        saved = self.run_backfill()
+
+        assert sorted(saved) == [
+            "currency/2023/1/1/currency-000000.json",
+            "design/2023/1/1/design-000000.json",
+            "design/2023/1/31/design-000000.json",
+        ]
+        response = s3.get_object(
+            Bucket="TestBucket", Key="design/2023/1/31/design-000000.json"
+        )
+        assert json.loads(response["Body"].read())["design"] == [
+            {"id": 2, "last_updated": "2023-02-10T00:00:00.000"}
+        ]
+
+    def test_records_completed_slices_and_advances_watermarks(self):
+        s3 = self.create_bucket()
+
+        self.run_backfill()
+
+        marker = s3.get_object(
+            Bucket="TestBucket",
+            Key="state/backfill/design/"
+            "20230131T000000000000-20230301T000000000000.json",
+        )
+        assert json.loads(marker["Body"].read()) == {
+            "rows": 1,
+            "file": "design/2023/1/31/design-000000.json",
+        }
+        assert get_watermarks("TestBucket") == {
+            "design": dt(2023, 3, 1),
+            "currency": dt(2023, 3, 1),
+            "address": dt(2023, 3, 1),
+        }
+
+    def test_rerun_skips_completed_slices(self):
+        self.create_bucket()
+        self.run_backfill()
+
+        queried = []
+        assert self.run_backfill(queried=queried) == []
+        assert queried == []
+
+    def test_rerun_without_end_reuses_the_planned_end(self):
+        self.create_bucket()
+        self.run_backfill(end=dt(2023, 2, 1))
+
+        queried = []
+        self.run_backfill(end=None, queried=queried)
+
+        assert queried == []
+
+    def test_rerun_extracts_only_failed_slices(self):
+        s3 = self.create_bucket()
+        self.run_backfill()
+        s3.delete_object(
+            Bucket="TestBucket",
+            Key="state/backfill/currency/"
+            "20230131T000000000000-20230301T000000000000.json",
+        )
+
+        queried = []
+        self.run_backfill(queried=queried)
+
+        assert queried == [("currency", dt(2023, 1, 31), dt(2023, 3, 1))]
+
+    def test_stops_between_slices_when_out_of_time(self):
+        s3 = self.create_bucket()
+        s3.put_object(
+            Body=json.dumps(
+                {"design": {"last_updated": "2022-12-01T00:00:00"}}
+            ),  # noqa E501
+            Bucket="TestBucket",
+            Key="state/watermarks.json",
+        )
+        queried = []
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.is_past",
+            side_effect=lambda deadline: len(queried) >= 1,
+        ):
+            saved = backfill(
+                make_mock_conn(queried),
+                {},
+                "TestBucket",
+                dt(2023, 1, 1),
+                dt(2023, 3, 1),
+                slice_days=30,
+                max_connections=1,
+                deadline=1.0,
+            )
+
+        assert saved == ["design/2023/1/1/design-000000.json"]
+        assert queried == [("design", dt(2023, 1, 1), dt(2023, 1, 31))]
+        assert get_watermarks("TestBucket") == {
+            "design": dt(2022, 12, 1),
+            "currency": dt(2023, 3, 1),
+            "address": dt(2023, 3, 1),
+        }
+
+        queried = []
+        self.run_backfill(queried=queried)
+
+        assert len(queried) == 5
+        assert get_watermarks("TestBucket")["design"] == dt(2023, 3, 1)
+
+
+@mock_s3
+def test_cli_reads_credentials_from_environment(monkeypatch):
+    boto3.client("s3").create_bucket(
+        Bucket="TestBucket",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+    for name, value in {
+        "PDB_HOST": "localhost",
+        "PDB_PORT": "5432",
+        "PDB_NAME": "totesys",
+        "PDB_USER": "user",
+        "PDB_PASSWORD": "password",
+    }.items():
+        monkeypatch.setenv(name, value)
+
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.get_connection",
+        side_effect=lambda credentials: make_mock_conn(),
+    ) as get_connection:
+        main(["--bucket", "TestBucket", "--start", "2023-01-01"])
+
+    assert get_connection.call_args_list[0].args[0] == {
+        "host": "localhost",
+        "port": 5432,
+        "user": "user",
+        "password": "password",
+        "database": "totesys",
+    }
+    assert get_watermarks("TestBucket")["design"] == dt(2023, 3, 1)
@@ -0,0 +1,155 @@
+from src.transformation_lambda.transformation_lambda import (
+    format_dim_date,
+    get_calendar,
+    get_day,
+    get_date_row,
+    _calendar,
+)
+from unittest.mock import patch
+from datetime import date, datetime
+import pytest
+import os
+
+
+def test_calendar_covers_the_configured_range():
+    calendar = get_calendar()
+
+    assert calendar["2000-01-01"] == [
+        "2000-01-01",
+        2000,
+        1,
+        1,
+        6,
+        "Saturday",
+        "January",
+        1,
+    ]
+    assert calendar["2050-12-31"][5:] == ["Saturday", "December", 4]
+    assert "2024-02-29" in calendar
+
+
+def test_days_convert_to_date_ids_without_parsing():
+    assert get_day("2023-10-30T08:27:09.957") == "2023-10-30"
+    assert get_day("2023-11-02") == "2023-11-02"
+    assert str(get_day(datetime(2023, 10, 30, 8, 27))) == "2023-10-30"
+    assert str(get_day(date(2023, 11, 2))) == "2023-11-02"
+
+
+def test_dates_in_range_are_not_computed_again():
+    get_calendar()
+    table = {
+        "sales_order": [
+            {
+                "created_at": "2023-10-30T08:27:09.957",
+                "last_updated": datetime(2023, 10, 31, 9, 0),
+                "agreed_delivery_date": "2023-11-02",
+                "agreed_payment_date": date(2023, 11, 3),
+            }
+        ]
+    }
+
+    with patch(
+        "src.transformation_lambda.transformation_lambda.make_date_row"
+    ) as make_date_row:  # noqa E501
+        result = format_dim_date(table)
+
+    make_date_row.assert_not_called()
+    assert [row[0] for row in result] == [
+        "2023-11-02",
+        "2023-11-03",
+        "2023-10-30",
+        "2023-10-31",
+    ]
+
+
+def test_dates_out_of_range_are_computed_once():
+    assert get_date_row("1999-12-31")[5:] == ["Friday", "December", 4]
+
+    with patch(
+        "src.transformation_lambda.transformation_lambda.make_date_row"
+    ) as make_date_row:  # noqa E501
+        get_date_row("1999-12-31")
+
+    make_date_row.assert_not_called()
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TRANSFORM_CALENDAR_START": "2023-01-01",
+        "TRANSFORM_CALENDAR_END": "2023-12-31",
+    },
+)
+@patch.dict(_calendar, clear=True)
+def test_calendar_range_is_configurable():
+    calendar = get_calendar()
+
+    assert len(calendar) == 365
+    assert min(calendar) == "2023-01-01"
+    assert max(calendar) == "2023-12-31"
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TRANSFORM_CALENDAR_START": "2023-01-01",
+        "TRANSFORM_CALENDAR_END": "2023-12-31",
+    },
+)
+@patch.dict(_calendar, clear=True)
+def test_dates_past_the_configured_range_are_still_formatted():
+    table = {
+        "sales_order": [
+            {
+                "created_at": "2023-12-31T23:59:59",
+                "last_updated": "2024-01-01T00:00:01",
+                "agreed_delivery_date": "2061-03-01",
+                "agreed_payment_date": "1999-02-28",
+            }
+        ]
+    }
+
+    result = format_dim_date(table)
+
+    assert sorted(row[0] for row in result) == [
+        "1999-02-28",
+        "2023-12-31",
+        "2024-01-01",
+        "2061-03-01",
+    ]
+    assert get_date_row("2061-03-01")[5:] == ["Tuesday", "March", 1]
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TRANSFORM_CALENDAR_START": "2024-01-01",
+        "TRANSFORM_CALENDAR_END": "2023-01-01",
+    },
+)
+@patch.dict(_calendar, clear=True)
+def test_empty_calendar_range_is_rejected():
+    with pytest.raises(ValueError, match="is after its end"):
+        get_calendar()
+
+
+def test_returned_rows_do_not_share_the_calendar_rows():
+    table = {
+        "sales_order": [
+            {
+                "created_at": "2023-10-30",
+                "last_updated": "2023-10-30",
+                "agreed_delivery_date": "2023-10-30",
+                "agreed_payment_date": "2023-10-30",
+            }
+        ]
+    }
+
+    format_dim_date(table)[0][1] = None
+
+    assert get_date_row("2023-10-30")[1] == 2023
+
+
+def test_invalid_dates_still_fail():
+    with pytest.raises(ValueError):
+        get_date_row("2023-13-45")
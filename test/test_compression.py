@@ -0,0 +1,100 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    put_file,
+    get_compression,
+    S3MultipartUpload,
+)
+from src.transformation_lambda.transformation_lambda import (
+    get_content_from_file,
+)
+from unittest.mock import patch
+from moto import mock_s3
+import boto3
+import gzip
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+def test_compression_defaults_to_none():
+    with patch.dict(os.environ, clear=True):
+        assert get_compression() == "none"
+
+
+def test_unknown_compression_codec_raises():
+    with patch.dict(os.environ, {"INGESTION_COMPRESSION": "lzma"}):
+        with pytest.raises(ValueError, match="lzma"):
+            get_compression()
+
+
+@mock_s3
+class TestCompression:
+    """tests for compressed ingestion files"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def test_put_file_saves_gzip_body_with_content_encoding(self):
+        s3 = self.create_bucket()
+        body = '{"design": []}'
+
+        with patch.dict(os.environ, {"INGESTION_COMPRESSION": "gzip"}):
+            put_file(s3, "TestBucket", "design/design.json", body)
+
+        response = s3.get_object(Bucket="TestBucket", Key="design/design.json")
+        assert response["ContentEncoding"] == "gzip"
+        assert gzip.decompress(response["Body"].read()).decode() == body
+
+    def test_uncompressed_files_are_read_unchanged(self):
+        s3 = self.create_bucket()
+        with patch.dict(os.environ, {"INGESTION_COMPRESSION": "none"}):
+            put_file(s3, "TestBucket", "design/design.json", '{"a": 1}')
+
+        assert (
+            get_content_from_file(s3, "TestBucket", "design/design.json")
+            == '{"a": 1}'
+        )  # noqa E501
+
+    def test_transformation_reads_gzip_files_transparently(self):
+        s3 = self.create_bucket()
+        body = '{"sales_order": [' + ", ".join(["1"] * 1000) + "]}"
+
+        with patch.dict(os.environ, {"INGESTION_COMPRESSION": "gzip"}):
+            put_file(s3, "TestBucket", "sales_order/s.json", body)
+
+        assert get_content_from_file(s3, "TestBucket", "sales_order/s.json") == body  # noqa E501
+
+    def test_transformation_reads_zstd_files_transparently(self):
+        pytest.importorskip("zstandard")
+        s3 = self.create_bucket()
+        body = '{"counterparty": []}'
+
+        with patch.dict(os.environ, {"INGESTION_COMPRESSION": "zstd"}):
+            put_file(s3, "TestBucket", "counterparty/c.json", body)
+
+        assert get_content_from_file(s3, "TestBucket", "counterparty/c.json") == body  # noqa E501
+
+    def test_multipart_upload_compresses_across_parts(self):
+        s3 = self.create_bucket()
+        upload = S3MultipartUpload(
+            s3, "TestBucket", "big.json", 5 * 1024 * 1024, "gzip"
+        )  # noqa E501
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(6):
+            upload.write(chunk)
+        upload.complete()
+
+        response = s3.get_object(Bucket="TestBucket", Key="big.json")
+        assert response["ContentEncoding"] == "gzip"
+        assert gzip.decompress(response["Body"].read()) == chunk * 6
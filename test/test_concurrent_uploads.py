@@ -0,0 +1,102 @@
+from src.ingestion_lambda.ingestion_lambda import write_file, put_file
+from unittest.mock import patch
+from moto import mock_s3
+from datetime import datetime as dt
+from threading import Lock
+import boto3
+import pytest
+import os
+import time
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+TABLES = {f"table_{i}": [{"id": i}] for i in range(6)}
+
+
+@mock_s3
+class TestConcurrentUploads:
+    """tests for concurrent table file uploads"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def test_uploads_table_files_concurrently_within_the_limit(self):
+        self.create_bucket()
+        tracker = {"lock": Lock(), "running": 0, "peak": 0}
+
+        def slow_put_table_file(*args):
+            with tracker["lock"]:
+                tracker["running"] += 1
+                tracker["peak"] = max(tracker["peak"], tracker["running"])
+            time.sleep(0.05)
+            with tracker["lock"]:
+                tracker["running"] -= 1
+            return True
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.put_table_file",
+            side_effect=slow_put_table_file,
+        ):
+            write_file("TestBucket", TABLES, max_workers=3)
+
+        assert tracker["peak"] == 3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_index_lists_files_in_table_order_after_all_uploads(self):
+        s3 = self.create_bucket()
+
+        saved = write_file("TestBucket", TABLES, max_workers=4)
+
+        response = s3.get_object(Bucket="TestBucket", Key="latest_json_data.txt")  # noqa E501
+        assert response["Body"].read().decode().split("\n") == saved
+        assert saved == [
+            f"{table}/2020/1/1/{table}-173019.json" for table in TABLES
+        ]  # noqa E501
+
+    def test_index_is_not_written_if_an_upload_fails(self):
+        s3 = self.create_bucket()
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.put_table_file",
+            side_effect=[True, Exception("upload failed")] + [True] * 4,
+        ):
+            assert write_file("TestBucket", TABLES, max_workers=1) is None
+
+        assert "Contents" not in s3.list_objects(Bucket="TestBucket")
+
+    def test_last_update_does_not_advance_if_a_put_is_rejected(self, caplog):
+        s3 = self.create_bucket()
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.put_table_file",
+            side_effect=[True, False] + [True] * 4,
+        ):
+            assert write_file("TestBucket", TABLES, max_workers=1) is None
+
+        assert "Contents" not in s3.list_objects(Bucket="TestBucket")
+        assert "Files not saved: table_1/" in caplog.text
+
+    def test_large_bodies_are_uploaded_in_parts(self):
+        s3 = self.create_bucket()
+        body = "x" * (11 * 1024 * 1024)
+
+        with patch.object(s3, "put_object") as put_object:
+            assert put_file(s3, "TestBucket", "big.json", body)
+
+        put_object.assert_not_called()
+        response = s3.get_object(Bucket="TestBucket", Key="big.json")
+        assert response["ContentLength"] == len(body)
+        assert "-" in response["ETag"]
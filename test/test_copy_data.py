@@ -0,0 +1,269 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    copy_data,
+    emit_metrics,
+    get_watermarks,
+    get_row_counts,
+    S3MultipartUpload,
+    JsonRowStream,
+    _snapshots,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import hashlib
+import json
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+class FakeWriter:
+    """Collects written bytes in memory."""
+
+    def __init__(self):
+        self.content = b""
+        self.completed = False
+
+    def write(self, data):
+        self.content += data
+
+    def complete(self):
+        self.completed = True
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+def make_mock_conn(table_rows):
+    """
+    Mock connection answering the count query and writing
+    each table's JSON rows to the COPY stream in uneven chunks.
+    """
+
+    def mock_run(sql, stream=None, date=None):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                [table, "c1"]
+                for table in {**table_rows, "address": [], "department": []}
+            ]
+        elif "SELECT count(*)" in sql:
+            rows = table_rows.get(sql.split("FROM ")[1].split()[0], [])
+            return [[len(rows), dt(2023, 1, 2, 3, 4, 5, 678901)]]
+        elif "COPY" in sql:
+            table = sql.split("SELECT * FROM ")[1].split()[0]
+            content = b"".join(row + b"\n" for row in table_rows[table])
+            for i in range(0, len(content), 7):
+                stream.write(content[i:i + 7])
+            return []
+        elif "SELECT * FROM department" in sql:
+            return [["Sales"]]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def test_json_row_stream_joins_rows_split_across_chunks():
+    writer = FakeWriter()
+    stream = JsonRowStream(writer, "design")
+    stream.write(b'{"a": 1}\n{"a"')
+    stream.write(b': 2}\n')
+    stream.close()
+
+    assert json.loads(writer.content) == {"design": [{"a": 1}, {"a": 2}]}
+    assert writer.completed
+
+
+def test_json_row_stream_appends_extra_members():
+    writer = FakeWriter()
+    stream = JsonRowStream(writer, "staff")
+    stream.write(b'{"a": 1}\n')
+    stream.close('"department": [{"b": 2}]')
+
+    assert json.loads(writer.content) == {
+        "staff": [{"a": 1}],
+        "department": [{"b": 2}],
+    }
+
+
+@mock_s3
+class TestCopyData:
+    """tests for the COPY extraction path"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def test_multipart_upload_splits_large_bodies_into_parts(self):
+        s3 = self.create_bucket()
+        upload = S3MultipartUpload(
+            s3, "TestBucket", "big.json", 5 * 1024 * 1024
+        )  # noqa E501
+        chunk = b"x" * (1024 * 1024)
+        for _ in range(6):
+            upload.write(chunk)
+        upload.complete()
+
+        assert len(upload.parts) == 2
+        response = s3.get_object(Bucket="TestBucket", Key="big.json")
+        assert response["ContentLength"] == 6 * 1024 * 1024
+
+    def test_aborted_upload_leaves_no_object(self):
+        s3 = self.create_bucket()
+        upload = S3MultipartUpload(s3, "TestBucket", "aborted.json")
+        upload.write(b"partial")
+        upload.abort()
+
+        assert "Contents" not in s3.list_objects(Bucket="TestBucket")
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_copies_rows_into_table_files_with_snapshots(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(
+            {
+                "staff": [b'{"staff_id":1,"note":"a\\\\b"}'],
+                "design": [b'{"design_id":1}', b'{"design_id":2}'],
+                "currency": [],
+            }
+        )
+
+        saved = copy_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), {})
+
+        assert sorted(saved) == [
+            "design/2020/1/1/design-173019.json",
+            "staff/2020/1/1/staff-173019.json",
+        ]
+        response = s3.get_object(
+            Bucket="TestBucket", Key="staff/2020/1/1/staff-173019.json"
+        )
+        content = json.loads(response["Body"].read())
+        assert content["staff"] == [{"staff_id": 1, "note": "a\\b"}]
+        response = s3.get_object(
+            Bucket="TestBucket", Key=content["snapshots"]["department"]
+        )
+        assert json.loads(response["Body"].read()) == {
+            "department": [{"c1": "Sales"}]
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_advances_watermarks_from_the_copied_snapshot(self):
+        self.create_bucket()
+        conn = make_mock_conn({"design": [b'{"design_id":1}']})
+
+        copy_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), {})
+
+        assert get_watermarks("TestBucket") == {
+            "design": dt(2023, 1, 2, 3, 4, 5, 678901)
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_keeps_the_saved_row_counts(self):
+        self.create_bucket()
+        conn = make_mock_conn({"design": [b'{"design_id":1}']})
+
+        copy_data(
+            conn, "TestBucket", dt(2020, 1, 1), dt.now(), {}, {"design": 7}
+        )  # noqa E501
+
+        assert get_row_counts("TestBucket") == {"design": 7}
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_saves_a_run_manifest_of_the_copied_files(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(
+            {"design": [b'{"design_id":1}', b'{"design_id":2}']}
+        )  # noqa E501
+
+        copy_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), {})
+
+        response = s3.get_object(
+            Bucket="TestBucket", Key="state/latest_manifest.json"
+        )  # noqa E501
+        (entry,) = json.loads(response["Body"].read())["files"]
+        response = s3.get_object(Bucket="TestBucket", Key=entry["key"])
+        body = response["Body"].read()
+        assert entry["rows"] == 2
+        assert entry["bytes"] == len(body)
+        assert entry["sha256"] == hashlib.sha256(body).hexdigest()
+        assert entry["since"] == "2020-01-01T00:00:00"
+        assert entry["until"] == "2023-01-02T03:04:05.678901"
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_records_rows_and_bytes_of_the_copied_files(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(
+            {"design": [b'{"design_id":1}', b'{"design_id":2}']}
+        )  # noqa E501
+
+        (file_name,) = copy_data(
+            conn, "TestBucket", dt(2020, 1, 1), dt.now(), {}
+        )  # noqa E501
+
+        response = s3.get_object(Bucket="TestBucket", Key=file_name)
+        (document,) = [
+            document
+            for document in emit_metrics("ingestion")
+            if document.get("Table") == "design"
+        ]
+        assert document["RowsExtracted"] == 2
+        assert document["BytesWritten"] == response["ContentLength"]
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_stops_between_tables_when_out_of_time(self):
+        self.create_bucket()
+        conn = make_mock_conn(
+            {"design": [b'{"design_id":1}'], "staff": [b'{"staff_id":1}']}
+        )  # noqa E501
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.is_past",
+            side_effect=lambda deadline: any(
+                "COPY" in call.args[0] for call in conn.run.call_args_list
+            ),
+        ):
+            saved = copy_data(
+                conn, "TestBucket", dt(2020, 1, 1), dt.now(), {}, None, 1.0
+            )  # noqa E501
+
+        assert saved == ["design/2020/1/1/design-173019.json"]
+        assert get_watermarks("TestBucket") == {
+            "design": dt(2023, 1, 2, 3, 4, 5, 678901),
+            "staff": dt(2020, 1, 1),
+            "address": dt(2020, 1, 1),
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_failed_abort_does_not_hide_the_copy_error(self, caplog):
+        self.create_bucket()
+        conn = make_mock_conn({"design": [b'{"design_id":1}']})
+        copy_run = conn.run.side_effect
+
+        def failing_run(sql, **params):
+            if "COPY" in sql:
+                raise Exception("copy failed")
+            return copy_run(sql, **params)
+
+        conn.run.side_effect = failing_run
+
+        with patch.object(
+            S3MultipartUpload, "abort", side_effect=Exception("AccessDenied")
+        ), pytest.raises(Exception, match="copy failed"):
+            copy_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), {})
+
+        assert "not aborted: AccessDenied" in caplog.text
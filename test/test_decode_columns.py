@@ -0,0 +1,178 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    get_catalog,
+    get_column_type,
+    write_file,
+    _snapshots,
+)
+from src.transformation_lambda.transformation_lambda import (
+    decode_columns,
+    format_dim_date,
+    format_fact_sales_order,
+    read_s3_json,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import date
+from datetime import datetime as dt
+from decimal import Decimal
+import boto3
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def load_catalog():
+    _snapshots.clear()
+    conn = Mock()
+    conn.run.side_effect = [
+        [],
+        [
+            ["sales_order", "sales_order_id", "integer", 32, 0],
+            ["sales_order", "created_at", "timestamp without time zone", None, None],  # noqa E501
+            ["sales_order", "last_updated", "timestamp without time zone", None, None],  # noqa E501
+            ["sales_order", "staff_id", "integer", 32, 0],
+            ["sales_order", "counterparty_id", "integer", 32, 0],
+            ["sales_order", "units_sold", "integer", 32, 0],
+            ["sales_order", "unit_price", "numeric", 10, 2],
+            ["sales_order", "currency_id", "integer", 32, 0],
+            ["sales_order", "design_id", "integer", 32, 0],
+            ["sales_order", "agreed_payment_date", "character varying", None, None],  # noqa E501
+            ["sales_order", "agreed_delivery_date", "character varying", None, None],  # noqa E501
+            ["sales_order", "agreed_delivery_location_id", "integer", 32, 0],
+        ],
+    ]
+    get_catalog(conn)
+
+
+SALES_ORDER = {
+    "sales_order_id": 1,
+    "created_at": dt(2022, 11, 3, 14, 20, 52, 186000),
+    "last_updated": dt(2022, 11, 3, 14, 20, 52, 186000),
+    "staff_id": 2,
+    "counterparty_id": 3,
+    "units_sold": 100,
+    "unit_price": Decimal("2.40"),
+    "currency_id": 1,
+    "design_id": 4,
+    "agreed_payment_date": "2022-11-08",
+    "agreed_delivery_date": "2022-11-10",
+    "agreed_delivery_location_id": 5,
+}
+
+
+def make_event(key):
+    return {
+        "Records": [
+            {"s3": {"bucket": {"name": "TestBucket"}, "object": {"key": key}}}
+        ]
+    }
+
+
+def test_column_types_follow_the_postgres_types():
+    assert get_column_type("integer") == "int"
+    assert get_column_type("numeric", 10, 2) == "numeric(10,2)"
+    assert get_column_type("numeric") == "float"
+    assert get_column_type("timestamp with time zone") == "timestamp"
+    assert get_column_type("date") == "date"
+    assert get_column_type("character varying") == "text"
+    assert get_column_type("bytea") is None
+
+
+def test_decodes_typed_columns_into_native_values():
+    content = {
+        "sales_order": [
+            {
+                "created_at": "2022-11-03T14:20:52.186",
+                "unit_price": 10.0,
+                "delivered": "2022-11-10T00:00:00.000",
+                "note": "2.5",
+            }
+        ],
+        "schema": {
+            "sales_order": {
+                "created_at": "timestamp",
+                "unit_price": "numeric(10,2)",
+                "delivered": "date",
+                "note": "text",
+            }
+        },
+    }
+
+    assert decode_columns(content) == {
+        "sales_order": [
+            {
+                "created_at": dt(2022, 11, 3, 14, 20, 52, 186000),
+                "unit_price": Decimal("10.00"),
+                "delivered": date(2022, 11, 10),
+                "note": "2.5",
+            }
+        ]
+    }
+    assert str(content["sales_order"][0]["unit_price"]) == "10.00"
+
+
+def test_leaves_files_without_a_schema_unchanged():
+    content = {"sales_order": [{"created_at": "2022-11-03T14:20:52.186"}]}
+    assert decode_columns(content) == {
+        "sales_order": [{"created_at": "2022-11-03T14:20:52.186"}]
+    }
+
+
+def test_format_functions_give_the_same_rows_for_native_values():
+    row = [
+        1,
+        "2022-11-03",
+        "14:20:52",
+        "2022-11-03",
+        "14:20:52",
+        2,
+        3,
+        100,
+        Decimal("2.40"),
+        1,
+        4,
+        "2022-11-08",
+        "2022-11-10",
+        5,
+    ]
+    assert format_fact_sales_order({"sales_order": [SALES_ORDER]}) == [row]
+    assert sorted(format_dim_date({"sales_order": [SALES_ORDER]})) == [
+        ["2022-11-03", 2022, 11, 3, 4, "Thursday", "November", 4],
+        ["2022-11-08", 2022, 11, 8, 2, "Tuesday", "November", 4],
+        ["2022-11-10", 2022, 11, 10, 4, "Thursday", "November", 4],
+    ]
+
+
+@mock_s3
+class TestTypedIngestionFiles:
+    """tests for files read back through their type schema"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_unit_price_stays_exact_through_json_and_ndjson(self):
+        self.create_bucket()
+        saved = write_file("TestBucket", {"sales_order": [SALES_ORDER]})
+        with patch.dict(os.environ, {"INGESTION_FORMAT": "ndjson"}):
+            saved += write_file(
+                "TestBucket", {"sales_order": [SALES_ORDER]}
+            )  # noqa E501
+
+        for key in saved:
+            content = read_s3_json(make_event(key))
+            assert list(content["sales_order"]) == [SALES_ORDER]
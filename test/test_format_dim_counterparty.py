@@ -86,3 +86,41 @@ def test_KeyError_happend_when_wrong_table_name(caplog):
 def test_RuntimeError_happend_when_wrong_input():
     with pytest.raises(RuntimeError):
         format_dim_counterparty(5)
+
+
+def test_reports_counterparties_without_an_address(caplog):
+    table = {
+        "address": test_table["address"],
+        "counterparty": [
+            {**test_table["counterparty"][0], "legal_address_id": 99},
+            {
+                **test_table["counterparty"][0],
+                "counterparty_id": 2,
+                "legal_address_id": 2,
+            },
+        ],
+    }
+
+    with caplog.at_level(logging.WARNING):
+        result = format_dim_counterparty(table)
+
+    assert [row[0] for row in result] == [2]
+    assert "No legal address found for counterparties [1]" in caplog.text
+
+
+def test_keeps_counterparty_order_and_handles_no_counterparties():
+    counterparties = [
+        {
+            **test_table["counterparty"][0],
+            "counterparty_id": i,
+            "legal_address_id": [15, 2][i % 2],
+        }
+        for i in range(5)
+    ]
+    table = {"address": test_table["address"], "counterparty": counterparties}
+
+    result = format_dim_counterparty(table)
+
+    assert [row[0] for row in result] == [0, 1, 2, 3, 4]
+    assert result[1][2] == "179 Alexie Cliffs"
+    assert format_dim_counterparty({**table, "counterparty": []}) == []
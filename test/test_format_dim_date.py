@@ -75,6 +75,17 @@ def test_correct_output():
     assert ["2023-10-30", 2023, 10, 30, 1, "Monday", "October", 4] in result
 
 
+def test_dates_keep_first_seen_order():
+    result = format_dim_date(test_table)
+    assert [row[0] for row in result] == [
+        "2023-11-02",
+        "2023-11-03",
+        "2023-10-30",
+        "2023-11-01",
+        "2023-11-05",
+    ]
+
+
 def test_KeyError_happend_when_wrong_table_name(caplog):
     wrong_table = {"staff": test_table["sales_order"]}
     with caplog.at_level(logging.ERROR):
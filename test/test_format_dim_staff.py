@@ -193,3 +193,33 @@ def test_AttributeError_when_incorrect_data_type_passed(caplog):
         input = "hello"
         format_dim_staff(input)
         assert "'str' object has no attribute 'keys'" in caplog.text
+
+
+def test_rejects_every_unmatched_staff_member(caplog):
+    input = {
+        "staff": [
+            {
+                "staff_id": staff_id,
+                "first_name": "First",
+                "last_name": "Last",
+                "department_id": department_id,
+                "email_address": "first.last@terrifictotes.com",
+            }
+            for staff_id, department_id in [(1, 9), (2, 8), (3, 1), (4, 7)]
+        ],
+        "department": [
+            {
+                "department_id": 1,
+                "department_name": "Sales",
+                "location": "Manchester",
+            }
+        ],
+    }
+
+    with caplog.at_level(logging.WARNING):
+        actual = format_dim_staff(input)
+
+    assert [row[0] for row in actual] == [3]
+    for staff_id in [1, 2, 4]:
+        assert f"staff_id {staff_id}: no valid department_id" in caplog.text
+    assert "department" not in input["staff"][2]
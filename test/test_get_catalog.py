@@ -0,0 +1,73 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    get_catalog,
+    get_table_columns,
+    get_table_names,
+)
+from unittest.mock import Mock
+
+
+def make_mock_conn(fingerprints, columns):
+    """
+    Mock connection returning the next schema fingerprint
+    on every fingerprint query and a fixed column listing.
+    """
+    fingerprints = iter(fingerprints)
+
+    def mock_run(sql):
+        if "SELECT md5" in sql:
+            return [[next(fingerprints)]]
+        elif "SELECT table_name, column_name" in sql:
+            return columns
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def count_catalog_queries(conn):
+    return len(
+        [
+            call
+            for call in conn.run.call_args_list
+            if "SELECT table_name, column_name" in call.args[0]
+        ]
+    )
+
+
+def test_groups_columns_by_table_in_ordinal_order():
+    conn = make_mock_conn(
+        ["fp-group"],
+        [["address", "address_id"], ["address", "city"], ["staff", "a"]],
+    )
+    assert get_catalog(conn) == {
+        "address": ["address_id", "city"],
+        "staff": ["a"],
+    }
+
+
+def test_reuses_catalog_while_fingerprint_is_unchanged():
+    conn = make_mock_conn(["fp-warm", "fp-warm"], [["staff", "staff_id"]])
+
+    get_catalog(conn)
+    get_catalog(conn)
+
+    assert count_catalog_queries(conn) == 1
+
+
+def test_refetches_catalog_when_fingerprint_changes():
+    conn = make_mock_conn(["fp-old", "fp-new"], [["staff", "staff_id"]])
+
+    get_catalog(conn)
+    get_catalog(conn)
+
+    assert count_catalog_queries(conn) == 2
+
+
+def test_table_names_drop_prisma_and_add_all_addresses():
+    conn = make_mock_conn(
+        ["fp-names"],
+        [["_prisma_migrations", "id"], ["address", "address_id"]],
+    )
+    assert get_table_names(conn) == ["address", "all_addresses"]
+    assert get_table_columns(conn, "all_addresses") == ["address_id"]
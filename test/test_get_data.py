@@ -14,28 +14,32 @@ def mock_run(str, date="ss"):
     """
     Mock table data
     """
-    if "SELECT table_name" in str:
-        return [["table_a"], ["table_b"], ["_prisma_migrations"]]
+    if "SELECT table_name, column_name" in str:
+        return [
+            [table, column]
+            for table in ["_prisma_migrations", "table_a", "table_b"]
+            for column in ["c1", "c2", "c3"]
+        ]
     elif "SELECT * FROM table_a" in str:
         return [[1, 2, 3], [11, 22, 33]]
     elif "SELECT * FROM table_b" in str:
         return [[10, 20, 30], [110, 220, 330]]
-    elif "SELECT column_name" in str:
-        return [["c1"], ["c2"], ["c3"]]
 
 
 def mock_run_with_incorrect_columns(str, date="ss"):
     """
     Mock table data
     """
-    if "SELECT table_name FROM information_schema.tables " in str:
-        return [["table_a"], ["table_b"], ["_prisma_migrations"]]
+    if "SELECT table_name, column_name" in str:
+        return [
+            [table, column]
+            for table in ["_prisma_migrations", "table_a", "table_b"]
+            for column in ["c1", "c2"]
+        ]
     elif "SELECT * FROM table_a" in str:
         return [[1, 2, 3], [11, 22, 33]]
     elif "SELECT * FROM table_b" in str:
         return [[10, 20, 30], [110, 220, 330]]
-    elif "SELECT column_name FROM information_schema.columns" in str:
-        return [["c1"], ["c2"]]
 
 
 @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
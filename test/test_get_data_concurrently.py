@@ -0,0 +1,105 @@
+from src.ingestion_lambda.ingestion_lambda import get_data_concurrently
+from unittest.mock import Mock, patch
+from datetime import datetime as dt
+from threading import Lock
+import pytest
+import time
+
+
+TABLES = ["table_a", "table_b", "table_c", "table_d", "table_e"]
+
+
+def make_mock_conn(tracker=None):
+    """
+    Mock connection serving five tables. When a tracker is given,
+    records the peak number of data queries running at once.
+    """
+
+    def mock_run(sql, date="ss"):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                [table, column]
+                for table in TABLES + ["address"]
+                for column in ["c1", "c2"]
+            ]
+        elif "SELECT * FROM table_" in sql:
+            if tracker is not None:
+                with tracker["lock"]:
+                    tracker["running"] += 1
+                    tracker["peak"] = max(tracker["peak"], tracker["running"])
+                time.sleep(0.05)
+                with tracker["lock"]:
+                    tracker["running"] -= 1
+            table = sql.split("FROM ")[1].split()[0]
+            return [[table, 1]]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def test_returns_records_for_every_table_in_order():
+    conn = make_mock_conn()
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.get_connection",
+        side_effect=lambda credentials: make_mock_conn(),
+    ):
+        result = get_data_concurrently(conn, {}, dt(2020, 1, 1), 3)
+
+    # the empty address lookup is kept for counterparty snapshots
+    assert list(result.keys()) == TABLES + ["all_addresses"]
+    assert result["all_addresses"] == []
+    assert result["table_c"] == [{"c1": "table_c", "c2": 1}]
+
+
+def test_opens_no_more_connections_than_the_limit():
+    conn = make_mock_conn()
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.get_connection",
+        side_effect=lambda credentials: make_mock_conn(),
+    ) as get_connection:
+        get_data_concurrently(conn, {}, dt(2020, 1, 1), 3)
+
+    assert get_connection.call_count == 2
+
+
+def test_runs_table_queries_concurrently_within_the_limit():
+    tracker = {"lock": Lock(), "running": 0, "peak": 0}
+    conn = make_mock_conn(tracker)
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.get_connection",
+        side_effect=lambda credentials: make_mock_conn(tracker),
+    ):
+        get_data_concurrently(conn, {}, dt(2020, 1, 1), 2)
+
+    assert tracker["peak"] == 2
+
+
+def test_closes_every_pooled_connection():
+    conn = make_mock_conn()
+    extra = []
+
+    def open_connection(credentials):
+        extra.append(make_mock_conn())
+        return extra[-1]
+
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.get_connection",
+        side_effect=open_connection,
+    ):
+        get_data_concurrently(conn, {}, dt(2020, 1, 1), 4)
+
+    for pooled in [conn] + extra:
+        pooled.close.assert_called_once()
+
+
+def test_raises_when_a_table_query_fails():
+    conn = make_mock_conn()
+    conn.run.side_effect = [
+        [],
+        [["table_a", "c1"], ["address", "c1"]],
+        Exception("query failed"),
+    ]
+    with pytest.raises(Exception, match="query failed"):
+        get_data_concurrently(conn, {}, dt(2020, 1, 1), 1)
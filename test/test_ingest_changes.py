@@ -0,0 +1,222 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    ingest_changes,
+    parse_change,
+    cast_value,
+    get_changed_records,
+    _snapshots,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+from decimal import Decimal
+import boto3
+import json
+import pytest
+import os
+import time_machine
+
+STAFF_INSERT = (
+    "table public.staff: INSERT: staff_id[integer]:1 "
+    "first_name[character varying]:'O''Brien' department_id[integer]:2 "
+    "last_updated[timestamp without time zone]:'2023-05-10 19:10:25.1'"
+)
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+def test_parses_insert_into_typed_record():
+    assert parse_change(STAFF_INSERT) == (
+        "staff",
+        "INSERT",
+        {
+            "staff_id": 1,
+            "first_name": "O'Brien",
+            "department_id": 2,
+            "last_updated": dt(2023, 5, 10, 19, 10, 25, 100000),
+        },
+    )
+
+
+def test_parses_new_tuple_of_key_changing_update():
+    change = (
+        "table public.design: UPDATE: old-key: design_id[integer]:1 "
+        "new-tuple: design_id[integer]:2 design_name[text]:null"
+    )
+    assert parse_change(change) == (
+        "design",
+        "UPDATE",
+        {"design_id": 2, "design_name": None},
+    )
+
+
+def test_ignores_transaction_boundaries_and_keyless_deletes():
+    assert parse_change("BEGIN 1234") is None
+    assert parse_change("COMMIT 1234") is None
+    assert parse_change("table public.staff: DELETE: (no-tuple-data)") is None
+
+
+def test_ignores_changes_outside_the_public_schema():
+    change = "table audit.log: INSERT: log_id[integer]:1"
+    assert parse_change(change) is None
+
+
+def test_parses_text_values_spanning_lines():
+    change = (
+        "table public.design: INSERT: design_id[integer]:1 "
+        "design_name[text]:'first\nsecond' tags[text[]]:'{a,b}'"
+    )
+    assert parse_change(change) == (
+        "design",
+        "INSERT",
+        {"design_id": 1, "design_name": "first\nsecond", "tags": "{a,b}"},
+    )
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        "table public.staff: TRUNCATE: (no-flags)",
+        "table public.staff: INSERT: staff_id[integer]:1 broken",
+        "table public.staff: UPDATE: ",
+        "message: transactional: 1 prefix: x, sz: 0 content:",
+    ],
+)
+def test_raises_on_unparsed_changes(change):
+    with pytest.raises(ValueError, match="Unparsed change"):
+        parse_change(change)
+
+
+def test_casts_numeric_and_boolean_values():
+    assert cast_value("numeric(10,2)", "2.43") == Decimal("2.43")
+    assert cast_value("boolean", "true") is True
+
+
+def test_groups_deletes_under_deleted_table_key():
+    changes = [
+        ("0/1", "BEGIN 1"),
+        ("0/2", STAFF_INSERT),
+        ("0/3", "table public.staff: DELETE: staff_id[integer]:7"),
+        ("0/4", "COMMIT 1"),
+    ]
+    result = get_changed_records(changes)
+    assert list(result.keys()) == ["staff", "staff_deleted"]
+    assert result["staff_deleted"] == [{"staff_id": 7}]
+
+
+def make_mock_conn(changes, slot_exists=True):
+    def mock_run(sql, **params):
+        if "FROM pg_replication_slots" in sql:
+            return [[1]] if slot_exists else []
+        elif "pg_logical_slot_peek_changes" in sql:
+            return changes
+        elif "SELECT table_name, column_name" in sql:
+            return [["department", "department_id"], ["address", "city"]]
+        elif "SELECT * FROM department" in sql:
+            return [[2]]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def get_statements(conn):
+    return [call.args[0] for call in conn.run.call_args_list]
+
+
+@mock_s3
+class TestIngestChanges:
+    """tests for change data capture ingestion"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_saves_changes_and_advances_slot_to_last_lsn(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn([("0/16B3748", STAFF_INSERT)])
+
+        saved = ingest_changes(conn, "TestBucket", dt.now())
+
+        assert "staff/2020/1/1/staff-173019.json" in saved
+        response = s3.get_object(
+            Bucket="TestBucket", Key="staff/2020/1/1/staff-173019.json"
+        )
+        content = json.loads(response["Body"].read())
+        assert content["staff"][0]["first_name"] == "O'Brien"
+        response = s3.get_object(
+            Bucket="TestBucket", Key=content["snapshots"]["department"]
+        )
+        assert json.loads(response["Body"].read()) == {
+            "department": [{"department_id": 2}]
+        }
+        advance = conn.run.call_args_list[-1]
+        assert "pg_replication_slot_advance" in advance.args[0]
+        assert advance.kwargs["lsn"] == "0/16B3748"
+
+    def test_keeps_slot_position_if_files_are_not_saved(self):
+        conn = make_mock_conn([("0/16B3748", STAFF_INSERT)])
+
+        with pytest.raises(Exception):
+            ingest_changes(conn, "NotABucket", dt.now())
+
+        assert not any(
+            "pg_replication_slot_advance" in sql
+            for sql in get_statements(conn)
+        )
+
+    def test_keeps_slot_position_on_an_unparsed_change(self):
+        self.create_bucket()
+        conn = make_mock_conn(
+            [
+                ("0/16B3748", STAFF_INSERT),
+                ("0/16B3750", "table public.staff: TRUNCATE: (no-flags)"),
+            ]
+        )
+
+        with pytest.raises(ValueError, match="Unparsed change"):
+            ingest_changes(conn, "TestBucket", dt.now())
+
+        assert not any(
+            "pg_replication_slot_advance" in sql
+            for sql in get_statements(conn)
+        )
+
+    def test_reads_no_changes_when_out_of_time(self):
+        conn = make_mock_conn([("0/16B3748", STAFF_INSERT)])
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.is_past",
+            return_value=True,
+        ):
+            saved = ingest_changes(conn, "TestBucket", dt.now(), deadline=1.0)
+
+        assert saved == []
+        statements = get_statements(conn)
+        assert not any("pg_logical_slot_peek_changes" in sql for sql in statements)  # noqa E501
+        assert not any("pg_replication_slot_advance" in sql for sql in statements)  # noqa E501
+
+    def test_creates_missing_slot(self):
+        conn = make_mock_conn([], slot_exists=False)
+
+        assert ingest_changes(conn, "TestBucket", dt.now()) == []
+        assert any(
+            "pg_create_logical_replication_slot" in sql
+            for sql in get_statements(conn)
+        )
@@ -10,6 +10,7 @@ import time_machine
 import pg8000
 import time
 import boto3
+import json
 import pytest
 import os
 
@@ -246,3 +247,103 @@ def test_ingestion_lambda_counter_address_saved_to_s3(
         response["Contents"][1]["Key"]
         == "counterparty/2023/1/1/counterparty-173019.json"  # noqa E501
     )
+
+
+@patch.dict(os.environ, {"INGESTION_MODE": "copy"})
+@patch(
+    "src.ingestion_lambda.ingestion_lambda.get_credentials",
+    return_value={
+        "user": "testuser",
+        "password": "testpass",
+        "database": "testdb",
+        "host": "localhost",
+        "port": 5433,
+    },
+)
+@time_machine.travel(dt(2023, 1, 1, 17, 30, 19))
+def test_ingestion_lambda_copy_mode_streams_rows_to_s3(
+    get_credentials, pg_container_fixture, s3_fixture
+):  # noqa E501
+    """design rows are copied with COPY TO STDOUT into a multipart upload"""
+    s3_client, s3_bucket = s3_fixture
+    test_conn = pg_container_fixture
+    test_cursor = test_conn.cursor()
+
+    test_cursor.execute(
+        """INSERT INTO design
+        (design_id, created_at, design_name, file_location, file_name, last_updated)
+        VALUES
+        (1, '2023-05-10 19:10:25.100', 'Wooden', '/usr', 'wooden.json', '2023-05-10 19:10:25.100'),
+        (2, '2023-05-10 19:10:25.100', 'Steel', '/private', 'steel.json', '2023-05-10 19:10:25.100');
+        """  # noqa E501
+    )
+    test_conn.commit()
+
+    event = {"data_bucket_name": s3_bucket}
+    lambda_handler(event, "context")
+
+    response = s3_client.get_object(
+        Bucket=s3_bucket, Key="design/2023/1/1/design-173019.json"
+    )
+    content = json.loads(response["Body"].read())
+    assert [row["design_name"] for row in content["design"]] == [
+        "Wooden",
+        "Steel",
+    ]
+    assert content["design"][0]["created_at"] == "2023-05-10T19:10:25.1"
+
+
+@patch.dict(os.environ, {"INGESTION_MODE": "cdc"})
+@patch(
+    "src.ingestion_lambda.ingestion_lambda.get_credentials",
+    return_value={
+        "user": "testuser",
+        "password": "testpass",
+        "database": "testdb",
+        "host": "localhost",
+        "port": 5433,
+    },
+)
+@time_machine.travel(dt(2023, 1, 1, 17, 30, 19))
+def test_ingestion_lambda_cdc_mode_saves_decoded_changes(
+    get_credentials, pg_container_fixture, s3_fixture
+):  # noqa E501
+    """changes made after the slot is created are saved, then acknowledged"""
+    s3_client, s3_bucket = s3_fixture
+    test_conn = pg_container_fixture
+    test_cursor = test_conn.cursor()
+    event = {"data_bucket_name": s3_bucket}
+
+    # first invocation creates the replication slot
+    lambda_handler(event, "context")
+
+    test_cursor.execute(
+        """INSERT INTO design
+        (design_id, created_at, design_name, file_location, file_name, last_updated)
+        VALUES
+        (1, '2023-05-10 19:10:25.100', 'Wooden', '/usr', 'wooden.json', '2023-05-10 19:10:25.100');
+        """  # noqa E501
+    )
+    test_cursor.execute("DELETE FROM design WHERE design_id = 1;")
+    test_conn.commit()
+
+    lambda_handler(event, "context")
+
+    response = s3_client.get_object(
+        Bucket=s3_bucket, Key="design/2023/1/1/design-173019.json"
+    )
+    content = json.loads(response["Body"].read())
+    assert content["design"][0]["design_name"] == "Wooden"
+    response = s3_client.get_object(
+        Bucket=s3_bucket,
+        Key="design_deleted/2023/1/1/design_deleted-173019.json",
+    )
+    assert json.loads(response["Body"].read()) == {
+        "design_deleted": [{"design_id": 1}]
+    }
+
+    test_cursor.execute(
+        "SELECT count(*) FROM pg_logical_slot_peek_changes"
+        "('ingestion_slot', NULL, NULL);"
+    )
+    assert test_cursor.fetchone()[0] == 0
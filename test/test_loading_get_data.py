@@ -1,4 +1,7 @@
 from src.loading_lambda.loading_lambda import get_parquet
+from decimal import Decimal
+from io import BytesIO
+import pandas as pd
 import logging
 from moto import mock_s3
 import boto3
@@ -233,3 +236,20 @@ class TestGetParquet:
                 )
             get_parquet("test_bucket", "spam-eggs")
             assert "The specified key does not exist" in caplog.text
+
+    def test_returns_decimals_as_exact_strings(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="test_bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )  # noqa E501
+        buffer = BytesIO()
+        pd.DataFrame([[1, Decimal("2.43")], [2, None]]).to_parquet(buffer)
+        s3.put_object(
+            Body=buffer.getvalue(), Bucket="test_bucket", Key="fact.parquet"
+        )  # noqa E501
+
+        assert get_parquet("test_bucket", "fact.parquet") == [
+            (1, "2.43"),
+            (2, None),
+        ]
@@ -0,0 +1,124 @@
+from src.shared.metrics import emit_metrics, record_metric, timed
+from src.transformation_lambda.transformation_lambda import run_formatter
+from src.loading_lambda.loading_lambda import record_load
+from src.loading_lambda import loading_lambda
+from src.transformation_lambda import transformation_lambda
+from unittest.mock import patch
+import json
+
+
+def get_document(documents, **dimensions):
+    """Returns the emitted document with exactly these dimensions."""
+    for document in documents:
+        names = document["_aws"]["CloudWatchMetrics"][0]["Dimensions"][0]
+        if {name: document[name] for name in names} == dimensions:
+            return document
+    raise AssertionError(f"no document for {dimensions}")
+
+
+def test_emits_one_emf_document_per_dimension_set(capsys):
+    record_metric("RowsExtracted", 3, Table="staff")
+    record_metric("RowsExtracted", 2, Table="staff")
+    record_metric("BytesWritten", 10, "Bytes", Table="design")
+
+    documents = emit_metrics("ingestion")
+
+    lines = capsys.readouterr().out.splitlines()
+    printed = [json.loads(line) for line in lines]
+    assert printed == documents
+    staff = get_document(documents, Function="ingestion", Table="staff")
+    assert staff["RowsExtracted"] == 5
+    metadata = staff["_aws"]["CloudWatchMetrics"][0]
+    assert metadata == {
+        "Namespace": "nc-de-project",
+        "Dimensions": [["Function", "Table"]],
+        "Metrics": [{"Name": "RowsExtracted", "Unit": "Count"}],
+    }
+    design = get_document(documents, Function="ingestion", Table="design")
+    assert design["BytesWritten"] == 10
+    assert isinstance(staff["_aws"]["Timestamp"], int)
+
+
+def test_adds_peak_rss_and_clears_after_emitting():
+    record_metric("RowsExtracted", 1, Table="staff")
+
+    documents = emit_metrics("ingestion")
+
+    function = get_document(documents, Function="ingestion")
+    assert function["PeakRSS"] > 0
+    assert function["_aws"]["CloudWatchMetrics"][0]["Metrics"] == [
+        {"Name": "PeakRSS", "Unit": "Kilobytes"}
+    ]
+    assert [
+        document["Table"]
+        for document in emit_metrics("ingestion")
+        if "Table" in document
+    ] == []
+
+
+def test_timed_records_milliseconds_even_when_the_block_raises():
+    try:
+        with timed("S3Latency", Table="staff"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    staff = get_document(
+        emit_metrics("ingestion"), Function="ingestion", Table="staff"
+    )  # noqa E501
+    assert staff["S3Latency"] >= 0
+    assert staff["_aws"]["CloudWatchMetrics"][0]["Metrics"] == [
+        {"Name": "S3Latency", "Unit": "Milliseconds"}
+    ]
+
+
+def test_run_formatter_records_rows_and_time_per_formatter():
+    def format_dim_test(data):
+        return [[1], [2]]
+
+    assert run_formatter(format_dim_test, {}) == [[1], [2]]
+
+    formatter = get_document(
+        transformation_lambda.emit_metrics("transformation"),
+        Function="transformation",
+        Formatter="format_dim_test",
+    )
+    assert formatter["RowsTransformed"] == 2
+    assert formatter["TransformTime"] >= 0
+
+
+def test_record_load_reports_throughput():
+    record_load("dim_staff", 100, 0.5)
+
+    table = get_document(
+        loading_lambda.emit_metrics("loading"),
+        Function="loading",
+        Table="dim_staff",
+    )
+    assert table["RowsLoaded"] == 100
+    assert table["RowsLoadedPerSecond"] == 200
+    assert table["LoadTime"] == 500
+
+
+def test_loading_handler_emits_metrics_when_it_fails():
+    with patch(
+        "src.loading_lambda.loading_lambda.get_credentials",
+        side_effect=Exception("no secret"),
+    ), patch(
+        "src.loading_lambda.loading_lambda.emit_metrics"
+    ) as emit:  # noqa E501
+        loading_lambda.lambda_handler(
+            {
+                "Records": [
+                    {
+                        "s3": {
+                            "bucket": {"name": "b"},
+                            "object": {"key": "dim_staff/x.parquet"},
+                        }
+                    }
+                ]
+            },
+            None,
+        )
+
+    emit.assert_called_once_with("loading")
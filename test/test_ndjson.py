@@ -0,0 +1,148 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    write_file,
+    get_file_format,
+    get_file_name,
+    _snapshots,
+)
+from src.transformation_lambda.transformation_lambda import (
+    read_s3_json,
+    format_fact_sales_order,
+    NdjsonRows,
+)
+from unittest.mock import patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import json
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+def make_event(key):
+    return {
+        "Records": [
+            {
+                "s3": {
+                    "bucket": {"name": "TestBucket"},
+                    "object": {"key": key},
+                }
+            }
+        ]
+    }
+
+
+SALES_ORDER = {
+    "sales_order_id": 1,
+    "created_at": "2022-11-03T14:20:52.186",
+    "last_updated": "2022-11-03T14:20:52.186",
+    "design_id": 9,
+    "staff_id": 16,
+    "counterparty_id": 18,
+    "units_sold": 84754,
+    "unit_price": 2.43,
+    "currency_id": 3,
+    "agreed_delivery_date": "2022-11-10",
+    "agreed_payment_date": "2022-11-03",
+    "agreed_delivery_location_id": 4,
+}
+
+
+def test_unknown_file_format_raises():
+    with patch.dict(os.environ, {"INGESTION_FORMAT": "csv"}):
+        with pytest.raises(ValueError, match="csv"):
+            get_file_format()
+
+
+def test_ndjson_file_names_keep_the_json_suffix():
+    assert (
+        get_file_name("staff", dt(2020, 1, 1, 17, 30, 19), 2, "ndjson")
+        == "staff/2020/1/1/staff-173019-part-0002.ndjson.json"
+    )  # noqa E501
+
+
+@mock_s3
+class TestNdjson:
+    """tests for newline-delimited JSON ingestion files"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_write_file_saves_one_record_per_line(self):
+        s3 = self.create_bucket()
+        json_data = {"design": [{"design_id": 1}, {"design_id": 2}]}
+
+        with patch.dict(os.environ, {"INGESTION_FORMAT": "ndjson"}):
+            saved = write_file("TestBucket", json_data)
+
+        assert saved == ["design/2020/1/1/design-173019.ndjson.json"]
+        response = s3.get_object(Bucket="TestBucket", Key=saved[0])
+        assert response["ContentType"] == "application/x-ndjson"
+        assert response["Body"].read() == (
+            b'{"design_id": 1}\n{"design_id": 2}\n'
+        )  # noqa E501
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_staff_rows_are_read_with_their_department_snapshot(self):
+        self.create_bucket()
+        json_data = {
+            "staff": [{"staff_id": 1}, {"staff_id": 2}],
+            "department": [{"department_id": 1}],
+        }
+        env = {"INGESTION_FORMAT": "ndjson", "INGESTION_COMPRESSION": "gzip"}
+
+        with patch.dict(os.environ, env):
+            saved = write_file("TestBucket", json_data)
+        content = read_s3_json(make_event(saved[0]))
+
+        assert list(content["staff"]) == [{"staff_id": 1}, {"staff_id": 2}]
+        assert content["department"] == [{"department_id": 1}]
+
+    def test_rows_can_be_iterated_more_than_once(self):
+        s3 = self.create_bucket()
+        rows = [dict(SALES_ORDER, sales_order_id=i) for i in range(3)]
+        s3.put_object(
+            Body="".join(json.dumps(row) + "\n" for row in rows),
+            Bucket="TestBucket",
+            Key="sales_order/s.ndjson.json",
+        )
+
+        content = read_s3_json(make_event("sales_order/s.ndjson.json"))
+
+        assert len(format_fact_sales_order(content)) == 3
+        assert len(format_fact_sales_order(content)) == 3
+
+    def test_rows_split_across_chunks_are_joined(self):
+        s3 = self.create_bucket()
+        s3.put_object(
+            Body=b'{"a": 1}\n{"a": 22}\n{"a": 333}',
+            Bucket="TestBucket",
+            Key="t/t.ndjson.json",
+        )
+
+        with patch(
+            "src.transformation_lambda.transformation_lambda.NDJSON_CHUNK_SIZE",  # noqa E501
+            4,
+        ):
+            rows = list(NdjsonRows(s3, "TestBucket", "t/t.ndjson.json"))
+
+        assert rows == [{"a": 1}, {"a": 22}, {"a": 333}]
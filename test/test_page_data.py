@@ -0,0 +1,230 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    page_data,
+    get_watermarks,
+    _snapshots,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import json
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+# sales_order_id, last_updated, with two rows sharing a timestamp
+ROWS = [
+    [1, dt(2023, 1, 1, 10, 0, 0, 1)],
+    [2, dt(2023, 1, 1, 10, 0, 0, 1)],
+    [3, dt(2023, 1, 2)],
+    [4, dt(2023, 1, 3)],
+    [5, dt(2023, 1, 4, 8, 30)],
+]
+
+
+def make_mock_conn(rows, fail_on_page=None, key=("sales_order_id",)):
+    """
+    Mock connection serving sales_order keyset pages,
+    raising when the page numbered fail_on_page is requested.
+    Rows are (sales_order_id, last_updated), keyed by the columns
+    in key, or by no key at all if it is empty.
+    """
+    pages = []
+
+    def mock_run(sql, **params):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                ["sales_order", "sales_order_id"],
+                ["sales_order", "last_updated"],
+                ["address", "address_id"],
+                ["department", "department_id"],
+            ]
+        elif "PRIMARY KEY" in sql:
+            return [["sales_order", column] for column in key]
+        elif "sales_order" not in sql:
+            return [[None]] if "SELECT max" in sql else []
+        elif "SELECT max(last_updated)" in sql:
+            updated = [row[1] for row in rows if row[1] > params["since"]]
+            return [[max(updated, default=None)]]
+        elif "ORDER BY last_updated" in sql:
+            pages.append(params)
+            if len(pages) == fail_on_page:
+                raise Exception("connection lost")
+            if "after_0" in params:
+                after = (params["after_0"], params["after_1"])
+                selected = [row for row in rows if (row[1], row[0]) > after]
+            else:
+                selected = [row for row in rows if row[1] > params["since"]]
+            selected = [row for row in selected if row[1] <= params["until"]]
+            selected.sort(key=lambda row: (row[1], row[0]))
+            if "LIMIT" not in sql:
+                return selected
+            return selected[: params["limit"]]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    conn.pages = pages
+    return conn
+
+
+@mock_s3
+class TestPageData:
+    """tests for keyset-paginated extraction"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def read(self, s3, key):
+        response = s3.get_object(Bucket="TestBucket", Key=key)
+        return json.loads(response["Body"].read())
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_saves_bounded_pages_and_a_manifest(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(ROWS)
+
+        saved = page_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {})
+
+        assert saved == [
+            f"sales_order/2020/1/1/sales_order-173019-part-000{i}.json"
+            for i in [1, 2, 3]
+        ]
+        ids = [
+            record["sales_order_id"]
+            for key in saved
+            for record in self.read(s3, key)["sales_order"]
+        ]
+        assert ids == [1, 2, 3, 4, 5]
+        manifest = self.read(
+            s3, "state/manifests/sales_order/2020/1/1/sales_order-173019.json"
+        )  # noqa E501
+        assert manifest["rows"] == 5
+        assert manifest["parts"] == saved
+        assert get_watermarks("TestBucket") == {"sales_order": ROWS[-1][1]}
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_resumes_after_the_last_saved_page(self):
+        s3 = self.create_bucket()
+
+        with pytest.raises(Exception, match="connection lost"):
+            page_data(
+                make_mock_conn(ROWS, fail_on_page=2),
+                "TestBucket",
+                dt(2020, 1, 1),
+                dt.now(),
+                2,
+                {},
+            )
+        checkpoint = self.read(s3, "state/checkpoints/sales_order.json")
+        assert checkpoint["after"] == ["2023-01-01T10:00:00.000001", 2]
+
+        conn = make_mock_conn(ROWS)
+        with time_machine.travel(dt(2020, 1, 1, 17, 40)):
+            saved = page_data(
+                conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {}
+            )  # noqa E501
+
+        assert conn.pages[0]["after_1"] == 2
+        assert saved[-1] == (
+            "sales_order/2020/1/1/sales_order-173019-part-0003.json"
+        )  # noqa E501
+        checkpoint = self.read(s3, "state/checkpoints/sales_order.json")
+        assert checkpoint == {"done": True}
+
+        conn = make_mock_conn(ROWS)
+        page_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {})
+        assert "after_0" not in conn.pages[0]
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_stops_at_a_page_boundary_when_out_of_time(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(ROWS)
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.is_past",
+            side_effect=lambda deadline: len(conn.pages) >= 1,
+        ):
+            saved = page_data(
+                conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {}, 1.0
+            )  # noqa E501
+
+        assert saved == []
+        assert len(conn.pages) == 1
+        checkpoint = self.read(s3, "state/checkpoints/sales_order.json")
+        assert checkpoint["parts"] == [
+            "sales_order/2020/1/1/sales_order-173019-part-0001.json"
+        ]
+        # sales_order resumes from its checkpoint, address from last_upload
+        assert get_watermarks("TestBucket") == {"address": dt(2020, 1, 1)}
+
+        conn = make_mock_conn(ROWS)
+        saved = page_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {})
+
+        assert conn.pages[0]["after_1"] == 2
+        assert len(saved) == 3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_reads_tables_without_a_primary_key_in_one_page(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(ROWS, key=())
+
+        saved = page_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {})
+
+        assert saved == [
+            "sales_order/2020/1/1/sales_order-173019-part-0001.json"
+        ]  # noqa E501
+        assert len(self.read(s3, saved[0])["sales_order"]) == 5
+        (sql,) = [
+            call.args[0]
+            for call in conn.run.call_args_list
+            if "ORDER BY last_updated" in call.args[0]
+        ]
+        assert "ORDER BY last_updated\n" in sql
+        assert "LIMIT" not in sql
+        assert get_watermarks("TestBucket") == {"sales_order": ROWS[-1][1]}
+
+    def test_orders_pages_by_every_primary_key_column(self):
+        self.create_bucket()
+        conn = make_mock_conn(ROWS, key=("sales_order_id", "last_updated"))
+
+        page_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {})
+
+        statements = [call.args[0] for call in conn.run.call_args_list]
+        assert any(
+            "ORDER BY last_updated, sales_order_id, last_updated" in sql
+            for sql in statements
+        )
+        assert any(
+            "(:after_0, :after_1, :after_2)" in sql for sql in statements
+        )  # noqa E501
+
+    def test_skips_tables_without_updates(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(ROWS)
+
+        saved = page_data(conn, "TestBucket", dt(2024, 1, 1), dt.now(), 2, {})
+
+        assert saved == []
+        assert conn.pages == []
+        response = s3.list_objects(Bucket="TestBucket", Prefix="state/manifests")  # noqa E501
+        assert "Contents" not in response
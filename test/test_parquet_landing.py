@@ -0,0 +1,159 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    write_file,
+    get_catalog,
+    get_arrow_schema,
+    to_json,
+    _snapshots,
+)
+from src.transformation_lambda.transformation_lambda import read_s3_json
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+from decimal import Decimal
+import pyarrow as pa
+import boto3
+import json
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def load_catalog():
+    _snapshots.clear()
+    conn = Mock()
+    conn.run.side_effect = [
+        [],
+        [
+            ["sales_order", "sales_order_id", "integer", 32, 0],
+            ["sales_order", "created_at", "timestamp without time zone", None, None],  # noqa E501
+            ["sales_order", "unit_price", "numeric", 10, 2],
+            ["sales_order", "agreed_delivery_date", "character varying", None, None],  # noqa E501
+            ["staff", "staff_id", "integer", 32, 0],
+            ["department", "department_id", "integer", 32, 0],
+        ],
+    ]
+    get_catalog(conn)
+
+
+def make_event(key):
+    return {
+        "Records": [
+            {"s3": {"bucket": {"name": "TestBucket"}, "object": {"key": key}}}
+        ]
+    }
+
+
+SALES_ORDER = [
+    {
+        "sales_order_id": 1,
+        "created_at": dt(2022, 11, 3, 14, 20, 52, 186000),
+        "unit_price": Decimal("2.43"),
+        "agreed_delivery_date": "2022-11-10",
+    },
+    {
+        "sales_order_id": 2,
+        "created_at": dt(2022, 11, 4, 9, 0, 0, 5000),
+        "unit_price": None,
+        "agreed_delivery_date": "2022-11-11",
+    },
+]
+
+
+def test_schema_is_built_from_catalog_types():
+    assert get_arrow_schema("sales_order") == pa.schema(
+        [
+            ("sales_order_id", pa.int32()),
+            ("created_at", pa.timestamp("us")),
+            ("unit_price", pa.decimal128(10, 2)),
+            ("agreed_delivery_date", pa.string()),
+        ]
+    )
+
+
+def test_tables_missing_from_catalog_have_no_schema():
+    assert get_arrow_schema("sales_order_deleted") is None
+
+
+@mock_s3
+class TestParquetLanding:
+    """tests for Parquet landing files"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_parquet_file_reads_back_like_the_json_file(self):
+        self.create_bucket()
+
+        with patch.dict(os.environ, {"INGESTION_FORMAT": "parquet"}):
+            saved = write_file("TestBucket", {"sales_order": SALES_ORDER})
+        content = read_s3_json(make_event(saved[0]))
+        json_saved = write_file("TestBucket", {"sales_order": SALES_ORDER})
+
+        assert saved == ["sales_order/2020/1/1/sales_order-173019.parquet"]
+        assert content == {"sales_order": SALES_ORDER}
+        assert read_s3_json(make_event(json_saved[0])) == content
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_json_file_carries_the_table_type_schema(self):
+        s3 = self.create_bucket()
+
+        saved = write_file("TestBucket", {"sales_order": SALES_ORDER})
+
+        response = s3.get_object(Bucket="TestBucket", Key=saved[0])
+        content = json.loads(response["Body"].read())
+        assert content["sales_order"] == json.loads(
+            to_json({"sales_order": SALES_ORDER})
+        )["sales_order"]
+        assert content["schema"] == {
+            "sales_order": {
+                "sales_order_id": "int",
+                "created_at": "timestamp",
+                "unit_price": "numeric(10,2)",
+                "agreed_delivery_date": "text",
+            }
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_staff_parquet_file_references_department_snapshot(self):
+        self.create_bucket()
+        json_data = {
+            "staff": [{"staff_id": 1}],
+            "department": [{"department_id": 1}],
+        }
+
+        with patch.dict(os.environ, {"INGESTION_FORMAT": "parquet"}):
+            write_file("TestBucket", json_data)
+        content = read_s3_json(
+            make_event("staff/2020/1/1/staff-173019.parquet")
+        )  # noqa E501
+
+        assert content == {
+            "staff": [{"staff_id": 1}],
+            "department": [{"department_id": 1}],
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_deleted_keys_are_saved_with_an_inferred_schema(self):
+        self.create_bucket()
+        json_data = {"sales_order_deleted": [{"sales_order_id": 3}]}
+
+        with patch.dict(os.environ, {"INGESTION_FORMAT": "parquet"}):
+            saved = write_file("TestBucket", json_data)
+        content = read_s3_json(make_event(saved[0]))
+
+        assert content == {"sales_order_deleted": [{"sales_order_id": 3}]}
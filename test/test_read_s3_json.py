@@ -2,11 +2,13 @@ from src.transformation_lambda.transformation_lambda import (
     read_s3_json,
     get_object_path,
     get_content_from_file,
+    resolve_snapshots,
 )
 from moto import mock_s3
 import boto3
+import io
 import json
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 
 test_event = {
@@ -71,3 +73,52 @@ def test_get_content_from_file_get_correct_content():
 )
 def test_read_s3_json(get_content_from_file):
     assert read_s3_json(test_event) == {"c1": 1, "c2": 2}
+
+
+@mock_s3
+def test_read_s3_json_resolves_lookup_snapshots():
+    fake_client = boto3.client("s3", region_name="us-east-1")
+    fake_client.create_bucket(Bucket="test_bucket_name")
+    fake_client.put_object(
+        Body=json.dumps({"department": [{"department_id": 1}]}),
+        Bucket="test_bucket_name",
+        Key="state/snapshots/department/abc.json",
+    )
+    fake_client.put_object(
+        Body=json.dumps(
+            {
+                "staff": [{"staff_id": 1}],
+                "snapshots": {
+                    "department": "state/snapshots/department/abc.json"
+                },  # noqa E501
+            }
+        ),
+        Bucket="test_bucket_name",
+        Key="test_file.json",
+    )
+
+    assert read_s3_json(test_event) == {
+        "staff": [{"staff_id": 1}],
+        "department": [{"department_id": 1}],
+    }
+
+
+def test_resolve_snapshots_reads_each_snapshot_once():
+    client = Mock()
+    client.get_object.return_value = {
+        "Body": io.BytesIO(b'{"address": [{"address_id": 3}]}')
+    }
+    reference = {"snapshots": {"address": "state/snapshots/address/def.json"}}
+
+    for _ in range(3):
+        content = resolve_snapshots(client, "bucket", dict(reference))
+        assert content == {"address": [{"address_id": 3}]}
+    client.get_object.assert_called_once()
+
+
+def test_resolve_snapshots_keeps_embedded_lookups():
+    client = Mock()
+    content = {"staff": [], "department": [{"department_id": 1}]}
+
+    assert resolve_snapshots(client, "bucket", dict(content)) == content
+    client.get_object.assert_not_called()
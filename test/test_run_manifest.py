@@ -0,0 +1,106 @@
+from src.ingestion_lambda.ingestion_lambda import write_file, _catalog
+from unittest.mock import patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import gzip
+import hashlib
+import json
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@mock_s3
+class TestRunManifest:
+    """tests for the structured manifest saved by write_file"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def get_manifest(self, s3, key="state/latest_manifest.json"):
+        response = s3.get_object(Bucket="TestBucket", Key=key)
+        return json.loads(response["Body"].read())
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19), tick=False)
+    def test_describes_every_saved_file(self):
+        s3 = self.create_bucket()
+        json_data = {
+            "design": [
+                {"design_id": 1, "last_updated": dt(2023, 1, 2)},
+                {"design_id": 2, "last_updated": dt(2023, 1, 3)},
+            ],
+            "currency": [{"currency_id": 1, "last_updated": dt(2023, 1, 1)}],
+        }
+
+        write_file(
+            "TestBucket", json_data, dt.now(), {"design": dt(2023, 1, 1)}
+        )  # noqa E501
+
+        manifest = self.get_manifest(
+            s3, "state/runs/2020/1/1/run-173019.json"
+        )  # noqa E501
+        assert manifest == self.get_manifest(s3)
+        assert manifest["run"] == "2020-01-01T17:30:19"
+        assert manifest["rows"] == 3
+        design, currency = manifest["files"]
+        assert design == {
+            "key": "design/2020/1/1/design-173019.json",
+            "table": "design",
+            "format": "json",
+            "compression": "none",
+            "rows": 2,
+            "bytes": design["bytes"],
+            "sha256": design["sha256"],
+            "since": "2023-01-01T00:00:00",
+            "until": "2023-01-03T00:00:00",
+        }
+        assert currency["since"] is None
+        assert manifest["bytes"] == design["bytes"] + currency["bytes"]
+
+    def test_tables_without_a_watermark_record_the_lower_bound(self):
+        s3 = self.create_bucket()
+        json_data = {"currency": [{"currency_id": 1}]}
+
+        write_file(
+            "TestBucket", json_data, dt.now(), {}, since=dt(2022, 5, 1)
+        )  # noqa E501
+
+        entry = self.get_manifest(s3)["files"][0]
+        assert entry["since"] == "2022-05-01T00:00:00"
+
+    def test_size_and_hash_match_the_stored_object(self):
+        s3 = self.create_bucket()
+        json_data = {"design": [{"design_id": 1}]}
+
+        with patch.dict(os.environ, {"INGESTION_COMPRESSION": "gzip"}):
+            write_file("TestBucket", json_data, dt.now())
+
+        entry = self.get_manifest(s3)["files"][0]
+        response = s3.get_object(Bucket="TestBucket", Key=entry["key"])
+        body = response["Body"].read()
+        assert entry["compression"] == "gzip"
+        assert entry["bytes"] == len(body)
+        assert entry["sha256"] == hashlib.sha256(body).hexdigest()
+        assert json.loads(gzip.decompress(body)) == json_data
+
+    def test_records_the_schema_fingerprint(self):
+        s3 = self.create_bucket()
+
+        with patch.dict(_catalog, {"fingerprint": "abc123"}):
+            write_file("TestBucket", {"design": [{"design_id": 1}]}, dt.now())
+
+        assert self.get_manifest(s3)["schema_fingerprint"] == "abc123"
@@ -0,0 +1,144 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    write_snapshot,
+    write_file,
+    get_data,
+    _snapshots,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import json
+import pytest
+import os
+import time_machine
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+@mock_s3
+class TestSnapshots:
+    """tests for content-addressed lookup snapshots"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def test_saves_snapshot_under_the_hash_of_its_content(self):
+        s3 = self.create_bucket()
+        records = [{"department_id": 1, "last_updated": dt(2022, 11, 3)}]
+
+        key = write_snapshot(s3, "TestBucket", "department", records)
+
+        assert key.startswith("state/snapshots/department/")
+        response = s3.get_object(Bucket="TestBucket", Key=key)
+        assert json.loads(response["Body"].read()) == {
+            "department": [
+                {"department_id": 1, "last_updated": "2022-11-03T00:00:00.000"}
+            ]
+        }
+
+    def test_unchanged_lookup_is_not_uploaded_again(self):
+        s3 = self.create_bucket()
+        records = [{"department_id": 1}]
+        first = write_snapshot(s3, "TestBucket", "department", records)
+
+        # a cold start checks the bucket instead of the module cache
+        _snapshots.clear()
+        with patch.object(s3, "put_object", wraps=s3.put_object) as put:
+            second = write_snapshot(s3, "TestBucket", "department", records)
+            write_snapshot(s3, "TestBucket", "department", records)
+
+        assert second == first
+        put.assert_not_called()
+
+    def test_changed_lookup_gets_a_new_snapshot(self):
+        s3 = self.create_bucket()
+        first = write_snapshot(
+            s3, "TestBucket", "department", [{"department_id": 1}]
+        )  # noqa E501
+        second = write_snapshot(
+            s3, "TestBucket", "department", [{"department_id": 2}]
+        )  # noqa E501
+
+        assert first != second
+        response = s3.list_objects(
+            Bucket="TestBucket", Prefix="state/snapshots/department/"
+        )  # noqa E501
+        assert len(response["Contents"]) == 2
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_write_file_references_lookups_from_staff_and_counterparty(self):
+        s3 = self.create_bucket()
+        json_data = {
+            "staff": [{"staff_id": 1}],
+            "counterparty": [{"counterparty_id": 1}],
+            "department": [{"department_id": 1}],
+            "all_addresses": [{"address_id": 1}],
+        }
+
+        write_file("TestBucket", json_data)
+
+        response = s3.get_object(
+            Bucket="TestBucket", Key="staff/2020/1/1/staff-173019.json"
+        )
+        staff = json.loads(response["Body"].read())
+        response = s3.get_object(
+            Bucket="TestBucket",
+            Key="counterparty/2020/1/1/counterparty-173019.json",
+        )
+        counterparty = json.loads(response["Body"].read())
+        assert list(staff) == ["staff", "snapshots"]
+        assert list(counterparty["snapshots"]) == ["address"]
+
+        response = s3.get_object(
+            Bucket="TestBucket", Key=counterparty["snapshots"]["address"]
+        )
+        assert json.loads(response["Body"].read()) == {
+            "address": [{"address_id": 1}]
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_empty_lookup_still_gets_a_snapshot(self):
+        s3 = self.create_bucket()
+
+        def mock_run(sql, date="ss"):
+            if "SELECT table_name, column_name" in sql:
+                return [
+                    ["staff", "staff_id"],
+                    ["department", "department_id"],
+                    ["address", "address_id"],
+                ]
+            elif "SELECT * FROM staff" in sql:
+                return [[1]]
+            return []
+
+        conn = Mock()
+        conn.run.side_effect = mock_run
+        json_data = get_data(conn, dt(2020, 1, 1))
+
+        assert json_data["department"] == []
+        assert write_file("TestBucket", json_data)
+        response = s3.get_object(
+            Bucket="TestBucket", Key="staff/2020/1/1/staff-173019.json"
+        )
+        staff = json.loads(response["Body"].read())
+        response = s3.get_object(
+            Bucket="TestBucket", Key=staff["snapshots"]["department"]
+        )
+        assert json.loads(response["Body"].read()) == {"department": []}
@@ -0,0 +1,209 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    stream_data,
+    get_watermarks,
+    _snapshots,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import json
+import pytest
+import os
+import time_machine
+import logging
+
+logger = logging.getLogger("MyLogger")
+logger.setLevel(logging.INFO)
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    _snapshots.clear()
+
+
+def make_mock_conn(table_rows, columns=("c1", "c2")):
+    """
+    Mock connection serving each table's rows
+    through FETCH FORWARD batches of two rows.
+    """
+    cursors = {}
+
+    def mock_run(sql, date="ss"):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                [table, column]
+                for table in {**table_rows, "address": [], "department": []}
+                for column in columns
+            ]
+        elif "DECLARE" in sql:
+            table = sql.split()[1].replace("_cursor", "")
+            cursors[table] = list(table_rows.get(table, []))
+            return []
+        elif "FETCH FORWARD" in sql:
+            table = sql.split()[-1].replace("_cursor", "")
+            batch = cursors[table][:2]
+            cursors[table] = cursors[table][2:]
+            return batch
+        elif "SELECT * FROM department" in sql:
+            return [[1, "Sales"]]
+        elif "SELECT * FROM address" in sql:
+            return [[1, "Street"]]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+@mock_s3
+class TestStreamData:
+    """tests for stream data util function"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_saves_each_batch_as_a_numbered_part_file(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(
+            {"table_a": [[1, 2], [3, 4], [5, 6]], "table_b": []}
+        )  # noqa E501
+
+        saved = stream_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2)
+
+        assert saved == [
+            "table_a/2020/1/1/table_a-173019-part-0001.json",
+            "table_a/2020/1/1/table_a-173019-part-0002.json",
+        ]
+        response = s3.get_object(Bucket="TestBucket", Key=saved[1])
+        assert json.loads(response["Body"].read()) == {
+            "table_a": [{"c1": 5, "c2": 6}]
+        }  # noqa E501
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_references_department_snapshot_in_staff_batches(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn({"staff": [[7, 1]], "department": []})
+
+        saved = stream_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2)
+
+        response = s3.get_object(Bucket="TestBucket", Key=saved[0])
+        content = json.loads(response["Body"].read())
+        assert content["staff"] == [{"c1": 7, "c2": 1}]
+        response = s3.get_object(
+            Bucket="TestBucket", Key=content["snapshots"]["department"]
+        )
+        assert json.loads(response["Body"].read()) == {
+            "department": [{"c1": 1, "c2": "Sales"}]
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_closes_every_cursor_it_declares(self):
+        self.create_bucket()
+        conn = make_mock_conn({"table_a": [[1, 2]], "table_b": [[3, 4]]})
+
+        stream_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2)
+
+        statements = [call.args[0] for call in conn.run.call_args_list]
+        assert "CLOSE table_a_cursor" in statements
+        assert "CLOSE table_b_cursor" in statements
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_writes_index_files_only_when_data_was_saved(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn({"table_a": []})
+
+        assert stream_data(conn, "TestBucket", dt(2020, 1, 1), dt.now()) == []
+        response = s3.list_objects(Bucket="TestBucket")
+        assert all(
+            content["Key"].startswith("state/snapshots/")
+            for content in response["Contents"]
+        )  # noqa E501
+
+        conn = make_mock_conn({"table_a": [[1, 2]]})
+        stream_data(conn, "TestBucket", dt(2020, 1, 1), dt.now())
+        response = s3.get_object(Bucket="TestBucket", Key="last_update.txt")
+        assert response["Body"].read().decode("utf-8") == "2020:01:01:17:30:19"
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_stops_between_batches_after_the_last_tied_row(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn(
+            {
+                "table_a": [
+                    [1, dt(2021, 1, 1)],
+                    [2, dt(2021, 1, 2)],
+                    [3, dt(2021, 1, 2)],
+                    [4, dt(2021, 1, 3)],
+                ],
+                "table_b": [[5, dt(2021, 1, 1)]],
+            },
+            ("c1", "last_updated"),
+        )
+        watermarks = {"table_a": dt(2019, 6, 1)}
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.is_past",
+            side_effect=lambda deadline: any(
+                "FETCH" in call.args[0] for call in conn.run.call_args_list
+            ),
+        ):
+            saved = stream_data(
+                conn,
+                "TestBucket",
+                dt(2020, 1, 1),
+                dt.now(),
+                2,
+                watermarks,
+                1.0,
+            )
+
+        assert saved == [
+            f"table_a/2020/1/1/table_a-173019-part-000{part}.json"
+            for part in [1, 2]
+        ]
+        response = s3.get_object(Bucket="TestBucket", Key=saved[1])
+        tied = json.loads(response["Body"].read())["table_a"]
+        assert [record["c1"] for record in tied] == [3]
+        statements = [call.args[0] for call in conn.run.call_args_list]
+        assert "CLOSE table_a_cursor" in statements
+        (declare,) = [sql for sql in statements if "DECLARE" in sql]
+        assert declare.endswith("ORDER BY last_updated")
+        assert not any("table_b_cursor" in sql for sql in statements)
+        assert get_watermarks("TestBucket") == {
+            "table_a": dt(2021, 1, 2),
+            "table_b": dt(2020, 1, 1),
+            "address": dt(2020, 1, 1),
+        }
+
+    @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
+    def test_rejected_part_fails_the_run_without_indexing(self):
+        s3 = self.create_bucket()
+        conn = make_mock_conn({"table_a": [[1, 2], [3, 4], [5, 6]]})
+
+        with patch(
+            "src.ingestion_lambda.ingestion_lambda.put_table_file",
+            side_effect=[False, True],
+        ), pytest.raises(Exception, match="part-0001.json not saved"):
+            stream_data(conn, "TestBucket", dt(2020, 1, 1), dt.now(), 2, {})
+
+        keys = [
+            content["Key"]
+            for content in s3.list_objects(Bucket="TestBucket")["Contents"]
+        ]
+        assert "last_update.txt" not in keys
+        assert "state/watermarks.json" not in keys
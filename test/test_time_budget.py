@@ -0,0 +1,126 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    get_deadline,
+    is_past,
+    get_data,
+    get_data_concurrently,
+)
+from unittest.mock import Mock, patch
+from datetime import datetime as dt
+from time import monotonic
+
+
+def make_mock_conn(queried):
+    """
+    Mock connection serving one row from every table
+    and recording the tables it was queried for.
+    """
+
+    def mock_run(sql, date="ss"):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                ["table_a", "c1"],
+                ["table_b", "c1"],
+                ["department", "c1"],
+                ["address", "c1"],
+            ]
+        elif "SELECT * FROM" in sql:
+            table = sql.split("FROM ")[1].split()[0]
+            queried.append(table)
+            return [[table]]
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def test_deadline_keeps_a_margin_from_the_remaining_time():
+    context = Mock()
+    context.get_remaining_time_in_millis.return_value = 300000
+
+    deadline = get_deadline(context, margin=60)
+
+    assert 239 < deadline - monotonic() <= 240
+    assert not is_past(deadline)
+    assert is_past(monotonic() - 1)
+
+
+def test_no_deadline_without_a_lambda_context():
+    assert get_deadline("context") is None
+    assert not is_past(None)
+
+
+def test_get_data_only_reads_lookups_once_out_of_time():
+    queried = []
+    watermarks = {"table_b": dt(2023, 6, 1)}
+
+    content = get_data(
+        make_mock_conn(queried),
+        dt(2023, 1, 1),
+        watermarks,
+        deadline=monotonic() - 1,
+    )
+
+    assert content == {}
+    assert queried == ["department", "address"]
+    assert watermarks == {
+        "table_a": dt(2023, 1, 1),
+        "table_b": dt(2023, 6, 1),
+        "address": dt(2023, 1, 1),
+    }
+
+
+def test_get_data_saves_tables_started_before_the_deadline():
+    queried = []
+    watermarks = {}
+    row_counts = {"table_a": 3, "table_b": 5, "address": 2}
+    checks = iter([False, True, True])
+
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.is_past",
+        side_effect=lambda deadline: next(checks),
+    ):
+        content = get_data(
+            make_mock_conn(queried),
+            dt(2023, 1, 1),
+            watermarks,
+            deadline=1.0,
+            row_counts=row_counts,
+        )
+
+    assert list(content) == ["table_a", "department", "all_addresses"]
+    assert watermarks == {
+        "table_b": dt(2023, 1, 1),
+        "address": dt(2023, 1, 1),
+    }
+    # counts of held tables are not saved as seen
+    assert row_counts == {"table_a": 3}
+
+
+def test_get_data_concurrently_holds_tables_not_started():
+    queried = []
+    watermarks = {}
+    row_counts = {"table_a": 3, "table_b": 5}
+
+    with patch(
+        "src.ingestion_lambda.ingestion_lambda.get_connection",
+        side_effect=lambda credentials: make_mock_conn(queried),
+    ):
+        content = get_data_concurrently(
+            make_mock_conn(queried),
+            {},
+            dt(2023, 1, 1),
+            2,
+            watermarks,
+            deadline=monotonic() - 1,
+            row_counts=row_counts,
+        )
+
+    assert content == {}
+    assert sorted(queried) == ["address", "department"]
+    assert watermarks == {
+        "table_a": dt(2023, 1, 1),
+        "table_b": dt(2023, 1, 1),
+        "address": dt(2023, 1, 1),
+    }
+    assert row_counts == {}
@@ -0,0 +1,48 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    to_json,
+    rows_to_records,
+    serialize_value,
+)
+from datetime import datetime as dt
+from datetime import date
+from decimal import Decimal
+import pytest
+
+
+def test_serialises_rows_in_the_ingestion_file_format():
+    records = rows_to_records(
+        [
+            [1, dt(2022, 11, 3, 14, 20, 52, 186000), Decimal("2.43"), None],
+            [2, dt(2022, 11, 3, 14, 20, 52), Decimal("10.00"), "a\"bé"],
+        ],
+        ["sales_order_id", "created_at", "unit_price", "note"],
+    )
+
+    assert to_json({"sales_order": records}) == (
+        '{"sales_order": ['
+        '{"sales_order_id": 1, "created_at": "2022-11-03T14:20:52.186", '
+        '"unit_price": 2.43, "note": null}, '
+        '{"sales_order_id": 2, "created_at": "2022-11-03T14:20:52.000", '
+        '"unit_price": 10.0, "note": "a\\"b\\u00e9"}]}'
+    )
+
+
+def test_truncates_timestamps_to_milliseconds():
+    assert (
+        serialize_value(dt(2023, 1, 1, 0, 0, 0, 999999))
+        == "2023-01-01T00:00:00.999"
+    )  # noqa E501
+
+
+def test_serialises_dates_as_midnight_timestamps():
+    assert serialize_value(date(2023, 1, 2)) == "2023-01-02T00:00:00.000"
+
+
+def test_raises_type_error_for_unsupported_values():
+    with pytest.raises(TypeError):
+        serialize_value(object())
+
+
+def test_rows_to_records_raises_when_row_and_columns_differ():
+    with pytest.raises(ValueError):
+        rows_to_records([[1, 2, 3]], ["c1", "c2"])
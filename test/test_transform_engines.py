@@ -0,0 +1,158 @@
+from src.transformation_lambda.transformation_lambda import (
+    format_dim_counterparty,
+    format_dim_currency,
+    format_dim_date,
+    format_dim_design,
+    format_dim_location,
+    format_dim_staff,
+    format_fact_sales_order,
+    get_columnar_formatter,
+    run_formatter,
+)
+from src.transformation_lambda import transformation_lambda
+from unittest.mock import patch
+from datetime import datetime as dt
+from datetime import timedelta
+from decimal import Decimal
+import os
+import pytest
+
+
+def make_tables(count):
+    """
+    Decoded ingestion data with repeated rows, repeated lookup ids
+    and references to missing lookups.
+    """
+    start = dt(2022, 11, 3, 14, 20, 52, 186000)
+    address = [
+        {
+            "address_id": i % 40,
+            "address_line_1": f"{i} Street",
+            "address_line_2": None,
+            "district": None if i % 3 else "District",
+            "city": "City",
+            "postal_code": "12345",
+            "country": "Country",
+            "phone": "0123",
+        }
+        for i in range(50)
+    ]
+    return {
+        "address": address + address[:5],
+        "staff": [
+            {
+                "staff_id": i,
+                "first_name": "First",
+                "last_name": "Last",
+                "department_id": i % 9,
+                "email_address": "first.last@terrifictotes.com",
+            }
+            for i in range(count)
+        ],
+        "department": [
+            {
+                "department_id": i % 6,
+                "department_name": f"Department {i}",
+                "location": "Leeds",
+            }
+            for i in range(8)
+        ],
+        "design": [
+            {
+                "design_id": i,
+                "design_name": "Wooden",
+                "file_location": "/usr",
+                "file_name": f"wooden-{i}.json",
+            }
+            for i in range(count)
+        ],
+        "currency": [
+            {"currency_id": i, "currency_code": code}
+            for i, code in enumerate(["GBP", "USD", "EUR"])
+        ],
+        "counterparty": [
+            {
+                "counterparty_id": i,
+                "counterparty_legal_name": f"Counterparty {i}",
+                "legal_address_id": i % 45,
+            }
+            for i in range(count)
+        ],
+        "sales_order": [
+            {
+                "sales_order_id": i,
+                "created_at": start + timedelta(hours=7 * i),
+                "last_updated": start + timedelta(hours=9 * i),
+                "design_id": i % 50,
+                "staff_id": i % 20,
+                "counterparty_id": i % 20,
+                "units_sold": i * 7 % 100000,
+                "unit_price": Decimal(f"{i % 400 / 100:.2f}"),
+                "currency_id": i % 3 + 1,
+                "agreed_delivery_date": (start + timedelta(days=i)).date(),
+                "agreed_payment_date": "2022-11-03",
+                "agreed_delivery_location_id": None if i % 7 else i,
+            }
+            # the first ten sales orders are repeated
+            for i in [*range(count), *range(10)]
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "formatter",
+    [
+        format_dim_location,
+        format_dim_staff,
+        format_dim_design,
+        format_dim_currency,
+        format_dim_counterparty,
+        format_dim_date,
+        format_fact_sales_order,
+    ],
+)
+def test_engines_produce_identical_rows(formatter):
+    tables = make_tables(200)
+
+    expected = formatter(tables)
+    actual = get_columnar_formatter(formatter)(tables)
+
+    assert actual == expected
+    assert [list(map(type, row)) for row in actual] == [
+        list(map(type, row)) for row in expected
+    ]
+
+
+def test_engines_agree_on_empty_tables():
+    tables = {name: [] for name in make_tables(20)}
+
+    for formatter in [
+        format_dim_location,
+        format_dim_staff,
+        format_dim_counterparty,
+        format_dim_date,
+        format_fact_sales_order,
+    ]:
+        assert get_columnar_formatter(formatter)(tables) == []
+        assert formatter(tables) == []
+
+
+@patch.dict(os.environ, {"TRANSFORM_ENGINE": "columnar"})
+def test_run_formatter_uses_the_configured_engine():
+    tables = make_tables(20)
+
+    assert run_formatter(format_dim_design, tables) == format_dim_design(
+        tables
+    )  # noqa E501
+
+    documents = transformation_lambda.emit_metrics("transformation")
+    assert any(
+        document.get("Formatter") == "format_dim_design"
+        for document in documents
+    )
+
+
+@patch.dict(os.environ, {"TRANSFORM_ENGINE": "spark"})
+def test_run_formatter_rejects_an_unknown_engine():
+    with pytest.raises(ValueError, match="Unsupported transform engine"):
+        run_formatter(format_dim_design, make_tables(20))
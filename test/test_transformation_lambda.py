@@ -243,3 +243,17 @@ class TestTransformationLambda:
                 "File some_random_file.txt is not a valid json file"
                 in caplog.text  # noqa E501
             )
+
+    @patch("src.transformation_lambda.transformation_lambda.read_s3_json")
+    @patch(
+        "src.transformation_lambda.transformation_lambda.get_table_name",
+        return_value="state",
+    )
+    def test_ignores_ingestion_state_files(
+        self, get_table_name, read_s3_json, caplog
+    ):  # noqa E501
+        with caplog.at_level(logging.INFO):
+            lambda_handler("event", "context")
+
+            read_s3_json.assert_not_called()
+            assert "Ingestion state file received" in caplog.text
@@ -0,0 +1,23 @@
+from src.transformation_lambda.transformation_lambda import unique_rows
+from datetime import date, time
+from decimal import Decimal
+
+
+def test_keeps_first_occurrences_in_order():
+    rows = [[2, "b"], [1, "a"], [2, "b"], [3, "c"], [1, "a"]]
+
+    assert unique_rows(rows) == [[2, "b"], [1, "a"], [3, "c"]]
+
+
+def test_matches_rows_the_way_list_equality_does():
+    rows = [
+        [1, Decimal("2.50"), date(2022, 11, 3), time(14, 20)],
+        [1.0, Decimal("2.5"), date(2022, 11, 3), time(14, 20)],
+        [1, Decimal("2.50"), date(2022, 11, 4), time(14, 20)],
+    ]
+
+    assert unique_rows(rows) == [rows[0], rows[2]]
+
+
+def test_accepts_a_generator():
+    assert unique_rows([i % 2] for i in range(5)) == [[0], [1]]
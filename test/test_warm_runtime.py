@@ -0,0 +1,98 @@
+from src.shared import connections
+from unittest.mock import Mock, patch
+from pg8000 import InterfaceError
+from moto import mock_secretsmanager
+import boto3
+import json
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+CREDENTIALS = {"host": "h", "port": 1, "user": "u", "password": "p", "database": "d"}  # noqa E501
+
+
+def test_clients_are_created_once():
+    with patch.object(connections.boto3, "client") as client:
+        first = connections.get_client("s3")
+        second = connections.get_client("s3")
+
+    assert first is second
+    client.assert_called_once_with("s3", region_name=None)
+
+
+@mock_secretsmanager
+def test_credentials_are_cached_until_the_ttl_expires():
+    client = boto3.client("secretsmanager", region_name="eu-west-2")
+    client.create_secret(Name="Mock", SecretString=json.dumps(CREDENTIALS))
+
+    assert connections.get_credentials("Mock") == CREDENTIALS
+    client.put_secret_value(
+        SecretId="Mock",
+        SecretString=json.dumps({**CREDENTIALS, "password": "rotated"}),
+    )
+    assert connections.get_credentials("Mock") == CREDENTIALS
+
+    # a clock far past the cached expiry
+    with patch.object(connections, "monotonic", return_value=10**12):
+        assert connections.get_credentials("Mock")["password"] == "rotated"
+
+
+def test_healthy_connection_is_reused():
+    conn = Mock()
+    with patch.object(
+        connections, "get_connection", return_value=conn
+    ) as get_connection:  # noqa E501
+        first = connections.get_reusable_connection(CREDENTIALS)
+        first.close()
+        second = connections.get_reusable_connection(CREDENTIALS)
+
+    get_connection.assert_called_once()
+    assert second.conn is conn
+    conn.close.assert_not_called()
+    conn.run.assert_called_once_with("SELECT 1")
+
+
+def test_broken_connection_is_replaced():
+    broken, fresh = Mock(), Mock()
+    broken.run.side_effect = InterfaceError("network error")
+    with patch.object(
+        connections, "get_connection", side_effect=[broken, fresh]
+    ):  # noqa E501
+        connections.get_reusable_connection(CREDENTIALS)
+        conn = connections.get_reusable_connection(CREDENTIALS)
+
+    assert conn.conn is fresh
+    broken.close.assert_called_once()
+
+
+def test_connection_is_replaced_when_credentials_change():
+    old, new = Mock(), Mock()
+    with patch.object(
+        connections, "get_connection", side_effect=[old, new]
+    ):  # noqa E501
+        connections.get_reusable_connection(CREDENTIALS)
+        conn = connections.get_reusable_connection(
+            {**CREDENTIALS, "password": "rotated"}
+        )  # noqa E501
+
+    assert conn.conn is new
+    old.run.assert_not_called()
+
+
+def test_reusable_connection_close_rolls_back_only():
+    conn = Mock()
+    reusable = connections.ReusableConnection(conn)
+    reusable.run("SELECT 2")
+    reusable.close()
+
+    conn.run.assert_called_once_with("SELECT 2")
+    conn.rollback.assert_called_once()
+    conn.close.assert_not_called()
@@ -0,0 +1,239 @@
+from src.ingestion_lambda.ingestion_lambda import (
+    get_watermarks,
+    get_row_counts,
+    get_watermark_state,
+    get_changed_tables,
+    update_watermark,
+    write_file,
+    get_data,
+)
+from unittest.mock import Mock, patch
+from moto import mock_s3
+from datetime import datetime as dt
+import boto3
+import json
+import pytest
+import os
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@mock_s3
+class TestWatermarks:
+    """tests for per-table watermark utils"""
+
+    def create_bucket(self):
+        s3 = boto3.client("s3")
+        s3.create_bucket(
+            Bucket="TestBucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        return s3
+
+    def test_returns_empty_dict_if_no_watermarks_exist(self):
+        self.create_bucket()
+        assert get_watermarks("TestBucket") == {}
+
+    def test_returns_saved_watermarks_with_microseconds(self):
+        s3 = self.create_bucket()
+        s3.put_object(
+            Body=json.dumps(
+                {"staff": {"last_updated": "2023-11-02T10:11:12.123456"}}
+            ),  # noqa E501
+            Bucket="TestBucket",
+            Key="state/watermarks.json",
+        )
+        assert get_watermarks("TestBucket") == {
+            "staff": dt(2023, 11, 2, 10, 11, 12, 123456)
+        }
+
+    def test_write_file_advances_watermarks_of_saved_tables(self):
+        self.create_bucket()
+        json_data = {
+            "design": [
+                {"design_id": 1, "last_updated": dt(2023, 1, 2)},
+                {"design_id": 2, "last_updated": dt(2023, 1, 3)},
+            ]
+        }
+        watermarks = {"design": dt(2023, 1, 1), "staff": dt(2022, 5, 5)}
+
+        write_file("TestBucket", json_data, dt.now(), watermarks)
+
+        assert get_watermarks("TestBucket") == {
+            "design": dt(2023, 1, 3),
+            "staff": dt(2022, 5, 5),
+        }
+
+    def test_write_file_saves_row_counts_with_the_watermarks(self):
+        self.create_bucket()
+        json_data = {
+            "design": [{"design_id": 1, "last_updated": dt(2023, 1, 2)}]
+        }  # noqa E501
+
+        write_file(
+            "TestBucket",
+            json_data,
+            dt.now(),
+            {},
+            row_counts={"design": 1, "currency": 0},
+        )
+
+        assert get_row_counts("TestBucket") == {"design": 1, "currency": 0}
+        assert get_watermarks("TestBucket") == {"design": dt(2023, 1, 2)}
+
+    def test_reads_watermarks_and_row_counts_in_one_request(self):
+        s3 = self.create_bucket()
+        s3.put_object(
+            Body=json.dumps(
+                {"staff": {"last_updated": "2023-11-02T10:11:12", "rows": 4}}
+            ),  # noqa E501
+            Bucket="TestBucket",
+            Key="state/watermarks.json",
+        )
+
+        with patch.object(
+            s3, "get_object", wraps=s3.get_object
+        ) as get_object, patch(
+            "src.ingestion_lambda.ingestion_lambda.get_client",
+            return_value=s3,
+        ):
+            state = get_watermark_state("TestBucket")
+
+        assert state == ({"staff": dt(2023, 11, 2, 10, 11, 12)}, {"staff": 4})
+        assert get_object.call_count == 1
+
+    def test_write_file_leaves_watermarks_untouched_without_store(self):
+        s3 = self.create_bucket()
+        json_data = {"design": [{"design_id": 1, "last_updated": dt.now()}]}
+
+        write_file("TestBucket", json_data, dt.now())
+
+        response = s3.list_objects(Bucket="TestBucket")
+        keys = [content["Key"] for content in response["Contents"]]
+        assert "state/watermarks.json" not in keys
+
+
+def test_update_watermark_never_moves_backwards():
+    watermarks = {"design": dt(2023, 1, 5)}
+    update_watermark(watermarks, "design", [{"last_updated": dt(2023, 1, 2)}])
+    assert watermarks == {"design": dt(2023, 1, 5)}
+
+
+def test_update_watermark_skips_full_lookup_tables():
+    watermarks = {}
+    update_watermark(
+        watermarks, "department", [{"last_updated": dt(2023, 1, 2)}]
+    )  # noqa E501
+    assert watermarks == {}
+
+
+def test_get_data_queries_each_table_from_its_own_watermark():
+    queried = {}
+
+    def mock_run(sql, date="ss"):
+        if "SELECT table_name, column_name" in sql:
+            return [["table_a", "c1"], ["table_b", "c1"], ["address", "c1"]]
+        elif "SELECT * FROM table_" in sql:
+            queried[sql.split("FROM ")[1].split()[0]] = date
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    get_data(conn, dt(2020, 1, 1), {"table_a": dt(2023, 6, 1)})
+
+    assert queried == {"table_a": dt(2023, 6, 1), "table_b": dt(2020, 1, 1)}
+
+
+def make_precheck_conn(stats):
+    """
+    Mock connection answering the UNION ALL precheck with the
+    given (table, max(last_updated), count(*)) rows.
+    """
+
+    def mock_run(sql, date="ss"):
+        if "SELECT table_name, column_name" in sql:
+            return [
+                [table, column]
+                for table in ["table_a", "table_b", "table_c", "address"]
+                for column in ["c1", "last_updated"]
+            ] + [["department", "c1"]]
+        elif "UNION ALL" in sql:
+            return stats
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    return conn
+
+
+def test_precheck_reads_every_table_in_one_query():
+    conn = make_precheck_conn([])
+
+    get_changed_tables(conn, dt(2020, 1, 1), {}, {})
+
+    prechecks = [
+        call.args[0]
+        for call in conn.run.call_args_list
+        if "max(last_updated)" in call.args[0]
+    ]
+    assert len(prechecks) == 1
+    assert prechecks[0].count("UNION ALL") == 3
+    assert "department" not in prechecks[0]
+
+
+def test_precheck_finds_tables_past_their_watermark_or_recounted():
+    conn = make_precheck_conn(
+        [
+            ["table_a", dt(2023, 1, 2), 10],
+            ["table_b", dt(2023, 1, 1), 9],
+            ["table_c", dt(2023, 1, 1), 5],
+            ["address", None, 0],
+        ]
+    )
+    watermarks = {"table_a": dt(2023, 1, 1), "table_b": dt(2023, 1, 1)}
+    row_counts = {"table_a": 10, "table_b": 10, "table_c": 5, "address": 0}
+
+    changed, counts = get_changed_tables(
+        conn, dt(2023, 1, 1), watermarks, row_counts
+    )  # noqa E501
+
+    assert changed == ["table_a", "table_b"]
+    assert counts == {"table_a": 10, "table_b": 9, "table_c": 5, "address": 0}
+
+
+def test_precheck_treats_tables_without_saved_counts_as_changed():
+    conn = make_precheck_conn(
+        [
+            ["table_a", dt(2023, 1, 1), 1],
+            ["table_b", dt(2023, 1, 1), 1],
+            ["table_c", dt(2023, 1, 1), 1],
+            ["address", dt(2023, 1, 1), 1],
+        ]
+    )
+
+    changed, _ = get_changed_tables(conn, dt(2023, 1, 1), {}, {})
+
+    assert changed == ["table_a", "table_b", "table_c", "address"]
+
+
+def test_get_data_extracts_only_changed_tables_and_lookups():
+    queried = []
+
+    def mock_run(sql, date="ss"):
+        if "SELECT table_name, column_name" in sql:
+            return [["table_a", "c1"], ["table_b", "c1"], ["address", "c1"]]
+        elif "SELECT * FROM" in sql:
+            queried.append(sql.split("FROM ")[1].split()[0])
+        return []
+
+    conn = Mock()
+    conn.run.side_effect = mock_run
+    get_data(conn, dt(2020, 1, 1), {}, ["table_b"])
+
+    assert queried == ["table_b", "address"]
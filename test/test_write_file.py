@@ -36,7 +36,8 @@ class TestWriteFile:
         write_file("TestBucket", testJSON, timestamp)
 
         response = s3.list_objects(Bucket="TestBucket")
-        assert len(response["Contents"]) == 3
+        # table file, two index files and the run manifest twice
+        assert len(response["Contents"]) == 5
 
     @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))
     def test_key_is_correct(self):
@@ -53,7 +54,7 @@ class TestWriteFile:
 
         response = s3.list_objects(Bucket="TestBucket")
         assert (
-            response["Contents"][2]["Key"] == "test/2020/1/1/test-173019.json"
+            response["Contents"][4]["Key"] == "test/2020/1/1/test-173019.json"
         )  # noqa E501
 
     @time_machine.travel(dt(2020, 1, 1, 17, 30, 19))